@@ -0,0 +1,107 @@
+"""
+Password hashing.
+
+The hashers below are Django's, with their cost read from settings
+(PASSWORD_PBKDF2_ITERATIONS, PASSWORD_ARGON2_*), so it can be tuned per
+deployment without a code change. Hashes made with another cost, or by a
+hasher that's no longer first in settings.PASSWORD_HASHERS, are upgraded
+when their user next logs in.
+
+Under ASGI, Django runs sync code such as check_password() in a single
+thread, so logins would be hashed one at a time. Async views check
+passwords with acheck_password() instead, which hashes in a pool of
+settings.PASSWORD_HASHING_WORKERS threads: hashlib and argon2-cffi release
+the GIL while hashing, and the bound keeps a burst of logins from taking
+every core.
+
+Bulk imports hash in a process pool instead, with hash_passwords(): the
+pool's processes only load the password settings (see hashing_settings()),
+not Django's apps.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS or hashers.PBKDF2PasswordHasher.iterations
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+# What make_password() reads in a pool process
+HASHING_SETTINGS = [
+    'PASSWORD_HASHERS',
+    'PASSWORD_PBKDF2_ITERATIONS',
+    'PASSWORD_ARGON2_TIME_COST',
+    'PASSWORD_ARGON2_MEMORY_COST',
+    'PASSWORD_ARGON2_PARALLELISM',
+]
+
+
+def hashing_settings():
+    return {name: getattr(settings, name) for name in HASHING_SETTINGS}
+
+
+def configure_hashing(values):
+    """
+    Initializer of a pool process, configuring the settings of the parent.
+    """
+    settings.configure(**values)
+
+
+def hash_passwords(raw_passwords):
+    """
+    make_password() of each of `raw_passwords`, in a pool process.
+    """
+    return [hashers.make_password(raw_password) for raw_password in raw_passwords]
+
+
+@lru_cache(maxsize=None)
+def get_hashing_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing'
+    )
+
+
+def verify_password(raw_password, encoded):
+    """
+    Whether `raw_password` matches `encoded`, and its new hash when
+    `encoded` needs upgrading (None otherwise). An unusable `encoded`
+    costs one hash too, so unknown emails take as long.
+    """
+    is_correct, must_update = hashers.verify_password(raw_password, encoded)
+    return is_correct, hashers.make_password(raw_password) if is_correct and must_update else None
+
+
+async def acheck_password(user, raw_password):
+    """
+    User.check_password() for async views, hashing in the bounded pool.
+    `user` may be None, for an unknown email.
+    """
+    encoded = user.password if user is not None else hashers.UNUSABLE_PASSWORD_PREFIX
+    loop = asyncio.get_running_loop()
+    is_correct, upgraded = await loop.run_in_executor(
+        get_hashing_executor(), verify_password, raw_password, encoded
+    )
+    if upgraded is not None:
+        user.password = upgraded
+        await type(user)._default_manager.filter(pk=user.pk).aupdate(password=upgraded)
+    return is_correct
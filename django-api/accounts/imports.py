@@ -0,0 +1,357 @@
+"""
+Bulk import of users with a profile, from CSV or NDJSON (see
+patient_management.imports).
+
+Rows are read as a stream and handled in chunks of
+settings.IMPORT_BATCH_SIZE. Each row is validated in memory, the emails of
+a chunk are checked against the database in one query, the passwords given
+are hashed in a process pool, and the chunk is inserted with bulk_create()
+in one transaction. A row that fails is reported with its line number and
+skipped; the rest of the run goes on.
+
+Rows without a password get an unusable one and, unless disabled, an
+invite email (accounts.jobs.send_invite_email) to choose theirs through the
+password reset confirmation.
+
+bulk_create() skips Model.save() and sends no signals, so importers must
+not rely on either.
+"""
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from accounts.hashers import configure_hashing, hash_passwords, hashing_settings
+from accounts.jobs import send_invite_email
+from core.jobs import enqueue_many
+
+User = get_user_model()
+
+FORMATS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+USER_COLUMNS = ['email', 'first_name', 'last_name', 'phone_number', 'password']
+
+
+def import_format(filename):
+    """
+    The format of a file to import, from its extension.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Can't tell the format of {filename}, use .csv or .ndjson.")
+    return FORMATS[extension]
+
+
+def import_upload(importer, upload, format=None):
+    """
+    Run `importer` over an uploaded file, in the given format or the one of
+    its name.
+    """
+    format = format or import_format(upload.name)
+    stream = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    try:
+        return importer.run(stream, format)
+    finally:
+        stream.detach()
+
+
+class ImportUserSerializer(serializers.ModelSerializer):
+    """
+    User fields of an imported row. Emails are checked for uniqueness per
+    chunk rather than per row.
+    """
+    password = serializers.CharField(required=False, write_only=True, trim_whitespace=False)
+
+    class Meta:
+        model = User
+        fields = USER_COLUMNS
+        extra_kwargs = {
+            'email': {'validators': []},
+            'first_name': {'required': True},
+            'last_name': {'required': True},
+        }
+
+
+class ImportReport:
+    """
+    Progress of an import: rows read, users created, and the errors of the
+    rows skipped, by line number.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self, max_errors=None):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors[:max_errors],
+        }
+
+
+class UserImporter:
+    """
+    Base of the importers of users with a profile. Subclasses set `role` and
+    `serializer_class` (the nested shape of a row, with the user under
+    'user') and implement create_profiles(); they may override from_csv()
+    for CSV columns that aren't profile fields, and check_row() for checks
+    beyond the serializer's.
+    """
+    role = None
+    serializer_class = None
+
+    def __init__(self, send_invites=True, batch_size=None, hashing_workers=None, progress=None):
+        self.send_invites = send_invites
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.hashing_workers = settings.IMPORT_HASHING_WORKERS if hashing_workers is None else hashing_workers
+        self.progress = progress
+        self.emails = set()
+        self.executor = None
+
+    def run(self, stream, format):
+        """
+        Import the rows of the text `stream`, returning the ImportReport.
+        """
+        if format not in FORMATS.values():
+            raise ValueError(f"Unknown format {format!r}, use csv or ndjson.")
+        report = ImportReport()
+        try:
+            for chunk in batched(self.read(stream, format), self.batch_size):
+                self.import_chunk(chunk, report)
+                if self.progress is not None:
+                    self.progress(report)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+        return report
+
+    def read(self, stream, format):
+        """
+        (line number, row) of each row of the stream, where a row that
+        can't be parsed is an error message.
+        """
+        if format == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                values = {
+                    column.strip(): value.strip() for column, value in row.items()
+                    if column and isinstance(value, str) and value.strip()
+                }
+                yield reader.line_num, self.from_csv(values)
+            return
+
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as exc:
+                yield line, f"Invalid JSON: {exc}"
+                continue
+            yield line, row if isinstance(row, dict) else "Each line must be a JSON object."
+
+    def from_csv(self, values):
+        """
+        The nested row of the flat values of a CSV line.
+        """
+        user = {column: values.pop(column) for column in USER_COLUMNS if column in values}
+        return {**values, 'user': user}
+
+    def check_row(self, row):
+        """
+        Errors of a validated row beyond its serializer's, or None.
+        """
+        return None
+
+    def import_chunk(self, chunk, report):
+        reported = report.failed
+        entries = []
+        for line, data in chunk:
+            report.rows += 1
+            if isinstance(data, str):
+                report.add_error(line, {'non_field_errors': [data]})
+                continue
+            serializer = self.serializer_class(data=data)
+            if not serializer.is_valid():
+                report.add_error(line, serializer.errors)
+                continue
+            row = serializer.validated_data
+            errors = self.check_row(row)
+            if errors:
+                report.add_error(line, errors)
+                continue
+
+            row['user']['email'] = email = User.objects.normalize_email(row['user']['email'])
+            if email in self.emails:
+                report.add_error(line, {'user': {'email': ["Duplicate email in this import."]}})
+                continue
+            self.emails.add(email)
+            entries.append((line, row))
+
+        clashes = self.find_clashes(entries)
+        for line, errors in clashes.items():
+            report.add_error(line, errors)
+        entries = [(line, row, self.build_user(row)) for line, row in entries if line not in clashes]
+        self.set_passwords(entries)
+
+        try:
+            with transaction.atomic():
+                self.insert(entries)
+        except IntegrityError:
+            # Something changed since the chunk was checked (e.g. an email
+            # taken meanwhile): find the rows at fault one by one
+            for entry in entries:
+                try:
+                    with transaction.atomic():
+                        self.insert([entry])
+                except IntegrityError as exc:
+                    report.add_error(entry[0], {'non_field_errors': [str(exc)]})
+                else:
+                    report.created += 1
+        else:
+            report.created += len(entries)
+        # Errors found against the database come after those of the rows
+        report.errors[reported:] = sorted(report.errors[reported:], key=lambda error: error['line'])
+
+    def find_clashes(self, entries):
+        """
+        Errors, by line, of the (line, row) entries of a chunk that clash
+        with rows already in the database, checked in one query per chunk.
+        """
+        existing = set(
+            User.objects.filter(email__in=[row['user']['email'] for _, row in entries])
+            .values_list('email', flat=True)
+        )
+        return {
+            line: {'user': {'email': ["A user with this email already exists."]}}
+            for line, row in entries if row['user']['email'] in existing
+        }
+
+    def build_user(self, row):
+        values = {name: value for name, value in row['user'].items() if name != 'password'}
+        return User(role=self.role, **values)
+
+    def set_passwords(self, entries):
+        """
+        Hash the passwords given in the process pool; the other users get an
+        unusable password.
+        """
+        given = [(user, row['user']['password']) for _, row, user in entries if row['user'].get('password')]
+        for user, encoded in zip([user for user, _ in given], self.hash([password for _, password in given])):
+            user.password = encoded
+        for _, row, user in entries:
+            if not row['user'].get('password'):
+                user.password = make_password(None)
+
+    def hash(self, passwords):
+        if not passwords:
+            return []
+        if not self.hashing_workers:
+            return hash_passwords(passwords)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.hashing_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=configure_hashing,
+                initargs=(hashing_settings(),),
+            )
+        size = math.ceil(len(passwords) / self.hashing_workers)
+        return [encoded for part in self.executor.map(hash_passwords, batched(passwords, size)) for encoded in part]
+
+    def insert(self, entries):
+        users = [user for _, _, user in entries]
+        User.objects.bulk_create(users)
+        self.create_profiles(entries)
+        if self.send_invites:
+            enqueue_many(send_invite_email, [
+                {'user_id': user.pk} for user in users if not user.has_usable_password()
+            ])
+
+    def create_profiles(self, entries):
+        """
+        Insert the profile (and related rows) of each (line, row, user).
+        """
+        raise NotImplementedError
+
+
+class ImportCommand(BaseCommand):
+    """
+    Base of the import commands, running `importer_class` over a file and
+    reporting progress and row errors on stderr.
+    """
+    importer_class = None
+    noun = 'users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults to the file's extension.")
+        parser.add_argument('--no-invites', action='store_true', help="Don't email invites.")
+        parser.add_argument('--batch-size', type=int, help="Rows per chunk (default: IMPORT_BATCH_SIZE).")
+        parser.add_argument(
+            '--hashing-workers', type=int,
+            help="Processes hashing passwords, 0 to hash in this one (default: IMPORT_HASHING_WORKERS)."
+        )
+        parser.add_argument('--errors', help="Write the row errors to this file, as NDJSON.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            format = options['format'] or import_format(path)
+        except ValueError as exc:
+            raise CommandError(f"{exc} Or pass --format.")
+
+        importer = self.importer_class(
+            send_invites=not options['no_invites'],
+            batch_size=options['batch_size'],
+            hashing_workers=options['hashing_workers'],
+            progress=self.progress,
+        )
+        if path == '-':
+            report = importer.run(sys.stdin, format)
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    report = importer.run(stream, format)
+            except OSError as exc:
+                raise CommandError(str(exc))
+
+        if options['errors']:
+            with open(options['errors'], 'w') as errors_file:
+                for error in report.errors:
+                    errors_file.write(json.dumps(error) + '\n')
+        else:
+            for error in report.errors:
+                self.stderr.write(f"Line {error['line']}: {json.dumps(error['errors'])}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.created} of {report.rows} {self.noun} ({report.failed} failed)."
+        ))
+
+    def progress(self, report):
+        self.stderr.write(f"{report.rows} rows read: {report.created} created, {report.failed} failed")
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core.jobs import job
+
+User = get_user_model()
+
+
+def reset_link(user):
+    """
+    Link to the front end's password reset page. The token is made when the
+    email is sent, so it never sits in the job table.
+    """
+    # Generate reset token
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    return f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}"
+
+
+@job(queue='email')
+def send_password_reset_email(user_id):
+    """
+    Email a password reset link to the user.
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+
+    send_mail(
+        'Password Reset Request',
+        f'Please click the following link to reset your password: {reset_link(user)}',
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email],
+        fail_silently=False,
+    )
+
+
+@job(queue='email')
+def send_invite_email(user_id):
+    """
+    Invite an imported user to choose their password, unless they already
+    have one.
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or user.has_usable_password():
+        return
+
+    send_mail(
+        'Your account is ready',
+        f'An account has been created for you. Choose your password here: {reset_link(user)}',
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email],
+        fail_silently=False,
+    )
@@ -8,6 +8,12 @@ from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.test import override_settings
+from unittest import mock, skipUnless
+from importlib.util import find_spec
+from accounts.hashers import verify_password
+from core.jobs import Worker
 
 User = get_user_model()
 
@@ -127,32 +133,44 @@ class UserViewSetTests(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    # def test_reset_password_request(self):
-    #     url = reverse('user-reset-password-request')
-    #     data = {'email': 'testuser@example.com'}
-    #     response = self.client.post(url, data)
-    #     self.assertEqual(response.status_code, status.HTTP_200_OK)
-    #     self.assertEqual(len(mail.outbox), 1)
-    #     self.assertIn('reset your password', mail.outbox[0].body)
-
-    # def test_reset_password_confirm(self):
-    #     # First, request a password reset
-    #     url_request = reverse('user-reset-password-request')
-    #     data_request = {'email': 'testuser@example.com'}
-    #     self.client.post(url_request, data_request)
-
-    #     # Extract uid and token from the email
-    #     email_body = mail.outbox[0].body
-    #     reset_link_start = email_body.find(f"{settings.FRONTEND_URL}/reset-password/")
-    #     reset_link = email_body[reset_link_start:]
-    #     uid, token = reset_link.split('/')[-2:]
-
-    #     # Now, confirm the password reset
-    #     url_confirm = reverse('user-reset-password-confirm')
-    #     data_confirm = {'uid': uid, 'token': token, 'new_password': 'newpassword123'}
-    #     response = self.client.post(url_confirm, data_confirm)
-    #     self.assertEqual(response.status_code, status.HTTP_200_OK)
-    #     self.assertTrue(self.user.check_password('newpassword123'))
+    def test_reset_password_request(self):
+        url = reverse('user-reset-password-request')
+        data = {'email': 'testuser@example.com'}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Sent by a background worker, not while responding
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Worker(['email']).run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('reset your password', mail.outbox[0].body)
+
+        response = self.client.post(url, {'email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Worker(['email']).run_pending(), 0)
+
+    def test_reset_password_confirm(self):
+        # First, request a password reset
+        url_request = reverse('user-reset-password-request')
+        data_request = {'email': 'testuser@example.com'}
+        self.client.post(url_request, data_request)
+        Worker(['email']).run_pending()
+
+        # Extract uid and token from the email
+        email_body = mail.outbox[0].body
+        reset_link_start = email_body.find(f"{settings.FRONTEND_URL}/reset-password/")
+        reset_link = email_body[reset_link_start:]
+        uid, token = reset_link.split('/')[-2:]
+
+        # Now, confirm the password reset
+        url_confirm = reverse('user-reset-password-confirm')
+        data_confirm = {
+            'uid': uid, 'token': token,
+            'new_password': 'Reset-password-123', 'new_password_confirmation': 'Reset-password-123'
+        }
+        response = self.client.post(url_confirm, data_confirm)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Reset-password-123'))
 
     # def test_reset_password_confirm_invalid_token(self):
     #     url_confirm = reverse('user-reset-password-confirm')
@@ -188,3 +206,78 @@ class CustomObtainAuthTokenTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('token', response.data)
         self.assertIn('user', response.data)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['accounts.hashers.PBKDF2PasswordHasher', 'accounts.hashers.Argon2PasswordHasher'],
+    PASSWORD_PBKDF2_ITERATIONS=1000,
+)
+class LoginHashingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='testuser@example.com', password='testpassword')
+
+    def count_hashes(self):
+        return mock.patch('django.utils.crypto.hashlib.pbkdf2_hmac', wraps=__import__('hashlib').pbkdf2_hmac)
+
+    def test_login_hashes_once(self):
+        url = reverse('user-login')
+        attempts = [
+            ({'email': 'testuser@example.com', 'password': 'testpassword'}, status.HTTP_200_OK),
+            ({'email': 'testuser@example.com', 'password': 'wrongpassword'}, status.HTTP_401_UNAUTHORIZED),
+            ({'email': 'nobody@example.com', 'password': 'testpassword'}, status.HTTP_401_UNAUTHORIZED),
+        ]
+        for data, expected in attempts:
+            with self.subTest(data=data), self.count_hashes() as pbkdf2:
+                response = self.client.post(url, data)
+                self.assertEqual(response.status_code, expected)
+                self.assertEqual(pbkdf2.call_count, 1)
+
+    def test_change_password_checks_old_password_once(self):
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        data = {'old_password': 'testpassword', 'new_password': 'newpassword', 'new_password_confirmation': 'newpassword'}
+        with self.count_hashes() as pbkdf2, override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            response = self.client.post(reverse('user-change-password'), data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Checking the old password and hashing the new one, no upgrade in between
+        self.assertEqual(pbkdf2.call_count, 2)
+
+    def test_login_upgrades_outdated_hash(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            response = self.client.post(
+                reverse('user-login'), {'email': 'testuser@example.com', 'password': 'testpassword'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    async def test_async_login(self):
+        url = reverse('async-user-login')
+        with self.count_hashes() as pbkdf2:
+            response = await self.async_client.post(url, {'email': 'nobody@example.com', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(pbkdf2.call_count, 1)
+
+        response = await self.async_client.post(url, {'email': 'testuser@example.com', 'password': 'wrongpassword'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            response = await self.async_client.post(
+                url, {'email': 'testuser@example.com', 'password': 'testpassword'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = await Token.objects.aget(user_id=self.user.pk)
+        self.assertEqual(response.json()['token'], token.key)
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    @skipUnless(find_spec('argon2'), "argon2-cffi is not installed")
+    def test_argon2_cost_changes_upgrade_hashes(self):
+        with override_settings(PASSWORD_HASHERS=['accounts.hashers.Argon2PasswordHasher'], PASSWORD_ARGON2_MEMORY_COST=1024):
+            encoded = make_password('testpassword')
+            self.assertEqual(identify_hasher(encoded).algorithm, 'argon2')
+            self.assertEqual(verify_password('testpassword', encoded), (True, None))
+            with override_settings(PASSWORD_ARGON2_MEMORY_COST=2048):
+                is_correct, upgraded = verify_password('testpassword', encoded)
+        self.assertTrue(is_correct)
+        self.assertIn('m=2048', upgraded)
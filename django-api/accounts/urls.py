@@ -8,4 +8,6 @@ router.register(r'users', views.UserViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/token/', views.CustomObtainAuthToken.as_view(), name='token_obtain'),
+    # Hashes in a bounded thread pool, for ASGI workers
+    path('async/users/login/', views.AsyncLoginView.as_view(), name='async-user-login'),
 ]
\ No newline at end of file
@@ -3,36 +3,41 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from django.contrib.auth import get_user_model
+from rest_framework.views import APIView
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail
-from django.conf import settings
+from django.utils.http import urlsafe_base64_decode
+from django.utils.encoding import force_str
 from accounts.serializers import (
     UserSerializer, UserLoginSerializer, PasswordChangeSerializer,
     PasswordResetRequestSerializer, PasswordResetConfirmSerializer,
     UserProfileUpdateSerializer, EmailAuthTokenSerializer
 )
+from accounts.hashers import acheck_password
+from accounts.jobs import send_password_reset_email
 from accounts.permissions import IsAdminUser
+from core.jobs import enqueue
+from core.views import AsyncAPIViewMixin, SparseFieldsetMixin
 
 
 User = get_user_model()
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing users.
     """
     queryset = User.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2, 'me': 1}
     serializer_class = UserSerializer
 
     def get_permissions(self):
         """
-        - Allow anyone to register
+        - Allow anyone to register, log in and reset their password
         - Only admin can list all users
         - Users can view and update their own profile
         """
-        if self.action == 'create':
+        if self.action in ['create', 'login', 'reset_password_request', 'reset_password_confirm']:
             permission_classes = [permissions.AllowAny]
         elif self.action in ['list']:
             permission_classes = [IsAdminUser]
@@ -62,23 +67,17 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         API endpoint for user login.
         """
-        print(f'Request data in login attempt {request.data}')
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        email = serializer.validated_data['email']
-        password = serializer.validated_data['password']
-
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            return Response(
-                {'detail': 'Invalid email or password.'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-
-        print(f"The password check value is {user.check_password(password)}")
-        if not user.check_password(password):
+        # One hash per attempt, unknown emails included, and an outdated
+        # hash is upgraded (see accounts.hashers)
+        user = authenticate(
+            request=request,
+            email=serializer.validated_data['email'],
+            password=serializer.validated_data['password'],
+        )
+        if user is None:
             return Response(
                 {'detail': 'Invalid email or password.'},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -120,8 +119,8 @@ class UserViewSet(viewsets.ModelViewSet):
         old_password = serializer.validated_data['old_password']
         new_password = serializer.validated_data['new_password']
 
-        # Check old password
-        if not user.check_password(old_password):
+        # Check old password, without upgrading a hash about to be replaced
+        if not check_password(old_password, user.password):
             return Response(
                 {'old_password': 'Wrong password.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -150,28 +149,11 @@ class UserViewSet(viewsets.ModelViewSet):
 
         email = serializer.validated_data['email']
 
-        try:
-            user = User.objects.get(email=email)
-
-            # Generate reset token
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            token = default_token_generator.make_token(user)
-
-            # Create password reset link
-            reset_link = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}"
-
-            # Send email
-            send_mail(
-                'Password Reset Request',
-                f'Please click the following link to reset your password: {reset_link}',
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
-
-        except User.DoesNotExist:
-            # We don't want to reveal whether an email exists
-            pass
+        user = User.objects.filter(email=email).only('pk').first()
+        # We don't want to reveal whether an email exists, nor to make the
+        # response slower when it does: the email is sent by a worker
+        if user is not None:
+            enqueue(send_password_reset_email, user_id=user.pk)
 
         return Response({
             'detail': 'Password reset email has been sent if the email exists in our system.'
@@ -220,7 +202,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         API endpoint for getting the current user's profile.
         """
-        serializer = UserSerializer(request.user)
+        serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
     @action(detail=False, methods=['put', 'patch'], permission_classes=[permissions.IsAuthenticated])
@@ -254,3 +236,34 @@ class CustomObtainAuthToken(ObtainAuthToken):
         })
 
 
+class AsyncLoginView(AsyncAPIViewMixin, APIView):
+    """
+    Async version of UserViewSet.login, for the ASGI application. The
+    password is hashed in the bounded pool of accounts.hashers rather than
+    in the thread Django runs all sync code of the worker in, so logins are
+    hashed in parallel.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    query_budgets = {'post': 4}
+
+    async def post(self, request):
+        serializer = UserLoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user = await User.objects.filter(email=serializer.validated_data['email']).afirst()
+        # Hashed whether the user exists or not, like authenticate()
+        is_correct = await acheck_password(user, serializer.validated_data['password'])
+        if not is_correct or not user.is_active:
+            return Response(
+                {'detail': 'Invalid email or password.'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        token, created = await Token.objects.aget_or_create(user=user)
+        return Response({
+            'token': token.key,
+            'user': UserSerializer(user).data
+        })
+
+
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from appointments.models import AppointmentReminder
+from core.jobs import cancel, enqueue, job
+
+# Appointments whose reminders are no longer worth sending
+CLOSED_STATUSES = ('COMPLETED', 'CANCELLED', 'NO_SHOW', 'RESCHEDULED')
+
+
+def schedule_reminder(reminder):
+    """
+    Queue the sending of `reminder` at its scheduled time. Only email is
+    sent from here: there's no SMS gateway yet.
+    """
+    if reminder.reminder_type in ('EMAIL', 'BOTH'):
+        enqueue(send_appointment_reminder, run_at=reminder.scheduled_time, reminder_id=reminder.pk)
+
+
+def reschedule_reminder(reminder):
+    """
+    Replace the queued sending of `reminder` after its time or type changed:
+    a job queued for the old time would send it late, or not at all.
+    """
+    cancel(send_appointment_reminder, reminder_id=reminder.pk)
+    if not reminder.sent:
+        schedule_reminder(reminder)
+
+
+@job(queue='email')
+def send_appointment_reminder(reminder_id):
+    """
+    Email a reminder to the patient, unless it was already sent, deleted or
+    its appointment closed in the meantime. A reminder moved later is
+    queued again for its new time.
+    """
+    reminder = (
+        AppointmentReminder.objects
+        .select_related('appointment__patient__user')
+        .filter(pk=reminder_id, sent=False)
+        .first()
+    )
+    if reminder is None or reminder.appointment.status in CLOSED_STATUSES:
+        return
+    if reminder.scheduled_time > timezone.now():
+        schedule_reminder(reminder)
+        return
+
+    send_mail(
+        'Appointment Reminder',
+        reminder.message,
+        settings.DEFAULT_FROM_EMAIL,
+        [reminder.appointment.patient.user.email],
+        fail_silently=False,
+    )
+    # update() skips auto_now: touch updated_at so appointment ETags change
+    now = timezone.now()
+    AppointmentReminder.objects.filter(pk=reminder.pk).update(sent=True, sent_time=now, updated_at=now)
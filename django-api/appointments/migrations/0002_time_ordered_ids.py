@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 02:48
+
+import core.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+    ]
+
+    # Only the Python-side default changes, the columns stay the same:
+    # without this SQLite would rebuild every table.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='appointment',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='appointmentreminder',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='appointmenttype',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointmentreminder',
+            index=models.Index(fields=['sent', 'scheduled_time'], name='appointment_sent_c7626f_idx'),
+        ),
+    ]
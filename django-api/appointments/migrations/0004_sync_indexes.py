@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_filter_indexes'),
+        ('doctor_management', '0005_sync_indexes'),
+        ('patient_management', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'updated_at'], name='appointment_doctor__01e3e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'updated_at'], name='appointment_patient_2a0c74_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentreminder',
+            index=models.Index(fields=['appointment', 'updated_at'], name='appointment_appoint_cc4221_idx'),
+        ),
+    ]
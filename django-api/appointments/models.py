@@ -60,6 +60,9 @@ class Appointment(TimeStampedModel):
             models.Index(fields=['doctor', 'start_datetime']),
             models.Index(fields=['patient', 'start_datetime']),
             models.Index(fields=['status']),
+            # Delta sync (core.sync)
+            models.Index(fields=['doctor', 'updated_at']),
+            models.Index(fields=['patient', 'updated_at']),
         ]
 
     def __str__(self):
@@ -173,6 +176,14 @@ class AppointmentReminder(TimeStampedModel):
     sent = models.BooleanField(default=False)
     sent_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            # Finding the reminders that are due
+            models.Index(fields=['sent', 'scheduled_time']),
+            # Delta sync (core.sync)
+            models.Index(fields=['appointment', 'updated_at']),
+        ]
+
     def __str__(self):
         return f"Reminder for {self.appointment} at {self.scheduled_time}"
 
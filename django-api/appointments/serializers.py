@@ -1,11 +1,13 @@
 from rest_framework import serializers
+from core.serializers import DynamicFieldsModelSerializer
 from django.utils import timezone
 from django.db import transaction
+from appointments.jobs import schedule_reminder
 from appointments.models import Appointment, AppointmentType, AppointmentReminder
 from patient_management.models import PatientProfile
 from doctor_management.models import DoctorProfile
 
-class AppointmentTypeSerializer(serializers.ModelSerializer):
+class AppointmentTypeSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for AppointmentType model.
     """
@@ -14,7 +16,7 @@ class AppointmentTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'duration_minutes', 'color_hex']
 
 
-class AppointmentReminderSerializer(serializers.ModelSerializer):
+class AppointmentReminderSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for AppointmentReminder model.
     """
@@ -22,9 +24,12 @@ class AppointmentReminderSerializer(serializers.ModelSerializer):
         model = AppointmentReminder
         fields = ['id', 'reminder_type', 'scheduled_time', 'message', 'sent', 'sent_time', 'appointment']
         read_only_fields = ['id', 'sent', 'sent_time']
+        expandable_fields = {
+            'appointment': 'appointments.serializers.AppointmentSerializer',
+        }
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for Appointment model.
     """
@@ -43,6 +48,14 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'reminders', 'created_at', 'updated_at']
+        field_dependencies = {
+            'patient_name': ['patient__user__first_name', 'patient__user__last_name'],
+            'doctor_name': ['doctor__user__first_name', 'doctor__user__last_name'],
+        }
+        expandable_fields = {
+            'doctor': 'doctor_management.serializers.DoctorProfileSerializer',
+            'appointment_type': AppointmentTypeSerializer,
+        }
 
     def get_patient_name(self, obj):
         return f"{obj.patient.user.first_name} {obj.patient.user.last_name}".strip()
@@ -115,12 +128,13 @@ class AppointmentCreateSerializer(AppointmentSerializer):
 
             # Don't create reminder if it would be in the past
             if reminder_time > timezone.now():
-                AppointmentReminder.objects.create(
+                reminder = AppointmentReminder.objects.create(
                     appointment=appointment,
                     reminder_type=reminder_type,
                     scheduled_time=reminder_time,
                     message=f"Reminder: You have an appointment with {appointment.doctor} on {appointment.start_datetime.strftime('%Y-%m-%d at %H:%M')}"
                 )
+                schedule_reminder(reminder)
 
         return appointment
 
@@ -220,12 +234,13 @@ class AppointmentRescheduleSerializer(serializers.Serializer):
         # Create a new reminder for the new appointment
         reminder_time = new_start_datetime - timezone.timedelta(hours=24)
         if reminder_time > timezone.now():
-            AppointmentReminder.objects.create(
+            reminder = AppointmentReminder.objects.create(
                 appointment=new_appointment,
                 reminder_type='EMAIL',
                 scheduled_time=reminder_time,
                 message=f"Reminder: You have a rescheduled appointment with {new_appointment.doctor} on {new_start_datetime.strftime('%Y-%m-%d at %H:%M')}"
             )
+            schedule_reminder(reminder)
 
         return new_appointment
 
@@ -3,7 +3,13 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from appointments.jobs import schedule_reminder, send_appointment_reminder
 from appointments.models import Appointment, AppointmentType, AppointmentReminder
+from core.jobs import Worker
+from core.models import IdempotencyKey, Job
 from patient_management.models import PatientProfile
 from doctor_management.models import DoctorProfile, DoctorAvailability, DoctorTimeOff
 from django.utils import timezone
@@ -173,6 +179,37 @@ class AppointmentViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Appointment.objects.count(), 2)
 
+    def test_create_appointment_idempotent_retry(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointment-list')
+        new_start = timezone.now() + timedelta(days=2)
+        data = {
+            'patient': self.patient_profile.id,
+            'doctor': self.doctor_profile.id,
+            'appointment_type': self.appointment_type.id,
+            'start_datetime': new_start.isoformat(),
+            'end_datetime': (new_start + timedelta(minutes=30)).isoformat(),
+            'create_reminder': False
+        }
+        headers = {'Idempotency-Key': 'booking-1'}
+        first = self.client.post(url, data, headers=headers)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        # The retry doesn't conflict with the appointment the first attempt made
+        retry = self.client.post(url, data, headers=headers)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Appointment.objects.count(), 2)
+
+        response = self.client.post(url, {**data, 'reason': 'Other'}, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Failed requests release their key
+        response = self.client.post(url, {**data, 'doctor': ''}, headers={'Idempotency-Key': 'booking-2'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.filter(key='booking-2').exists())
+
     def test_create_appointment_admin(self):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_token.key)
         url = reverse('appointment-list')
@@ -216,6 +253,35 @@ class AppointmentViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    def test_my_appointments_modified_by_nested_rows(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointment-my-appointments')
+
+        def get_modified(etag):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response
+
+        etag = self.client.get(url)['ETag']
+        reminder = AppointmentReminder.objects.create(
+            appointment=self.appointment, reminder_type='EMAIL',
+            scheduled_time=timezone.now() - timedelta(minutes=1), message='Tomorrow'
+        )
+        etag = get_modified(etag)['ETag']
+
+        # Sent by the reminder job, with an update()
+        send_appointment_reminder(reminder.pk)
+        response = get_modified(etag)
+        self.assertTrue(response.data[0]['reminders'][0]['sent'])
+
+        reminder.message = 'See you tomorrow'
+        reminder.save()
+        etag = get_modified(response['ETag'])['ETag']
+
+        self.doctor_user.first_name = 'Renamed'
+        self.doctor_user.save()
+        self.assertEqual(get_modified(etag).data[0]['doctor_name'], 'Dr. Renamed')
+
     def test_doctor_schedule(self):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.doctor_token.key)
         url = reverse('appointment-doctor-schedule')
@@ -223,6 +289,29 @@ class AppointmentViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    async def test_async_lists_match_sync(self):
+        for token, name in [
+            (self.patient_token, 'appointment-my-appointments'),
+            (self.doctor_token, 'appointment-doctor-schedule'),
+        ]:
+            headers = {'authorization': f"Token {token.key}"}
+            expected = await self.async_client.get(reverse(name), headers=headers)
+            response = await self.async_client.get(reverse(f"async-{name}"), headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json(), expected.json())
+
+            response = await self.async_client.get(
+                reverse(f"async-{name}"), headers={**headers, 'if-none-match': response['ETag']}
+            )
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.async_client.get(
+            reverse('async-appointment-my-appointments'), headers={'authorization': f"Token {self.doctor_token.key}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.async_client.get(reverse('async-appointment-doctor-schedule'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     def test_create_appointment_with_reminder(self):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
         url = reverse('appointment-list')
@@ -245,6 +334,68 @@ class AppointmentViewSetTests(APITestCase):
         self.assertEqual(Appointment.objects.count(), 2)
         self.assertEqual(AppointmentReminder.objects.count(), 1)
 
+        # Emailed by a background job once it's due
+        reminder = AppointmentReminder.objects.get()
+        worker = Worker(['email'])
+        self.assertEqual(worker.run_pending(), 0)
+        Job.objects.update(run_at=timezone.now())
+        AppointmentReminder.objects.update(scheduled_time=timezone.now())
+        self.assertEqual(worker.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.patient_user.email])
+        reminder.refresh_from_db()
+        self.assertTrue(reminder.sent)
+
+    def test_list_appointments_sparse_fields(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointment-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,start_datetime,doctor_name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'start_datetime', 'doctor_name'})
+
+        # Doctor name joined in, reminders not prefetched, unused columns deferred
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('accounts_user', sql)
+        self.assertNotIn('appointments_appointmentreminder', sql)
+        self.assertNotIn('"notes"', sql)
+
+    def test_list_appointments_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.doctor_token.key)
+        url = reverse('appointment-list')
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(url)
+
+        for days in range(2, 6):
+            Appointment.objects.create(
+                patient=self.patient_profile,
+                doctor=self.doctor_profile,
+                appointment_type=self.appointment_type,
+                start_datetime=timezone.now() + timedelta(days=days),
+                end_datetime=timezone.now() + timedelta(days=days, minutes=30)
+            )
+        with self.assertNumQueries(len(single.captured_queries)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 5)
+
+    def test_my_appointments_expand_doctor(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointment-my-appointments')
+        response = self.client.get(url, {'fields': 'id,doctor', 'expand': 'doctor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        doctor = response.data[0]['doctor']
+        self.assertEqual(doctor['id'], str(self.doctor_profile.id))
+        self.assertEqual(doctor['license_number'], '12345')
+        self.assertEqual(len(doctor['availabilities']), 7)
+
+    def test_expand_ignored_on_writes(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_token.key)
+        url = reverse('appointment-detail', args=[self.appointment.id])
+        response = self.client.patch(url + '?fields=id&expand=doctor', {'reason': 'Follow-up'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['doctor'], self.doctor_profile.id)
+        self.assertEqual(response.data['reason'], 'Follow-up')
+
 
 class AppointmentReminderViewSetTests(APITestCase):
     def setUp(self):
@@ -361,6 +512,43 @@ class AppointmentReminderViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(AppointmentReminder.objects.get(id=self.reminder.id).message, 'Updated test reminder')
 
+    def test_created_email_reminder_is_queued(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointmentreminder-list')
+        scheduled_time = timezone.now() + timedelta(hours=22)
+        data = {
+            'appointment': self.appointment.id,
+            'reminder_type': 'EMAIL',
+            'scheduled_time': scheduled_time.isoformat(),
+            'message': 'New test reminder'
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = Job.objects.get(queue='email')
+        self.assertEqual(job.kwargs, {'reminder_id': str(response.data['id'])})
+        self.assertEqual(job.run_at, scheduled_time)
+
+    def test_reminder_moved_earlier_is_requeued(self):
+        schedule_reminder(self.reminder)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.patient_token.key)
+        url = reverse('appointmentreminder-detail', args=[self.reminder.id])
+        scheduled_time = timezone.now() - timedelta(minutes=1)
+        response = self.client.patch(url, {'scheduled_time': scheduled_time.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(Job.objects.values_list('run_at', flat=True)), [scheduled_time])
+
+        # Due now rather than at the old time
+        self.assertEqual(Worker(['email']).run_pending(), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+        self.assertTrue(AppointmentReminder.objects.get(id=self.reminder.id).sent)
+
+        # Edits that don't move the reminder leave the queue alone
+        self.reminder.sent = False
+        self.reminder.save()
+        response = self.client.patch(url, {'message': 'Updated test reminder'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Job.objects.filter(status='QUEUED').count(), 0)
+
     def test_update_reminder_doctor(self):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.doctor_token.key)
         url = reverse('appointmentreminder-detail', args=[self.reminder.id])
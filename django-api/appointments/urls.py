@@ -9,4 +9,13 @@ router.register(r'appointment-reminders', views.AppointmentReminderViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Async versions of the hottest reads, for ASGI workers
+    path(
+        'async/appointments/my_appointments/', views.AsyncMyAppointmentsView.as_view(),
+        name='async-appointment-my-appointments'
+    ),
+    path(
+        'async/appointments/doctor_schedule/', views.AsyncDoctorScheduleView.as_view(),
+        name='async-appointment-doctor-schedule'
+    ),
 ]
\ No newline at end of file
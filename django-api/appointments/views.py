@@ -1,9 +1,10 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import generics, viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db.models import Q
+from appointments.jobs import reschedule_reminder, schedule_reminder
 from appointments.models import Appointment, AppointmentType, AppointmentReminder
 from appointments.serializers import (
     AppointmentSerializer, AppointmentTypeSerializer,
@@ -11,13 +12,77 @@ from appointments.serializers import (
     AppointmentUpdateSerializer, AppointmentRescheduleSerializer
 )
 from accounts.permissions import IsAdminUser, IsDoctor, IsPatient
-
-
-class AppointmentTypeViewSet(viewsets.ModelViewSet):
+from core.idempotency import idempotent
+from core.views import AsyncAPIViewMixin, ConditionalGetMixin, SparseFieldsetMixin, VersionedCacheMixin
+from doctor_management.models import DoctorProfile
+from patient_management.models import PatientProfile
+
+# Conditional GET validators of the appointment lists: the nested reminders,
+# the doctor's and patient's names and the type name are part of each
+# appointment
+APPOINTMENT_VALIDATORS = {
+    'fields': (
+        'updated_at', 'reminders__updated_at', 'doctor__user__updated_at',
+        'patient__user__updated_at', 'appointment_type__updated_at',
+    ),
+    'counts': ('reminders',),
+}
+
+
+def filter_patient_appointments(queryset, query_params):
+    """
+    The `filter=upcoming|past|all` filter of a patient's appointments.
+    """
+    filter_type = query_params.get('filter', 'all')
+
+    if filter_type == 'upcoming':
+        queryset = queryset.filter(
+            start_datetime__gte=timezone.now(),
+            status__in=['SCHEDULED', 'CONFIRMED']
+        )
+    elif filter_type == 'past':
+        queryset = queryset.filter(
+            Q(start_datetime__lt=timezone.now()) |
+            Q(status__in=['COMPLETED', 'CANCELLED', 'NO_SHOW', 'RESCHEDULED'])
+        )
+    return queryset
+
+
+def filter_doctor_schedule(queryset, query_params):
+    """
+    The date range and status filters of a doctor's schedule, active
+    appointments from today on by default.
+    """
+    # Date range
+    start_date = query_params.get('start_date')
+    if start_date:
+        queryset = queryset.filter(start_datetime__date__gte=start_date)
+    else:
+        # Default to today
+        queryset = queryset.filter(start_datetime__date__gte=timezone.now().date())
+
+    end_date = query_params.get('end_date')
+    if end_date:
+        queryset = queryset.filter(start_datetime__date__lte=end_date)
+
+    # Status filter
+    status_param = query_params.get('status')
+    if status_param:
+        queryset = queryset.filter(status=status_param)
+    else:
+        # Default to active appointments
+        queryset = queryset.filter(
+            status__in=['SCHEDULED', 'CONFIRMED', 'CHECKED_IN', 'IN_PROGRESS']
+        )
+    return queryset
+
+
+class AppointmentTypeViewSet(VersionedCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing appointment types.
     """
     queryset = AppointmentType.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2}
     serializer_class = AppointmentTypeSerializer
 
     def get_permissions(self):
@@ -32,11 +97,12 @@ class AppointmentTypeViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing appointments.
     """
     queryset = Appointment.objects.all()
+    query_budgets = {'list': 4, 'retrieve': 4, 'my_appointments': 5, 'doctor_schedule': 5}
 
     def get_serializer_class(self):
         """
@@ -119,6 +185,10 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         return queryset.order_by('start_datetime')
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """
         Create an appointment and check user permissions.
@@ -171,6 +241,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         serializer.save()
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def reschedule(self, request, pk=None):
         """
         API endpoint for rescheduling an appointment.
@@ -225,25 +296,16 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Apply filters
-        queryset = Appointment.objects.filter(patient=user.patientprofile)
+        queryset = filter_patient_appointments(
+            Appointment.objects.filter(patient=user.patientprofile), request.query_params
+        )
 
-        # Upcoming/past filter
-        filter_type = request.query_params.get('filter', 'all')
+        not_modified = self.check_not_modified(queryset, **APPOINTMENT_VALIDATORS)
+        if not_modified is not None:
+            return not_modified
 
-        if filter_type == 'upcoming':
-            queryset = queryset.filter(
-                start_datetime__gte=timezone.now(),
-                status__in=['SCHEDULED', 'CONFIRMED']
-            )
-        elif filter_type == 'past':
-            queryset = queryset.filter(
-                Q(start_datetime__lt=timezone.now()) |
-                Q(status__in=['COMPLETED', 'CANCELLED', 'NO_SHOW', 'RESCHEDULED'])
-            )
-
-        queryset = queryset.order_by('start_datetime')
-        serializer = AppointmentSerializer(queryset, many=True)
+        queryset = self.optimize_queryset(queryset.order_by('start_datetime'))
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'], permission_classes=[IsDoctor])
@@ -259,41 +321,25 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Apply filters
-        queryset = Appointment.objects.filter(doctor=user.doctorprofile)
-
-        # Date range
-        start_date = request.query_params.get('start_date')
-        if start_date:
-            queryset = queryset.filter(start_datetime__date__gte=start_date)
-        else:
-            # Default to today
-            queryset = queryset.filter(start_datetime__date__gte=timezone.now().date())
-
-        end_date = request.query_params.get('end_date')
-        if end_date:
-            queryset = queryset.filter(start_datetime__date__lte=end_date)
+        queryset = filter_doctor_schedule(
+            Appointment.objects.filter(doctor=user.doctorprofile), request.query_params
+        )
 
-        # Status filter
-        status_param = request.query_params.get('status')
-        if status_param:
-            queryset = queryset.filter(status=status_param)
-        else:
-            # Default to active appointments
-            queryset = queryset.filter(
-                status__in=['SCHEDULED', 'CONFIRMED', 'CHECKED_IN', 'IN_PROGRESS']
-            )
+        not_modified = self.check_not_modified(queryset, **APPOINTMENT_VALIDATORS)
+        if not_modified is not None:
+            return not_modified
 
-        queryset = queryset.order_by('start_datetime')
-        serializer = AppointmentSerializer(queryset, many=True)
+        queryset = self.optimize_queryset(queryset.order_by('start_datetime'))
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
 
-class AppointmentReminderViewSet(viewsets.ModelViewSet):
+class AppointmentReminderViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing appointment reminders.
     """
     queryset = AppointmentReminder.objects.all()
+    query_budgets = {'list': 4, 'retrieve': 4}
     serializer_class = AppointmentReminderSerializer
 
     def get_permissions(self):
@@ -344,7 +390,8 @@ class AppointmentReminderViewSet(viewsets.ModelViewSet):
                 message="You do not have permission to add reminders for this appointment."
             )
 
-        serializer.save()
+        reminder = serializer.save()
+        schedule_reminder(reminder)
 
     def perform_update(self, serializer):
         """
@@ -370,7 +417,9 @@ class AppointmentReminderViewSet(viewsets.ModelViewSet):
                 message="Cannot update a reminder that has already been sent."
             )
 
-        serializer.save()
+        updated = serializer.save()
+        if (updated.scheduled_time, updated.reminder_type) != (reminder.scheduled_time, reminder.reminder_type):
+            reschedule_reminder(updated)
 
     def perform_destroy(self, instance):
         """
@@ -395,4 +444,56 @@ class AppointmentReminderViewSet(viewsets.ModelViewSet):
                 message="Cannot delete a reminder that has already been sent."
             )
 
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+class AsyncAppointmentListView(AsyncAPIViewMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.GenericAPIView):
+    """
+    Base of the async versions of AppointmentViewSet's per-user lists, for
+    the ASGI application. Subclasses set `action` and implement
+    aget_queryset(), returning None when the user may not see the list.
+    """
+    serializer_class = AppointmentSerializer
+    query_budgets = {'get': 5}
+    forbidden_message = None
+
+    async def get(self, request):
+        queryset = await self.aget_queryset()
+        if queryset is None:
+            return Response({'detail': self.forbidden_message}, status=status.HTTP_403_FORBIDDEN)
+
+        not_modified = await self.acheck_not_modified(queryset, **APPOINTMENT_VALIDATORS)
+        if not_modified is not None:
+            return not_modified
+
+        return Response(await self.alist(self.optimize_queryset(queryset.order_by('start_datetime'))))
+
+
+class AsyncMyAppointmentsView(AsyncAppointmentListView):
+    """
+    Async version of AppointmentViewSet.my_appointments.
+    """
+    action = 'my_appointments'
+    permission_classes = [permissions.IsAuthenticated]
+    forbidden_message = 'You must be a patient to access this endpoint.'
+
+    async def aget_queryset(self):
+        user = self.request.user
+        patient = await PatientProfile.objects.filter(user=user).afirst() if user.role == 'PATIENT' else None
+        if patient is None:
+            return None
+        return filter_patient_appointments(Appointment.objects.filter(patient=patient), self.request.query_params)
+
+
+class AsyncDoctorScheduleView(AsyncAppointmentListView):
+    """
+    Async version of AppointmentViewSet.doctor_schedule.
+    """
+    action = 'doctor_schedule'
+    permission_classes = [IsDoctor]
+    forbidden_message = 'You must be a doctor to access this endpoint.'
+
+    async def aget_queryset(self):
+        doctor = await DoctorProfile.objects.filter(user=self.request.user).afirst()
+        if doctor is None:
+            return None
+        return filter_doctor_schedule(Appointment.objects.filter(doctor=doctor), self.request.query_params)
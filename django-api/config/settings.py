@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+from importlib.util import find_spec
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +60,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so latency includes the other middleware
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.SlowQueryLogMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -65,6 +76,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
 
 ROOT_URLCONF = 'config.urls'
 
@@ -89,11 +102,76 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE picks the profile: 'sqlite' (default) or 'postgresql'.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'healthcare'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # Persistent connections, checked before a new request reuses them.
+            # ASGI workers run each request's queries in a thread of its own
+            # and can't reuse them: set DB_CONN_MAX_AGE=0 there
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # QuerySet.iterator() streams through server-side cursors, which
+            # don't work behind a transaction-pooling pgbouncer: set to 1 there
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS') == '1',
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so concurrent
+                # writers wait for it instead of failing on "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}, use 'sqlite' or 'postgresql'.")
+
+# Read replicas, comma separated in DB_REPLICAS: file names for SQLite, hosts
+# for PostgreSQL. Safe requests read from them (see core.routers), except
+# for a client's requests in the REPLICA_STICKY_SECONDS after it changed
+# something. To try it locally, copy db.sqlite3 to replica.sqlite3 and run
+# with DB_REPLICAS=replica.sqlite3.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    location = 'NAME' if DB_ENGINE == 'sqlite' else 'HOST'
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        location: BASE_DIR / replica if DB_ENGINE == 'sqlite' else replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+# Shared by all processes in production, or stickiness only holds for
+# requests served by the same process
+REPLICA_STICKY_CACHE = 'default'
+
+# Set on every new SQLite connection by core.db.configure_sqlite. WAL lets
+# reads run alongside a write, and with it synchronous=NORMAL only syncs at
+# checkpoints. mmap_size is in bytes, a negative cache_size in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'temp_store': 'MEMORY',
 }
 
 
@@ -115,6 +193,32 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New passwords are hashed with PASSWORD_HASHER: 'argon2' when argon2-cffi
+# (the "argon2" extra) is installed, 'pbkdf2' otherwise. The other hashers
+# still check existing hashes, which are upgraded when their user logs in,
+# as are hashes made with another cost than the one configured here. See
+# accounts.hashers.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER') or ('argon2' if find_spec('argon2') else 'pbkdf2')
+_password_hashers = {
+    'argon2': 'accounts.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'accounts.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in _password_hashers:
+    raise ImproperlyConfigured(f"PASSWORD_HASHER must be one of {', '.join(_password_hashers)}.")
+PASSWORD_HASHERS = [
+    _password_hashers[PASSWORD_HASHER],
+    *(path for name, path in _password_hashers.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# None keeps Django's default for the release
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0)) or None
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 100 * 1024))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 8))
+# Threads hashing the passwords of async logins in each ASGI worker
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -133,6 +237,138 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files (medical images)
+# https://docs.djangoproject.com/en/5.2/ref/settings/#storages
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Medical images are kept outside MEDIA_ROOT so they're never served as
+# public media, only through the download endpoint (see SENDFILE_BACKEND)
+MEDICAL_IMAGES_ROOT = BASE_DIR / 'protected_media'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Content-addressed storage: identical image uploads are stored once
+    'medical_images': {
+        'BACKEND': 'medical_records.storage.ContentAddressedStorage',
+        'OPTIONS': {
+            'location': MEDICAL_IMAGES_ROOT,
+        },
+    },
+}
+
+# Let the front-end web server send protected files: None (stream from
+# Django), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd).
+# The prefix must map to MEDICAL_IMAGES_ROOT as an internal-only location.
+SENDFILE_BACKEND = None
+SENDFILE_URL_PREFIX = '/protected-media/'
+
+# Thumbnails and previews generated for uploaded images (requires Pillow).
+# Sizes are the bounding box in pixels; they're generated by background jobs
+# of the "images" queue, or on commit when MEDICAL_IMAGE_DERIVATIVES_EAGER is
+# set. Either way, and in the generate_image_derivatives command, they're
+# rendered in a process pool of MEDICAL_IMAGE_DERIVATIVE_WORKERS per process.
+MEDICAL_IMAGE_THUMBNAIL_SIZE = 256
+MEDICAL_IMAGE_PREVIEW_SIZE = 1280
+MEDICAL_IMAGE_DERIVATIVE_WORKERS = 2
+MEDICAL_IMAGE_DERIVATIVES_EAGER = False
+
+# Largest file accepted through the resumable image upload endpoints, and
+# how long an upload may go without a chunk before `manage.py
+# purge_image_uploads` deletes it with its staged file
+MEDICAL_IMAGE_UPLOAD_MAX_SIZE = 4 * 1024 ** 3
+MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS = int(os.environ.get('MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS', 24))
+
+# Request metrics exposed at /metrics. Under gunicorn, point
+# METRICS_MULTIPROCESS_DIR at a directory shared by the workers (emptied on
+# deploy) so each of them reports the totals of all workers; they write
+# their own samples there at most every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = True
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5
+
+# Queries slower than SLOW_QUERY_THRESHOLD_MS (None disables the log) are
+# kept with their plan in a ring buffer of SLOW_QUERY_LOG_SIZE entries per
+# process, saved to SLOW_QUERY_LOG_DIR. See `manage.py slow_queries`. The
+# test suite keeps them in memory only.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_LOG_DIR = None if sys.argv[1:2] == ['test'] else BASE_DIR / 'var' / 'slow_queries'
+
+# With DEBUG on, requests running more queries than their view's
+# `query_budgets` allow are logged ('warn') or fail ('fail'); None disables
+# the check. See core.query_budget.
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn') or None
+
+# Give new TimeStampedModel rows time-ordered UUIDv7 keys instead of random
+# uuid4 ones, which keeps primary key inserts local. Safe to switch on for
+# an existing database: the column type doesn't change.
+TIME_ORDERED_IDS = os.environ.get('TIME_ORDERED_IDS') == '1'
+
+# Reference data whose list/retrieve responses are cached under a version
+# bumped on every save and delete (see core.cache). The cache must be shared
+# by all processes in production, or a process keeps serving what it cached
+# before another one changed the data, for up to VERSIONED_CACHE_TIMEOUT.
+VERSIONED_CACHE = 'default'
+VERSIONED_CACHE_TIMEOUT = int(os.environ.get('VERSIONED_CACHE_TIMEOUT', 60 * 60))
+VERSIONED_CACHE_MODELS = [
+    'doctor_management.Specialization',
+    'appointments.AppointmentType',
+    'patient_management.InsuranceProvider',
+]
+
+# Delta sync (core.sync): how long deletions are remembered for clients,
+# and how far each change token reaches back before the previous response
+# to catch rows committed late
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+SYNC_OVERLAP_SECONDS = 5
+
+# Appointment change events (core.events), streamed by the ASGI application
+# at api/v1/events/. LocalBroker only reaches the streams of its own
+# process: several workers need a broker shared by all of them. Clients
+# that can't send headers (EventSource) open the stream with a token of
+# api/v1/events/token/, valid for EVENTS_STREAM_TOKEN_SECONDS.
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'core.events.LocalBroker')
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_RETRY_MS = 3000
+EVENTS_MAX_STREAM_SECONDS = 10 * 60
+EVENTS_STREAM_TOKEN_SECONDS = 60
+
+# POSTs sent with an Idempotency-Key header (see core.idempotency): how long
+# their responses are kept for retries, and how long a request that never
+# finished holds its key
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Background jobs (core.jobs), run by `manage.py run_workers`: how many
+# worker threads it starts, how often idle workers poll, how failed jobs
+# are retried, when a job whose worker died is run again, and how long
+# finished jobs are kept (see `manage.py purge_jobs`)
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BASE_SECONDS = 10
+JOBS_RETRY_MAX_SECONDS = 60 * 60
+JOBS_LOCK_TIMEOUT_SECONDS = 15 * 60
+JOBS_RETENTION_HOURS = int(os.environ.get('JOBS_RETENTION_HOURS', 7 * 24))
+
+# Bulk user imports (accounts.imports): rows per chunk, each inserted in one
+# transaction, processes hashing the passwords given in the file, and how
+# many row errors the import endpoints return
+IMPORT_BATCH_SIZE = 500
+IMPORT_HASHING_WORKERS = int(os.environ.get('IMPORT_HASHING_WORKERS', os.cpu_count() or 1))
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+# Where the links in emails (e.g. password resets) point
+FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -144,6 +380,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    # orjson-backed when the "json" extra is installed, DRF's JSON otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     # ]
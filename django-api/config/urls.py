@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
+from core.views import EventStreamTokenView, EventStreamView, MetricsView, SyncView
 
 # API schema documentation setup
 schema_view = get_schema_view(
@@ -22,6 +23,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
     path('api/v1/', include([
         path('accounts/', include('accounts.urls')),
@@ -29,12 +31,16 @@ urlpatterns = [
         path('doctors/', include('doctor_management.urls')),
         path('appointments/', include('appointments.urls')),
         path('medical-records/', include('medical_records.urls')),
+        path('sync/', SyncView.as_view(), name='sync'),
+        path('events/', EventStreamView.as_view(), name='events'),
+        path('events/token/', EventStreamTokenView.as_view(), name='events-token'),
         # API documentation
         path('docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
         path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     ])),
 ]
 
-# Serve media files in development
+# Serve media files in development (medical images are stored outside
+# MEDIA_ROOT and only served by the download endpoint)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
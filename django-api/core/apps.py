@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from core import cache, db, events, slow_queries, sync
+
+        connection_created.connect(db.configure_sqlite)
+        connection_created.connect(db.install_query_observers)
+        connection_created.connect(slow_queries.install)
+        cache.track_model_versions()
+        sync.track_deletions()
+        events.publish_appointment_events()
@@ -0,0 +1,712 @@
+"""
+Benchmarks against seeded data (see core.seeding and the seed_load command).
+
+Benchmark runs the hot API endpoints through the whole Django stack
+in-process, so the query count of each request can be captured next to its
+latency. ConcurrencyBenchmark measures the database profile alone (see
+DB_ENGINE in settings) under concurrent reads and writes,
+PrimaryKeyBenchmark compares random with time-ordered primary keys,
+JSONBenchmark compares DRF's JSON encoding with orjson's,
+ServerBenchmark compares sync WSGI workers with an async ASGI worker under
+many concurrent clients, and LoginBenchmark does the same for logins with
+each password hasher.
+"""
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers_by_algorithm, make_password
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db.models import Count
+from django.db import DatabaseError, close_old_connections, connection, connections, transaction
+from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from accounts.models import User
+from appointments.models import Appointment
+from core.db import read_pragmas
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer, orjson
+from core.seeding import SEED_EMAIL_DOMAIN, SEED_PASSWORD, LoadSeeder
+from doctor_management.models import DoctorProfile
+from medical_records.models import MedicalRecord, MedicalRecordAccess
+from patient_management.models import PatientProfile
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return None
+    return {
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+        'mean': round(statistics.fmean(latencies), 3),
+        'max': round(latencies[-1], 3),
+    }
+
+
+class Benchmark:
+    """
+    Run each scenario `iterations` times as randomly chosen seeded users.
+
+    A scenario returns the request to make: (method, url, data, token), where
+    a token of None makes an anonymous request.
+    """
+    scenarios = [
+        'login', 'available_slots', 'appointment_list_doctor', 'appointment_list_patient',
+        'my_appointments', 'doctor_schedule', 'my_records',
+    ]
+
+    def __init__(self, iterations=50, warmup=3, sample_size=50, seed=0, host='localhost'):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.random = random.Random(seed)
+        self.client = APIClient(HTTP_HOST=host)
+
+        seeded = User.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}")
+        self.doctors = self.sample(DoctorProfile.objects.filter(user__in=seeded), sample_size)
+        self.patients = self.sample(PatientProfile.objects.filter(user__in=seeded), sample_size)
+        if not self.doctors or not self.patients:
+            raise ValueError("No seeded doctors or patients found, run seed_load first.")
+
+        self.tokens = {
+            profile.user_id: Token.objects.get_or_create(user_id=profile.user_id)[0].key
+            for profile in self.doctors + self.patients
+        }
+
+    def sample(self, queryset, size):
+        ids = list(queryset.values_list('id', flat=True))
+        chosen = self.random.sample(ids, min(size, len(ids)))
+        return list(queryset.model.objects.select_related('user').filter(id__in=chosen))
+
+    def token(self, profile):
+        return self.tokens[profile.user_id]
+
+    def login(self):
+        patient = self.random.choice(self.patients)
+        data = {'email': patient.user.email, 'password': SEED_PASSWORD}
+        return 'post', reverse('token_obtain'), data, None
+
+    def user_login(self):
+        patient = self.random.choice(self.patients)
+        data = {'email': patient.user.email, 'password': SEED_PASSWORD}
+        return 'post', reverse('user-login'), data, None
+
+    def available_slots(self):
+        doctor = self.random.choice(self.doctors)
+        date = timezone.now().date() + timedelta(days=self.random.randint(1, 30))
+        url = reverse('doctorprofile-available-slots', args=[doctor.id])
+        # Doctors are the only non-staff users allowed to read their own slots
+        return 'get', url, {'date': date.isoformat()}, self.token(doctor)
+
+    def appointment_list_doctor(self):
+        return 'get', reverse('appointment-list'), {'upcoming': 'true'}, self.token(self.random.choice(self.doctors))
+
+    def appointment_list_patient(self):
+        return 'get', reverse('appointment-list'), {}, self.token(self.random.choice(self.patients))
+
+    def my_appointments(self):
+        return 'get', reverse('appointment-my-appointments'), {}, self.token(self.random.choice(self.patients))
+
+    def doctor_schedule(self):
+        return 'get', reverse('appointment-doctor-schedule'), {}, self.token(self.random.choice(self.doctors))
+
+    def doctor_list(self):
+        return 'get', reverse('doctorprofile-list'), {}, self.token(self.random.choice(self.patients))
+
+    def my_records(self):
+        return 'get', reverse('medicalrecord-my-records'), {}, self.token(self.random.choice(self.patients))
+
+    def request(self, scenario):
+        method, url, data, token = getattr(self, scenario)()
+        if token:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        else:
+            self.client.credentials()
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data)
+            elapsed = time.perf_counter() - started
+        return elapsed * 1000, len(queries.captured_queries), response.status_code
+
+    def run_scenario(self, scenario):
+        for _ in range(self.warmup):
+            self.request(scenario)
+
+        latencies, query_counts, statuses = [], [], {}
+        for _ in range(self.iterations):
+            latency, query_count, status = self.request(scenario)
+            latencies.append(latency)
+            query_counts.append(query_count)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        return {
+            'iterations': self.iterations,
+            'latency_ms': latency_summary(latencies),
+            'queries': {
+                'min': min(query_counts),
+                'max': max(query_counts),
+                'mean': round(statistics.fmean(query_counts), 2),
+            },
+            'status_codes': statuses,
+        }
+
+    def run(self, scenarios=None):
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'iterations': self.iterations,
+                'rows': {
+                    'doctors': DoctorProfile.objects.count(),
+                    'patients': PatientProfile.objects.count(),
+                    'appointments': Appointment.objects.count(),
+                    'medical_records': MedicalRecord.objects.count(),
+                },
+            },
+            'results': {scenario: self.run_scenario(scenario) for scenario in scenarios or self.scenarios},
+        }
+
+
+class ConcurrencyBenchmark:
+    """
+    `readers` threads loading a doctor's upcoming appointments and `writers`
+    threads inserting medical record access logs, for `duration` seconds.
+
+    Every operation is bracketed like a request, with close_old_connections()
+    before and after, so CONN_MAX_AGE and the cost of opening a connection
+    (including the SQLite pragmas) are part of the result.
+    """
+    access_reason = 'benchmark_db'
+
+    def __init__(self, readers=4, writers=2, duration=10.0, seed=0):
+        self.readers = readers
+        self.writers = writers
+        self.duration = duration
+        self.seed = seed
+
+        seeded = User.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}")
+        self.doctor_ids = list(DoctorProfile.objects.filter(user__in=seeded).values_list('id', flat=True)[:500])
+        self.records = list(MedicalRecord.objects.values_list('id', 'doctor__user_id')[:500])
+        if not self.doctor_ids or not self.records:
+            raise ValueError("No seeded doctors or medical records found, run seed_load first.")
+
+    def read(self, rng):
+        doctor_id = rng.choice(self.doctor_ids)
+        list(
+            Appointment.objects.filter(doctor_id=doctor_id, start_datetime__gte=timezone.now())
+            .select_related('patient__user', 'appointment_type')
+            .order_by('start_datetime')[:50]
+        )
+
+    def write(self, rng):
+        record_id, user_id = rng.choice(self.records)
+        with transaction.atomic():
+            MedicalRecordAccess.objects.create(
+                medical_record_id=record_id, user_id=user_id, access_reason=self.access_reason
+            )
+
+    def worker(self, operation, number, deadline, results):
+        rng = random.Random(f"{self.seed}-{operation.__name__}-{number}")
+        latencies, errors = [], {}
+        try:
+            while time.perf_counter() < deadline:
+                close_old_connections()
+                started = time.perf_counter()
+                try:
+                    operation(rng)
+                except DatabaseError as exc:
+                    errors[str(exc)] = errors.get(str(exc), 0) + 1
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+        results.append((operation.__name__, latencies, errors))
+
+    def profile(self):
+        database = settings.DATABASES['default']
+        profile = {
+            'vendor': connection.vendor,
+            'conn_max_age': database.get('CONN_MAX_AGE', 0),
+            'options': {key: str(value) for key, value in database.get('OPTIONS', {}).items()},
+        }
+        if connection.vendor == 'sqlite':
+            profile['pragmas'] = read_pragmas(connection)
+        elif connection.vendor == 'postgresql':
+            profile['conn_health_checks'] = database.get('CONN_HEALTH_CHECKS', False)
+            profile['server_side_cursors'] = not database.get('DISABLE_SERVER_SIDE_CURSORS', False)
+        return profile
+
+    def run(self):
+        results = []
+        deadline = time.perf_counter() + self.duration
+        threads = [
+            threading.Thread(target=self.worker, args=(operation, number, deadline, results))
+            for operation, count in ((self.read, self.readers), (self.write, self.writers))
+            for number in range(count)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            MedicalRecordAccess.objects.filter(access_reason=self.access_reason).delete()
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'profile': self.profile(),
+                'readers': self.readers,
+                'writers': self.writers,
+                'duration_s': self.duration,
+            },
+            'results': {},
+        }
+        for kind in ('read', 'write'):
+            latencies = [value for name, values, _ in results if name == kind for value in values]
+            errors = {}
+            for name, _, thread_errors in results:
+                if name == kind:
+                    for message, count in thread_errors.items():
+                        errors[message] = errors.get(message, 0) + count
+            report['results'][kind] = {
+                'operations': len(latencies),
+                'ops_per_second': round(len(latencies) / self.duration, 1),
+                'latency_ms': latency_summary(latencies),
+                'errors': errors,
+            }
+        return report
+
+
+class PrimaryKeyBenchmark:
+    """
+    Seed a scratch SQLite database twice, once with random uuid4 primary
+    keys and once with time-ordered uuid7 ones (settings.TIME_ORDERED_IDS),
+    and compare the insert rate and the size of the tables and primary key
+    indexes of `models`.
+    """
+    models = [Appointment, MedicalRecord, MedicalRecordAccess]
+    kinds = {'uuid4': False, 'uuid7': True}
+
+    def __init__(self, doctors=2000, patients=20000, appointments=1000000, batch_size=5000, seed=0,
+                 directory=None, log=None):
+        self.seeder_options = {
+            'doctors': doctors, 'patients': patients, 'appointments': appointments,
+            'batch_size': batch_size, 'seed': seed, 'log': log,
+        }
+        self.directory = directory
+        self.log = log or (lambda message: None)
+
+    def scratch_database(self, directory, kind):
+        alias = f"pk_benchmark_{kind}"
+        # configure_settings() fills in the defaults, and insists on a 'default'
+        connections.settings[alias] = connections.configure_settings({
+            'default': dict(connections.settings['default']),
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, f"{alias}.sqlite3")},
+        })[alias]
+        call_command('migrate', database=alias, verbosity=0)
+        return alias
+
+    def sizes(self, alias, table):
+        """
+        Bytes used by `table` and by its primary key index, from the dbstat
+        virtual table (None if SQLite was built without it).
+        """
+        with connections[alias].cursor() as cursor:
+            try:
+                cursor.execute(
+                    "SELECT name, SUM(pgsize) FROM dbstat WHERE name IN (%s, %s) GROUP BY name",
+                    [table, f"sqlite_autoindex_{table}_1"]
+                )
+            except DatabaseError:
+                return None, None
+            sizes = dict(cursor.fetchall())
+        return sizes.get(table), sizes.get(f"sqlite_autoindex_{table}_1")
+
+    def run_kind(self, directory, kind):
+        alias = self.scratch_database(directory, kind)
+        try:
+            self.log(f"Seeding with {kind} keys")
+            with override_settings(TIME_ORDERED_IDS=self.kinds[kind]):
+                seeder = LoadSeeder(using=alias, **self.seeder_options)
+                seeder.run()
+
+            results = {}
+            for model in self.models:
+                name = model.__name__
+                rows, seconds = seeder.counts.get(name, 0), seeder.timings.get(name, 0)
+                table_bytes, index_bytes = self.sizes(alias, model._meta.db_table)
+                results[name] = {
+                    'rows': rows,
+                    'insert_seconds': round(seconds, 3),
+                    'rows_per_second': round(rows / seconds) if seconds else None,
+                    'table_bytes': table_bytes,
+                    'pk_index_bytes': index_bytes,
+                }
+            return results
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def run(self):
+        with tempfile.TemporaryDirectory(dir=self.directory) as directory:
+            results = {kind: self.run_kind(directory, kind) for kind in self.kinds}
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'sqlite_version': connection.Database.sqlite_version,
+                **{key: value for key, value in self.seeder_options.items() if key != 'log'},
+            },
+            'results': results,
+        }
+
+
+class JSONBenchmark:
+    """
+    Render and parse the appointment and medical record list payloads of
+    the busiest seeded doctor `iterations` times with DRF's JSONRenderer and
+    JSONParser, and with FastJSONRenderer and FastJSONParser (orjson).
+    """
+    payloads = {
+        'appointment_list': 'appointment-list',
+        'medical_record_list': 'medicalrecord-list',
+    }
+
+    def __init__(self, iterations=50, host='localhost'):
+        self.iterations = iterations
+        self.client = APIClient(HTTP_HOST=host)
+
+        seeded = User.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}")
+        self.doctor = (
+            DoctorProfile.objects.filter(user__in=seeded)
+            .annotate(appointment_count=Count('appointments'))
+            .order_by('-appointment_count')
+            .first()
+        )
+        if self.doctor is None:
+            raise ValueError("No seeded doctors found, run seed_load first.")
+        token = Token.objects.get_or_create(user_id=self.doctor.user_id)[0].key
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+
+    def codecs(self):
+        codecs = {'json': (JSONRenderer(), JSONParser())}
+        if orjson is not None:
+            codecs['orjson'] = (FastJSONRenderer(), FastJSONParser())
+        return codecs
+
+    def time(self, function):
+        latencies = []
+        for _ in range(self.iterations):
+            started = time.perf_counter()
+            function()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latency_summary(latencies)
+
+    def run_payload(self, url_name):
+        response = self.client.get(reverse(url_name))
+        if response.status_code != 200:
+            raise ValueError(f"{url_name} returned {response.status_code}.")
+        # The serialized data, before the view's renderer turned it into bytes
+        data = response.data
+
+        result = {'items': len(data)}
+        for name, (renderer, parser) in self.codecs().items():
+            body = renderer.render(data)
+            result[name] = {
+                'bytes': len(body),
+                'render_ms': self.time(lambda: renderer.render(data)),
+                'parse_ms': self.time(lambda: parser.parse(io.BytesIO(body))),
+            }
+        if 'orjson' in result:
+            result['speedup'] = {
+                step: round(result['json'][step]['mean'] / result['orjson'][step]['mean'], 2)
+                for step in ('render_ms', 'parse_ms')
+            }
+        return result
+
+    def run(self):
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'iterations': self.iterations,
+                'orjson': orjson.__version__ if orjson is not None else None,
+            },
+            'results': {payload: self.run_payload(url_name) for payload, url_name in self.payloads.items()},
+        }
+
+
+class ServerBenchmark(Benchmark):
+    """
+    Serve `requests` requests of each scenario to `concurrency` clients at
+    once, in process, the two ways the API can be deployed:
+
+    - wsgi: `wsgi_workers` sync workers on the viewset routes. Like
+      gunicorn's sync workers, each serves one request at a time, so the
+      other clients wait for a free worker.
+    - asgi: one event loop (a uvicorn worker) on the async routes (see
+      core.views.AsyncAPIViewMixin), serving every client at once.
+
+    Requests go through Django's WSGIHandler and ASGIHandler, middleware
+    included, but not through a socket, and both run in this process: the
+    comparison is of the concurrency models, not of multi-core scaling.
+    Latencies include the wait for a worker.
+    """
+    scenarios = ['doctor_list', 'available_slots', 'my_appointments', 'doctor_schedule']
+    servers = ('wsgi', 'asgi')
+
+    def __init__(self, requests=500, concurrency=64, wsgi_workers=4, sample_size=50, seed=0, host='localhost'):
+        super().__init__(iterations=requests, warmup=0, sample_size=sample_size, seed=seed, host=host)
+        self.requests = requests
+        self.concurrency = concurrency
+        self.wsgi_workers = wsgi_workers
+        self.host = host
+
+    def plan(self, scenario):
+        """
+        The (method, path, query string, JSON body, token) of the scenario's
+        requests, for the sync and the async routes.
+        """
+        requests = {server: [] for server in self.servers}
+        for _ in range(self.requests):
+            method, url, data, token = getattr(self, scenario)()
+            match = resolve(url)
+            async_url = reverse(f"async-{match.url_name}", kwargs=match.kwargs)
+            if method == 'get':
+                query_string, body = urlencode(data), b''
+            else:
+                query_string, body = '', json.dumps(data).encode()
+            requests['wsgi'].append((method.upper(), url, query_string, body, token))
+            requests['asgi'].append((method.upper(), async_url, query_string, body, token))
+        return requests
+
+    def wsgi_request(self, handler, method, path, query_string, body, token):
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+        }
+        if body:
+            environ.update(CONTENT_TYPE='application/json', CONTENT_LENGTH=str(len(body)))
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f"Token {token}"
+        statuses = []
+        body = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        for _ in body:
+            pass
+        body.close()
+        return int(statuses[0].split()[0])
+
+    async def asgi_request(self, application, method, path, query_string, body, token):
+        headers = [(b'host', self.host.encode())]
+        if body:
+            headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if token:
+            headers.append((b'authorization', f"Token {token}".encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'headers': headers,
+            'server': (self.host, 80),
+            'client': ('127.0.0.1', 0),
+        }
+        disconnected = asyncio.Event()
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        statuses = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        try:
+            await application(scope, receive, send)
+        finally:
+            disconnected.set()
+        return statuses[0]
+
+    def run_wsgi(self, requests):
+        handler = WSGIHandler()
+        workers = threading.BoundedSemaphore(self.wsgi_workers)
+        pending = iter(requests)
+        lock = threading.Lock()
+        results = []
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        request = next(pending, None)
+                    if request is None:
+                        return
+                    started = time.perf_counter()
+                    with workers:
+                        status = self.wsgi_request(handler, *request)
+                    results.append(((time.perf_counter() - started) * 1000, status))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def run_asgi(self, requests):
+        application = ASGIHandler()
+        pending = iter(requests)
+        results = []
+
+        async def client():
+            for request in pending:
+                started = time.perf_counter()
+                status = await self.asgi_request(application, *request)
+                results.append(((time.perf_counter() - started) * 1000, status))
+
+        async def clients():
+            await asyncio.gather(*(client() for _ in range(self.concurrency)))
+
+        asyncio.run(clients())
+        return results
+
+    def run_scenario(self, scenario):
+        report = {}
+        for server, requests in self.plan(scenario).items():
+            started = time.perf_counter()
+            results = getattr(self, f"run_{server}")(requests)
+            elapsed = time.perf_counter() - started
+            statuses = {}
+            for _, status in results:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            report[server] = {
+                'requests': len(results),
+                'requests_per_second': round(len(results) / elapsed, 1),
+                'latency_ms': latency_summary([latency for latency, _ in results]),
+                'status_codes': statuses,
+            }
+        report['asgi_speedup'] = round(
+            report['asgi']['requests_per_second'] / report['wsgi']['requests_per_second'], 2
+        )
+        return report
+
+    def run(self, scenarios=None):
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'wsgi_workers': self.wsgi_workers,
+                'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+            },
+            'results': {scenario: self.run_scenario(scenario) for scenario in scenarios or self.scenarios},
+        }
+
+
+class LoginBenchmark(ServerBenchmark):
+    """
+    ServerBenchmark of logins, once for each password hasher in
+    `algorithms` (the first of settings.PASSWORD_HASHERS by default).
+
+    The sampled patients' passwords are hashed with each hasher in turn, at
+    the cost configured in settings, so no login pays for upgrading its
+    hash; they're restored afterwards. Under ASGI, passwords are hashed in
+    the pool of settings.PASSWORD_HASHING_WORKERS threads (see
+    accounts.hashers).
+    """
+    scenarios = ['user_login']
+
+    def __init__(self, algorithms=None, **kwargs):
+        super().__init__(**kwargs)
+        installed = {
+            algorithm: f"{type(hasher).__module__}.{type(hasher).__qualname__}"
+            for algorithm, hasher in get_hashers_by_algorithm().items()
+        }
+        algorithms = algorithms or [next(iter(installed))]
+        unknown = set(algorithms) - set(installed)
+        if unknown:
+            raise ValueError(f"Unknown password hashers: {', '.join(sorted(unknown))}.")
+        self.hashers = {algorithm: installed[algorithm] for algorithm in algorithms}
+
+    def run(self, scenarios=None):
+        users = User.objects.filter(pk__in=[patient.user_id for patient in self.patients])
+        originals = {}
+        for pk, password in users.values_list('pk', 'password'):
+            originals.setdefault(password, []).append(pk)
+
+        results = {}
+        try:
+            for algorithm, path in self.hashers.items():
+                others = [other for other in settings.PASSWORD_HASHERS if other != path]
+                with override_settings(PASSWORD_HASHERS=[path, *others]):
+                    users.update(password=make_password(SEED_PASSWORD))
+                    results[algorithm] = self.run_scenario('user_login')
+        finally:
+            for password, pks in originals.items():
+                User.objects.filter(pk__in=pks).update(password=password)
+
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'wsgi_workers': self.wsgi_workers,
+                'password_hashing_workers': settings.PASSWORD_HASHING_WORKERS,
+                'cpus': os.cpu_count(),
+            },
+            'results': results,
+        }
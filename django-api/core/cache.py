@@ -0,0 +1,74 @@
+"""
+Versioned caching of responses over small, rarely changing tables.
+
+Each model in settings.VERSIONED_CACHE_MODELS has a version number in the
+cache, bumped whenever one of its rows is saved or deleted. Responses are
+cached under the current version, so a change makes every cached response
+of the model unreachable at once instead of having to find and delete them.
+Writes that skip signals (QuerySet.update(), bulk_create()) must call
+bump_model_version() themselves.
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def get_cache():
+    return caches[settings.VERSIONED_CACHE]
+
+
+def version_key(model):
+    return f"model-version:{model._meta.label_lower}"
+
+
+def get_model_version(model):
+    cache = get_cache()
+    version = cache.get(version_key(model))
+    if version is None:
+        # Start from the clock rather than 1: responses cached under the
+        # numbers of an evicted counter may still be around
+        cache.add(version_key(model), time.time_ns(), timeout=None)
+        version = cache.get(version_key(model))
+    return version
+
+
+def bump_model_version(model):
+    try:
+        get_cache().incr(version_key(model))
+    except ValueError:
+        get_model_version(model)
+
+
+def model_changed(sender, **kwargs):
+    """
+    post_save/post_delete handler bumping the version of `sender`. It's
+    bumped again on commit: a response built from the old rows while the
+    transaction was open may have been cached under the first bump.
+    """
+    bump_model_version(sender)
+    transaction.on_commit(partial(bump_model_version, sender))
+
+
+def track_model_versions():
+    """
+    Connect model_changed to every model of settings.VERSIONED_CACHE_MODELS.
+    """
+    for label in settings.VERSIONED_CACHE_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(model_changed, sender=model, dispatch_uid=f"model-version-save:{label}")
+        post_delete.connect(model_changed, sender=model, dispatch_uid=f"model-version-delete:{label}")
+
+
+def response_cache_key(model, version, *parts):
+    """
+    Cache key (and strong ETag) of a response over `model` at `version`,
+    identified by `parts` such as the action, URL and media type.
+    """
+    digest = hashlib.sha256('\n'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f"response:{model._meta.label_lower}:{version}:{digest}"
@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+
+# Execute wrappers observing the queries of the current context, outermost
+# first (see observe_queries())
+_query_observers = ContextVar('query_observers', default=())
+
+# Allowed values of the pragmas set from settings.SQLITE_PRAGMAS that take
+# a keyword, since pragma values can't be passed as query parameters.
+PRAGMA_KEYWORDS = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+}
+
+
+def pragma_statement(name, value):
+    if name in PRAGMA_KEYWORDS:
+        value = str(value).upper()
+        if value not in PRAGMA_KEYWORDS[name]:
+            raise ValueError(f"Invalid value {value!r} for PRAGMA {name}.")
+    elif not isinstance(value, int):
+        raise ValueError(f"PRAGMA {name} takes an integer, not {value!r}.")
+    return f"PRAGMA {name} = {value}"
+
+
+def configure_sqlite(connection, **kwargs):
+    """
+    connection_created handler applying settings.SQLITE_PRAGMAS to every new
+    SQLite connection.
+
+    The pragmas run on the raw connection, outside the execute wrappers, so
+    they don't count as queries of the request that opened the connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(pragma_statement(name, value))
+
+
+def read_pragmas(connection):
+    """
+    The current value of each pragma in settings.SQLITE_PRAGMAS.
+    """
+    with connection.cursor() as cursor:
+        values = {}
+        for name in settings.SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}")
+            values[name] = cursor.fetchone()[0]
+    return values
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Pass every query run in the block through the execute wrapper
+    `observer`, on any connection.
+
+    Unlike connection.execute_wrapper(), this follows the context rather
+    than the thread: the queries of an async request run on the
+    connections of the threads sync_to_async() runs them in, which copy
+    the context.
+    """
+    token = _query_observers.set((*_query_observers.get(), observer))
+    try:
+        yield observer
+    finally:
+        _query_observers.reset(token)
+
+
+def run_query_observers(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, passing its queries through the
+    observers of the current context.
+    """
+    for observer in reversed(_query_observers.get()):
+        execute = partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_observers(connection, **kwargs):
+    """
+    connection_created handler adding run_query_observers to every
+    connection.
+    """
+    if run_query_observers not in connection.execute_wrappers:
+        # First, because connection.execute_wrapper() pops the last wrapper
+        # when it exits, and connections are often opened inside one
+        connection.execute_wrappers.insert(0, run_query_observers)
@@ -0,0 +1,222 @@
+"""
+Appointment change events, pushed to dashboards over Server-Sent Events.
+
+Every save and delete of an Appointment publishes an event, once the
+transaction commits, on the channels of its doctor and its patient
+("doctor:<id>", "patient:<id>"). EventStreamView subscribes to the channels
+of the requesting user and streams the events as they come, so dashboards
+can stop polling `doctor_schedule`.
+
+Brokers implement `publish(channel, message)`, called from sync code, and
+`subscribe(channels)`, an async context manager yielding a subscription
+whose `get(timeout)` returns the next message or None after `timeout`
+seconds. settings.EVENTS_BROKER names the broker class. LocalBroker only
+reaches the subscribers of its own process; with several ASGI workers, or
+writes made by WSGI workers, use a broker shared by all processes (e.g.
+Redis pub/sub) implementing the same two methods.
+
+Messages are JSON strings. A subscriber that falls more than
+settings.EVENTS_QUEUE_SIZE messages behind gets RESET instead of the
+messages it missed, and should refetch its schedule.
+
+Browsers' EventSource can't send an Authorization header: it opens the
+stream with the `token` query parameter of make_stream_token() instead,
+fetched just before from EventStreamTokenView with the API token.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import import_string
+
+from appointments.models import Appointment
+
+RESET = 'reset'
+STREAM_TOKEN_SALT = 'core.events.stream'
+
+
+def channels_for(doctor_id=None, patient_id=None):
+    channels = []
+    if doctor_id is not None:
+        channels.append(f"doctor:{doctor_id}")
+    if patient_id is not None:
+        channels.append(f"patient:{patient_id}")
+    return channels
+
+
+def make_stream_token(user):
+    """
+    Token opening the event stream of `user`, in the query string where
+    clients can't send headers. It's only accepted by EventStreamView, and
+    for settings.EVENTS_STREAM_TOKEN_SECONDS.
+    """
+    return signing.dumps(str(user.pk), salt=STREAM_TOKEN_SALT)
+
+
+def parse_stream_token(token):
+    """
+    The id of the user a stream token was made for, or None when it's
+    invalid or expired.
+    """
+    try:
+        return signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=settings.EVENTS_STREAM_TOKEN_SECONDS)
+    except signing.BadSignature:
+        return None
+
+
+class LocalSubscription:
+    """
+    Queue of the messages for one subscriber, filled from any thread and
+    read on the subscriber's event loop.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is closed, it's going away
+            pass
+
+    def _put(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return RESET
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """
+    In-process broker, for a single ASGI worker and for development.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        subscription = LocalSubscription(asyncio.get_running_loop(), settings.EVENTS_QUEUE_SIZE)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self.lock:
+                for channel in channels:
+                    self.subscriptions[channel].discard(subscription)
+                    if not self.subscriptions[channel]:
+                        del self.subscriptions[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def appointment_event(appointment, action):
+    return json.dumps({
+        'action': action,
+        'id': appointment.pk,
+        'doctor': appointment.doctor_id,
+        'patient': appointment.patient_id,
+        'status': appointment.status,
+        'start_datetime': appointment.start_datetime,
+        'end_datetime': appointment.end_datetime,
+        'updated_at': appointment.updated_at,
+    }, cls=DjangoJSONEncoder)
+
+
+def publish(channels, message):
+    broker = get_broker()
+    for channel in channels:
+        broker.publish(channel, message)
+
+
+def appointment_saved(sender, instance, created=False, **kwargs):
+    """
+    post_save handler publishing the change on commit, so subscribers never
+    hear of a booking that is rolled back.
+    """
+    message = appointment_event(instance, 'created' if created else 'updated')
+    transaction.on_commit(partial(publish, channels_for(instance.doctor_id, instance.patient_id), message))
+
+
+def appointment_deleted(sender, instance, **kwargs):
+    message = appointment_event(instance, 'deleted')
+    transaction.on_commit(partial(publish, channels_for(instance.doctor_id, instance.patient_id), message))
+
+
+def publish_appointment_events():
+    post_save.connect(appointment_saved, sender=Appointment, dispatch_uid='events:appointment-save')
+    post_delete.connect(appointment_deleted, sender=Appointment, dispatch_uid='events:appointment-delete')
+
+
+@contextmanager
+def unpublished_events():
+    """
+    Change appointments without publishing events, for data no dashboard
+    follows. Like core.sync.untracked_deletions(), this lets appointment
+    querysets be deleted in bulk instead of row by row.
+    """
+    post_save.disconnect(sender=Appointment, dispatch_uid='events:appointment-save')
+    post_delete.disconnect(sender=Appointment, dispatch_uid='events:appointment-delete')
+    try:
+        yield
+    finally:
+        publish_appointment_events()
+
+
+async def event_stream(channels, max_seconds=None):
+    """
+    The Server-Sent Events of `channels` as they're published: a comment
+    every settings.EVENTS_HEARTBEAT_SECONDS keeps proxies from closing an
+    idle connection. The stream ends after `max_seconds`: EventSource then
+    reconnects to the same URL, which fails once its stream token expired,
+    and the client has to open a new stream with a new token.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if max_seconds is None else loop.time() + max_seconds
+    async with get_broker().subscribe(channels) as subscription:
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+        while deadline is None or loop.time() < deadline:
+            timeout = settings.EVENTS_HEARTBEAT_SECONDS
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - loop.time(), 0))
+            message = await subscription.get(timeout)
+            if message is None:
+                yield ": keepalive\n\n"
+            elif message == RESET:
+                yield f"event: {RESET}\ndata: {{}}\n\n"
+            else:
+                yield f"event: appointment\ndata: {message}\n\n"
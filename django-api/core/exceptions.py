@@ -10,4 +10,23 @@ class DoctorUnavailableError(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = "The doctor is not available at the requested time."
     default_code = "doctor_unavailable"
-    
\ No newline at end of file
+    
+class UploadOffsetMismatchError(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The chunk offset does not match the number of bytes already received."
+    default_code = "upload_offset_mismatch"
+
+class UploadTooLargeError(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The uploaded data exceeds the declared file size."
+    default_code = "upload_too_large"
+
+class IdempotencyKeyInUseError(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = "idempotency_key_in_use"
+
+class IdempotencyKeyMismatchError(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = "idempotency_key_mismatch"
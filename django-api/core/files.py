@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(?P<first>\d*)-(?P<last>\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+class RangedFile:
+    """
+    Read-only view on a slice of an open file.
+
+    It deliberately keeps fileno() (with the file positioned at the start of
+    the slice) so WSGI servers that implement wsgi.file_wrapper with
+    os.sendfile, e.g. gunicorn, can still send the slice without copying it
+    through Python; everyone else falls back to the limited read().
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single `bytes=` range into an inclusive (start, end) tuple.
+
+    Returns None when the header should be ignored (missing, malformed or
+    multiple ranges) and raises UnsatisfiableRange when no byte of the file
+    falls inside the requested range.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+
+    first, last = match.group('first'), match.group('last')
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise UnsatisfiableRange()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise UnsatisfiableRange()
+    return start, end
+
+
+def stored_file_response(request, storage, name, etag=None, filename=None):
+    """
+    Build a response serving `name` from a file system `storage`.
+
+    - Conditional requests (If-None-Match / If-Modified-Since) get a 304
+    - Single byte ranges get a 206, unsatisfiable ones a 416
+    - With settings.SENDFILE_BACKEND set to 'x-accel-redirect' or 'x-sendfile'
+      the file body is left to the front-end web server
+    - Otherwise the file is streamed with FileResponse, which lets the WSGI
+      server use os.sendfile through wsgi.file_wrapper
+    """
+    size = storage.size(name)
+    last_modified = int(storage.get_modified_time(name).timestamp())
+    if etag is None:
+        etag = f"{size:x}-{last_modified:x}"
+    etag = quote_etag(etag)
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    validators = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'private, no-cache',
+        'Accept-Ranges': 'bytes',
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    if backend in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            # nginx serves the file (including ranges) from an internal location
+            response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX.rstrip('/') + '/' + quote(name)
+        else:
+            # Apache mod_xsendfile / lighttpd serve the file from its absolute path
+            response['X-Sendfile'] = storage.path(name)
+        response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range in (etag, validators['Last-Modified']):
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangedFile(file, start, end - start + 1),
+            status=206, filename=filename, content_type=content_type
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+    for header, value in validators.items():
+        response[header] = value
+    return response
@@ -0,0 +1,144 @@
+"""
+Idempotency-Key support for POSTs that create things.
+
+Mobile clients retry a POST when it times out, though the first attempt may
+well have gone through. Sent with the same Idempotency-Key header, the retry
+gets the stored response of the first attempt instead of running again:
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def reschedule(self, request, pk=None):
+        ...
+
+Keys are per user and kept for settings.IDEMPOTENCY_KEY_TTL_HOURS (see the
+`purge_idempotency_keys` command). Only successful responses are stored:
+after an error the key is released, and a retry runs the request again. A
+key reused for a different request (method, path or body) is refused with
+422, and a retry arriving while the first attempt is still running with 409.
+An attempt that died mid-request holds its key for
+settings.IDEMPOTENCY_LOCK_SECONDS at most.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+from core.exceptions import IdempotencyKeyInUseError, IdempotencyKeyMismatchError
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def purge_idempotency_keys(now=None):
+    """
+    Delete the keys past their TTL, returning how many.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def request_fingerprint(request):
+    """
+    SHA-256 of the request's method, path and parsed body. Uploaded files
+    count by content, read in chunks.
+    """
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    data = request.data
+    if hasattr(data, 'lists'):
+        for name, values in sorted(data.lists()):
+            for value in values:
+                digest.update(f"{name}=".encode())
+                if isinstance(value, UploadedFile):
+                    digest.update(f"file:{value.name}:{value.size}:".encode())
+                    for chunk in value.chunks():
+                        digest.update(chunk)
+                    value.seek(0)
+                else:
+                    digest.update(str(value).encode())
+                digest.update(b'\n')
+    else:
+        digest.update(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode())
+    return digest.hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """
+    Take `key` for a new request, returning (record, True), or return the
+    (record, False) of the request that already has it.
+    """
+    now = timezone.now()
+    expired = now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    abandoned = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue
+        if record.created_at < expired:
+            # Not purged yet: the key is free again
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.status_code is None and record.created_at < abandoned and record.fingerprint == fingerprint:
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, created_at=record.created_at
+            ).update(created_at=now)
+            if taken:
+                record.created_at = now
+                return record, True
+        return record, False
+    raise IdempotencyKeyInUseError()
+
+
+def idempotent(handler):
+    """
+    Decorate a POST handler of a viewset to honour the Idempotency-Key
+    header. Requests without the header run as usual.
+    """
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ParseError(f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters long.")
+
+        fingerprint = request_fingerprint(request)
+        record, created = claim(request.user, key, fingerprint)
+        if not created:
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyMismatchError()
+            if record.status_code is None:
+                raise IdempotencyKeyInUseError()
+            response = Response(record.response, status=record.status_code)
+            response[REPLAYED_HEADER] = 'true'
+            return response
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if not 200 <= response.status_code < 300:
+            record.delete()
+            return response
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response=response.data)
+        return response
+
+    return wrapper
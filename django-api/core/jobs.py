@@ -0,0 +1,229 @@
+"""
+Background jobs kept in the database (core.Job) and run by the
+`run_workers` command.
+
+A job is a module-level function decorated with @job, enqueued with its
+keyword arguments, which must be JSON serializable:
+
+    @job(max_attempts=5)
+    def send_password_reset_email(user_id):
+        ...
+
+    enqueue(send_password_reset_email, user_id=user.pk)
+
+The job row is written in the current transaction, so a job enqueued by a
+request that fails is never run, and one enqueued by a request that
+commits is never lost. Workers claim jobs with SELECT ... FOR UPDATE SKIP
+LOCKED where the database supports it (PostgreSQL). On SQLite, whose
+transactions take the write lock when they start (see settings), the claim
+is a compare-and-set UPDATE in a transaction, which is safe too.
+
+A job that raises is retried with exponential backoff and jitter until it
+has been attempted `max_attempts` times, then marked FAILED. A job whose
+worker died is claimed again after settings.JOBS_LOCK_TIMEOUT_SECONDS, so
+jobs must tolerate running twice.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.metrics import registry
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def job(func=None, *, queue='default', max_attempts=None):
+    """
+    Mark a module-level function as a job that can be enqueued.
+    """
+    def decorate(func):
+        func.job_options = {
+            'queue': queue,
+            'max_attempts': max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        }
+        return func
+
+    return decorate(func) if func is not None else decorate
+
+
+def job_name(func):
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def enqueue(func, run_at=None, **kwargs):
+    """
+    Queue a call of the job `func` with `kwargs`, at `run_at` or as soon as
+    a worker is free.
+    """
+    options = func.job_options
+    return Job.objects.create(
+        name=job_name(func),
+        queue=options['queue'],
+        kwargs=kwargs,
+        max_attempts=options['max_attempts'],
+        run_at=run_at or timezone.now(),
+    )
+
+
+def enqueue_many(func, kwargs_list, run_at=None):
+    """
+    Queue a call of the job `func` for each of `kwargs_list`, in one insert.
+    """
+    options = func.job_options
+    run_at = run_at or timezone.now()
+    return Job.objects.bulk_create([
+        Job(
+            name=job_name(func), queue=options['queue'], kwargs=kwargs,
+            max_attempts=options['max_attempts'], run_at=run_at,
+        )
+        for kwargs in kwargs_list
+    ])
+
+
+def cancel(func, **kwargs):
+    """
+    Delete the queued calls of the job `func` with `kwargs`, returning how
+    many. Calls already running aren't stopped.
+    """
+    # Compared as stored, e.g. UUIDs as strings
+    stored = json.loads(json.dumps(kwargs, cls=DjangoJSONEncoder))
+    lookups = {f'kwargs__{name}': value for name, value in stored.items()}
+    deleted, _ = Job.objects.filter(name=job_name(func), status='QUEUED', **lookups).delete()
+    return deleted
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before attempt `attempts + 1`: exponential, capped,
+    with jitter so failed jobs don't all come back at once.
+    """
+    delay = min(settings.JOBS_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def requeue_stale(now=None):
+    """
+    Put the jobs of workers that died back in the queue, returning how many.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT_SECONDS)
+    return Job.objects.filter(status='RUNNING', locked_at__lt=cutoff).update(
+        status='QUEUED', locked_by='', locked_at=None
+    )
+
+
+def purge_jobs(now=None):
+    """
+    Delete the jobs that finished more than settings.JOBS_RETENTION_HOURS
+    ago, returning how many.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.JOBS_RETENTION_HOURS)
+    deleted, _ = Job.objects.filter(status__in=['DONE', 'FAILED'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """
+    Claims and runs jobs of `queues`, one at a time.
+    """
+
+    def __init__(self, queues=('default',), name=None):
+        self.queues = list(queues)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def claim(self):
+        """
+        Take the next due job, or return None when there's none.
+        """
+        now = timezone.now()
+        due = Job.objects.filter(status='QUEUED', queue__in=self.queues, run_at__lte=now).order_by('run_at', 'id')
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                job = due.select_for_update(skip_locked=True).first()
+                if job is None:
+                    return None
+            else:
+                job = due.first()
+                if job is None:
+                    return None
+                # Compare-and-set, in case the database let another worker in
+                if not Job.objects.filter(pk=job.pk, status='QUEUED').update(status='RUNNING'):
+                    return None
+
+            job.status = 'RUNNING'
+            job.attempts += 1
+            job.locked_by = self.name
+            job.locked_at = now
+            job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at'])
+        return job
+
+    def run(self, job):
+        """
+        Run a claimed job and record its outcome.
+        """
+        started = timezone.now()
+        delay = max((started - job.run_at).total_seconds(), 0)
+        clock = time.perf_counter()
+        try:
+            func = import_string(job.name)
+            if not hasattr(func, 'job_options'):
+                raise TypeError(f"{job.name} is not a job.")
+            func(**job.kwargs)
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.name, job.attempts)
+            job.last_error = f"{type(exc).__name__}: {exc}"
+            if job.attempts < job.max_attempts:
+                outcome, job.status = 'retried', 'QUEUED'
+                job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            else:
+                outcome, job.status = 'failed', 'FAILED'
+                job.finished_at = timezone.now()
+        else:
+            outcome, job.status = 'done', 'DONE'
+            job.finished_at = timezone.now()
+
+        job.locked_by = ''
+        job.locked_at = None
+        job.save(update_fields=['status', 'run_at', 'finished_at', 'last_error', 'locked_by', 'locked_at'])
+        registry.observe_job(job.name, outcome, time.perf_counter() - clock, delay)
+        return outcome
+
+    def run_pending(self, limit=None):
+        """
+        Run due jobs until there are none left (or `limit` were run),
+        returning how many were run.
+        """
+        count = 0
+        while limit is None or count < limit:
+            close_old_connections()
+            job = self.claim()
+            if job is None:
+                break
+            self.run(job)
+            count += 1
+        return count
+
+    def work(self, stop, poll_interval):
+        """
+        Run jobs until the `stop` event is set, polling every
+        `poll_interval` seconds when the queue is empty.
+        """
+        try:
+            while not stop.is_set():
+                if not self.run_pending(limit=1):
+                    stop.wait(poll_interval)
+        finally:
+            connection.close()
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import Benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot API endpoints against seeded data (see seed_load) and report "
+        "p50/p95/p99 latency and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--scenario', action='append', choices=Benchmark.scenarios,
+            help="Scenario to run (repeatable). Defaults to all of them."
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument(
+            '--compare',
+            help="A previous JSON report to compare latencies and query counts with."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = Benchmark(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                host=options['host'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        report = benchmark.run(options['scenario'])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                self.compare(json.load(baseline_file), report)
+
+    def compare(self, baseline, report):
+        self.stderr.write(f"{'scenario':<26}{'p50 ms':>26}{'p95 ms':>26}{'queries':>12}")
+        for scenario, result in report['results'].items():
+            previous = baseline['results'].get(scenario)
+            if previous is None:
+                continue
+            columns = []
+            for percent in ('p50', 'p95'):
+                before, after = previous['latency_ms'][percent], result['latency_ms'][percent]
+                change = (after - before) / before * 100 if before else 0
+                columns.append(f"{before:.1f} -> {after:.1f} ({change:+.0f}%)")
+            queries = f"{previous['queries']['max']} -> {result['queries']['max']}"
+            self.stderr.write(f"{scenario:<26}{columns[0]:>26}{columns[1]:>26}{queries:>12}")
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import ServerBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync WSGI workers on the viewset routes with an async ASGI worker on the async "
+        "routes, serving the hot read endpoints to many concurrent clients against seeded data "
+        "(see seed_load). Run with DB_CONN_MAX_AGE=0, as under ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario and server.")
+        parser.add_argument('--concurrency', type=int, default=64, help="Clients sending requests at once.")
+        parser.add_argument('--wsgi-workers', type=int, default=4)
+        parser.add_argument(
+            '--scenario', action='append', choices=ServerBenchmark.scenarios,
+            help="Scenario to run (repeatable). Defaults to all of them."
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = ServerBenchmark(
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                wsgi_workers=options['wsgi_workers'],
+                seed=options['seed'],
+                host=options['host'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(benchmark.run(options['scenario']), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import ConcurrencyBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent read/write throughput of the configured database profile against "
+        "seeded data (see seed_load). Run once per profile, e.g. with SQLITE_JOURNAL_MODE=DELETE "
+        "SQLITE_SYNCHRONOUS=FULL for stock SQLite or DB_ENGINE=postgresql, and compare the reports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run for.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = ConcurrencyBenchmark(
+                readers=options['readers'],
+                writers=options['writers'],
+                duration=options['duration'],
+                seed=options['seed'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(benchmark.run(), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
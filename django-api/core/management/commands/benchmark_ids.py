@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+from core.benchmark import PrimaryKeyBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare insert throughput and primary key index size of random (uuid4) and "
+        "time-ordered (uuid7) keys for appointments, medical records and access logs, "
+        "using scratch SQLite databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=2000)
+        parser.add_argument('--patients', type=int, default=20000)
+        parser.add_argument('--appointments', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--directory',
+            help="Where to create the scratch databases. Defaults to the system temp directory."
+        )
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        benchmark = PrimaryKeyBenchmark(
+            doctors=options['doctors'],
+            patients=options['patients'],
+            appointments=options['appointments'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            directory=options['directory'],
+            log=self.stderr.write,
+        )
+        output = json.dumps(benchmark.run(), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
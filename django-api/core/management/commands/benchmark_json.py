@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import JSONBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering and parsing times of DRF's JSON renderer and parser with the "
+        "orjson-backed ones on the appointment and medical record list payloads of the "
+        "busiest seeded doctor (see seed_load)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = JSONBenchmark(iterations=options['iterations'])
+            report = benchmark.run()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import LoginBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput against seeded data (see seed_load): sync WSGI workers on "
+        "users/login/ and an async ASGI worker on async/users/login/, for each password hasher. "
+        "Set the hasher costs (PASSWORD_PBKDF2_ITERATIONS, PASSWORD_ARGON2_*) and "
+        "PASSWORD_HASHING_WORKERS in the environment to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasher', action='append', dest='algorithms',
+            help="Algorithm of a hasher of PASSWORD_HASHERS, e.g. argon2 or pbkdf2_sha256 "
+                 "(repeatable). Defaults to the first of PASSWORD_HASHERS."
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Logins per hasher and server.")
+        parser.add_argument('--concurrency', type=int, default=32, help="Clients logging in at once.")
+        parser.add_argument('--wsgi-workers', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = LoginBenchmark(
+                algorithms=options['algorithms'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                wsgi_workers=options['wsgi_workers'],
+                seed=options['seed'],
+                host=options['host'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(benchmark.run(), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
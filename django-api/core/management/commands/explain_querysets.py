@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.query_audit import ROLES, audit_viewsets
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the list queryset of every API viewset as an admin, a doctor and a patient "
+        "would get it, flagging full table scans and temporary B-tree sorts. Run it against "
+        "seeded data (see seed_load): planners pick differently on empty tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--role', action='append', choices=ROLES,
+            help="Only audit querysets for this role. Can be repeated."
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help="Show the plans of querysets without issues too."
+        )
+        parser.add_argument(
+            '--fail-on-issues', action='store_true',
+            help="Exit with an error if any queryset was flagged."
+        )
+
+    def handle(self, *args, **options):
+        results = audit_viewsets(options['role'] or ROLES)
+        flagged = 0
+        for result in results:
+            label = f"{result['view']} ({result['role']})"
+            if result['error']:
+                self.stdout.write(f"{label}: skipped, {result['error']}")
+                continue
+            if result['sql'] is None:
+                self.stdout.write(self.style.SUCCESS(f"{label}: ok, empty queryset"))
+                continue
+            if result['issues']:
+                flagged += 1
+                issues = ', '.join(sorted({issue for issue, _ in result['issues']}))
+                self.stdout.write(self.style.WARNING(f"{label}: {issues}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{label}: ok"))
+                if not options['verbose_plans']:
+                    continue
+            self.stdout.write(f"  {result['sql']}")
+            for line in result['plan'] or []:
+                self.stdout.write(f"    {line}")
+
+        self.stdout.write(f"\n{flagged} of {len(results)} querysets flagged.")
+        if flagged and options['fail_on_issues']:
+            raise CommandError(f"{flagged} querysets have full scans or temporary sorts.")
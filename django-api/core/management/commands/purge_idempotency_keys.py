@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.idempotency import purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the stored responses of Idempotency-Key requests older than "
+        "IDEMPOTENCY_KEY_TTL_HOURS. Run it hourly; the keys are free again afterwards."
+    )
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} idempotency keys older than {settings.IDEMPOTENCY_KEY_TTL_HOURS} hours."
+        ))
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.jobs import purge_jobs
+
+
+class Command(BaseCommand):
+    help = "Delete the background jobs that finished (done or failed) more than JOBS_RETENTION_HOURS ago."
+
+    def handle(self, *args, **options):
+        deleted = purge_jobs()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} jobs finished more than {settings.JOBS_RETENTION_HOURS} hours ago."
+        ))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the sync tombstones of rows deleted more than SYNC_TOMBSTONE_RETENTION_DAYS ago. "
+        "Run it daily; clients that last synced before then get a full snapshot."
+    )
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} tombstones older than {settings.SYNC_TOMBSTONE_RETENTION_DAYS} days."
+        ))
@@ -0,0 +1,78 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.jobs import Worker, requeue_stale
+from core.metrics import multiprocess_dir, registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (see core.jobs) in a pool of worker threads until stopped with "
+        "SIGINT or SIGTERM; running jobs are finished first. Start one process per queue that "
+        "needs its own pool, e.g. --queue images for the CPU-bound image derivatives. Point "
+        "METRICS_MULTIPROCESS_DIR at the web workers' directory to report job metrics at /metrics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOBS_WORKERS,
+            help="Worker threads (default: JOBS_WORKERS)."
+        )
+        parser.add_argument(
+            '--queue', action='append',
+            help="Queue to take jobs from (repeatable). Defaults to default, email and images."
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+            help="Seconds an idle worker waits before looking for jobs again."
+        )
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now, then exit.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        queues = options['queue'] or ['default', 'email', 'images']
+
+        requeued = requeue_stale()
+        if requeued:
+            self.stderr.write(f"Requeued {requeued} jobs of workers that died.")
+
+        if options['once']:
+            ran = Worker(queues).run_pending()
+            connection.close()
+            self.flush_metrics()
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs."))
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        threads = [
+            threading.Thread(
+                target=Worker(queues).work, args=(stop, options['poll_interval']),
+                name=f"job-worker-{number}",
+            )
+            for number in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Running {len(threads)} workers on {', '.join(queues)}.")
+
+        # Jobs left RUNNING by workers of other processes that died
+        while not stop.wait(settings.JOBS_LOCK_TIMEOUT_SECONDS / 2):
+            requeue_stale()
+            connection.close()
+
+        for thread in threads:
+            thread.join()
+        connection.close()
+        self.flush_metrics()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
+
+    def flush_metrics(self):
+        if multiprocess_dir():
+            registry.flush()
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.seeding import SEED_EMAIL_DOMAIN, SEED_PASSWORD, LoadSeeder, flush_seeded_data
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic doctors, patients, appointments, medical records and access logs "
+        f"for load testing. Seeded users have @{SEED_EMAIL_DOMAIN} emails and the password "
+        f"'{SEED_PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=2000)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--appointments', type=int, default=2000000)
+        parser.add_argument(
+            '--record-ratio', type=float, default=0.6,
+            help="Share of completed appointments that get a medical record."
+        )
+        parser.add_argument('--access-logs-per-record', type=int, default=2)
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help="Multiply the number of doctors, patients and appointments, e.g. 0.01 for a quick run."
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data.")
+        parser.add_argument(
+            '--flush', action='store_true',
+            help="Delete previously seeded data first."
+        )
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            deleted = flush_seeded_data()
+            self.stdout.write(f"Deleted {deleted} previously seeded objects.")
+        elif User.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}").exists():
+            raise CommandError("Seeded data already exists, use --flush to replace it.")
+
+        scale = options['scale']
+        doctors = max(1, round(options['doctors'] * scale))
+        patients = max(1, round(options['patients'] * scale))
+        appointments = round(options['appointments'] * scale)
+
+        seeder = LoadSeeder(
+            doctors=doctors,
+            patients=patients,
+            appointments=appointments,
+            record_ratio=options['record_ratio'],
+            access_logs_per_record=options['access_logs_per_record'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        started = time.monotonic()
+        counts = seeder.run()
+        elapsed = time.monotonic() - started
+
+        for model_name, count in counts.items():
+            self.stdout.write(f"  {model_name}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Seeded {sum(counts.values())} rows in {elapsed:.1f}s."))
@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.slow_queries import clear_entries, read_entries
+
+
+class Command(BaseCommand):
+    help = "Show the slow queries logged by the server processes, with their plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help="Number of queries (or fingerprints with --summary) to show."
+        )
+        parser.add_argument(
+            '--summary', action='store_true',
+            help="Group queries by fingerprint, slowest total time first."
+        )
+        parser.add_argument(
+            '--view',
+            help="Only show queries run by this view, e.g. MedicalImageViewSet.list."
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete the logged queries."
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.SLOW_QUERY_LOG_DIR
+        if not directory:
+            raise CommandError("SLOW_QUERY_LOG_DIR is not set.")
+
+        if options['clear']:
+            clear_entries(directory)
+            self.stdout.write(self.style.SUCCESS("Cleared the slow query log."))
+            return
+
+        entries = read_entries(directory)
+        if options['view']:
+            entries = [entry for entry in entries if entry['view'] == options['view']]
+        if not entries:
+            self.stdout.write("No slow queries logged.")
+            return
+
+        if options['summary']:
+            self.show_summary(entries, options['limit'])
+        else:
+            for entry in reversed(entries[-options['limit']:]):
+                self.show_entry(entry)
+
+    def show_entry(self, entry):
+        self.stdout.write(self.style.WARNING(
+            f"{entry['logged_at']}  {entry['duration_ms']:.1f} ms  "
+            f"[{entry['fingerprint']}]  {entry['view'] or '-'} ({entry['database']})"
+        ))
+        self.stdout.write(f"  {entry['sql']}")
+        if entry['plan']:
+            self.stdout.write("  Plan:")
+            for line in entry['plan']:
+                self.stdout.write(f"    {line}")
+        if entry['stack']:
+            self.stdout.write("  Stack:")
+            for frame in entry['stack']:
+                self.stdout.write(f"    {frame}")
+        self.stdout.write("")
+
+    def show_summary(self, entries, limit):
+        groups = defaultdict(list)
+        for entry in entries:
+            groups[entry['fingerprint']].append(entry)
+
+        ranked = sorted(groups.values(), key=lambda group: -sum(e['duration_ms'] for e in group))
+        for group in ranked[:limit]:
+            durations = [entry['duration_ms'] for entry in group]
+            latest = group[-1]
+            views = sorted({entry['view'] or '-' for entry in group})
+            self.stdout.write(self.style.WARNING(
+                f"[{latest['fingerprint']}]  {len(group)}x  total {sum(durations):.1f} ms  "
+                f"max {max(durations):.1f} ms  views: {', '.join(views)}"
+            ))
+            self.stdout.write(f"  {latest['sql']}")
+            for line in latest['plan'] or []:
+                self.stdout.write(f"    {line}")
+            self.stdout.write("")
@@ -0,0 +1,221 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DELAY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests handled, by view, action and status.', None
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time spent producing the response.', DURATION_BUCKETS
+    ),
+    'http_request_db_queries': (
+        'histogram', 'Database queries executed per request.', QUERY_COUNT_BUCKETS
+    ),
+    'http_request_db_duration_seconds': (
+        'histogram', 'Time spent in database queries per request.', DURATION_BUCKETS
+    ),
+    'http_response_size_bytes': (
+        'histogram', 'Size of the response body.', SIZE_BUCKETS
+    ),
+    'jobs_total': (
+        'counter', 'Background job runs, by job and outcome (done, retried, failed).', None
+    ),
+    'job_duration_seconds': (
+        'histogram', 'Time spent running a background job.', DURATION_BUCKETS
+    ),
+    'job_delay_seconds': (
+        'histogram', 'Time a background job waited past its due time for a worker.', DELAY_BUCKETS
+    ),
+}
+
+
+class MetricsRegistry:
+    """
+    Request and background job metrics aggregated in this process.
+
+    Samples are keyed by metric name and label values. Counters hold a number;
+    histograms hold the (non-cumulative) count of each bucket followed by the
+    sum and count of all observations.
+
+    With settings.METRICS_MULTIPROCESS_DIR set, every process (e.g. each
+    gunicorn worker) periodically writes its samples to a file in that
+    directory and collect() merges all of them, so any worker can serve the
+    totals of the whole server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._file_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        self._samples = {}
+        self._last_flush = 0.0
+
+    def _check_pid(self):
+        # Samples recorded before a fork belong to the parent process
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self._samples[key] = self._samples.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        sample = self._samples.get(key)
+        if sample is None:
+            sample = self._samples[key] = [0] * (len(buckets) + 3)
+        # Values above the last bucket only count towards +Inf
+        sample[bisect_left(buckets, value)] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+    def observe_request(self, view, action, status, duration, query_count, query_duration, response_size):
+        labels = (('view', view), ('action', action))
+        with self._lock:
+            self._check_pid()
+            self.inc('http_requests_total', labels + (('status', str(status)),))
+            self.observe('http_request_duration_seconds', labels, duration)
+            self.observe('http_request_db_queries', labels, query_count)
+            self.observe('http_request_db_duration_seconds', labels, query_duration)
+            if response_size is not None:
+                self.observe('http_response_size_bytes', labels, response_size)
+
+        self._maybe_flush()
+
+    def observe_job(self, job, outcome, duration, delay):
+        labels = (('job', job),)
+        with self._lock:
+            self._check_pid()
+            self.inc('jobs_total', labels + (('outcome', outcome),))
+            self.observe('job_duration_seconds', labels, duration)
+            self.observe('job_delay_seconds', labels, delay)
+
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if multiprocess_dir() and time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            self._check_pid()
+            return [
+                [name, list(labels), value if isinstance(value, (int, float)) else list(value)]
+                for (name, labels), value in self._samples.items()
+            ]
+
+    def flush(self):
+        """
+        Write this process's samples to the multi-process directory.
+        """
+        directory = multiprocess_dir()
+        self._last_flush = time.monotonic()
+        samples = self.snapshot()
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as temp_file:
+                json.dump(samples, temp_file)
+            os.replace(temp_path, os.path.join(directory, f"metrics-{self._file_id}.json"))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def collect(self):
+        """
+        Return the merged samples of this process, or of every process
+        when running in multi-process mode.
+        """
+        directory = multiprocess_dir()
+        if not directory:
+            return merge_samples([self.snapshot()])
+
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path) as metrics_file:
+                    snapshots.append(json.load(metrics_file))
+            except (OSError, ValueError):
+                # Being replaced or removed by its worker right now
+                continue
+        return merge_samples(snapshots)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def multiprocess_dir():
+    return getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+
+
+def merge_samples(snapshots):
+    merged = {}
+    for samples in snapshots:
+        for name, labels, value in samples:
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, list):
+                current = merged.setdefault(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def format_labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render_prometheus(samples):
+    """
+    Render merged samples in the Prometheus text exposition format.
+    """
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        keys = sorted(key for key in samples if key[0] == name)
+        if not keys:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key in keys:
+            labels = key[1]
+            value = samples[key]
+            if metric_type == 'counter':
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), value[:-2]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,241 @@
+"""
+Middleware of the project. Each one is sync and async capable: under ASGI,
+Django would otherwise adapt the whole chain to sync, and the async views
+(core.views.AsyncAPIViewMixin) would hold a thread per request anyway.
+Database queries are observed with core.db.observe_queries(), which
+follows async requests into the threads their queries run in.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+from core.db import observe_queries
+from core.metrics import registry
+from core.query_budget import QueryBudgetExceeded, check_query_budget, record_queries
+from core.routers import ais_sticky, astick_to_primary, is_sticky, stick_to_primary, use_primary
+from core.slow_queries import current_request
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of a request and the time
+    spent running them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def resolve_view(request):
+    """
+    Return the (view class, action) a request was routed to. Views that
+    aren't ViewSets report the HTTP method as their action, function views
+    have no class.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, request.method.lower()
+
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    actions = getattr(func, 'actions', None) or {}
+    return view_class, actions.get(request.method.lower(), request.method.lower())
+
+
+def resolve_view_labels(request):
+    """
+    Return the (view, action) names a request was routed to, e.g.
+    ('AppointmentViewSet', 'list').
+    """
+    view_class, action = resolve_view(request)
+    if view_class is not None:
+        return view_class.__name__, action
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', action
+    return f"{match.func.__module__}.{match.func.__name__}", action
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    # Streamed bodies (e.g. files) are only measured when their length is known
+    length = response.get('Content-Length')
+    return int(length) if length else None
+
+
+class HybridMiddleware:
+    """
+    Base of middleware running in the mode of the handler it wraps:
+    __call__ handles sync requests, acall() async ones.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return self.call(request)
+
+    def call(self, request):
+        raise NotImplementedError
+
+    async def acall(self, request):
+        raise NotImplementedError
+
+
+class RequestMetricsMiddleware(HybridMiddleware):
+    """
+    Record the latency, database queries, response size and status of every
+    request in core.metrics.registry, labelled with the view and action that
+    handled it.
+
+    Latency covers producing the response, not streaming its body.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        start = time.perf_counter()
+        with observe_queries(QueryTimer()) as timer:
+            response = self.get_response(request)
+        self.observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def acall(self, request):
+        start = time.perf_counter()
+        with observe_queries(QueryTimer()) as timer:
+            response = await self.get_response(request)
+        self.observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, timer, duration):
+        view, action = resolve_view_labels(request)
+        registry.observe_request(
+            view, action, response.status_code, duration,
+            timer.count, timer.duration, response_size(response),
+        )
+
+
+class SlowQueryLogMiddleware(HybridMiddleware):
+    """
+    Tag the slow queries logged during a request (see core.slow_queries)
+    with the view and action handling it.
+    """
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS is None:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def acall(self, request):
+        token = current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+class QueryBudgetMiddleware(HybridMiddleware):
+    """
+    Check every request against its view's query budget (see
+    core.query_budget) in DEBUG. Depending on settings.QUERY_BUDGET_MODE a
+    request over budget is logged ('warn') or fails ('fail').
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG or settings.QUERY_BUDGET_MODE not in ('warn', 'fail'):
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.check(request, response, recorder)
+
+    async def acall(self, request):
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        return self.check(request, response, recorder)
+
+    def check(self, request, response, recorder):
+        view_class, action = resolve_view(request)
+        if view_class is None:
+            return response
+        try:
+            check_query_budget(view_class, action, recorder.statements)
+        except QueryBudgetExceeded as exc:
+            if settings.QUERY_BUDGET_MODE == 'fail':
+                raise
+            logger.warning(str(exc))
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Run requests that may write, and every request of a client for
+    settings.REPLICA_STICKY_SECONDS after one that did, on the primary
+    database (see core.routers).
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        if request.method in SAFE_METHODS:
+            if not is_sticky(request):
+                return self.get_response(request)
+            with use_primary():
+                return self.get_response(request)
+
+        with use_primary():
+            response = self.get_response(request)
+        if response.status_code < 400:
+            stick_to_primary(request)
+        return response
+
+    async def acall(self, request):
+        if request.method in SAFE_METHODS:
+            if not await ais_sticky(request):
+                return await self.get_response(request)
+            with use_primary():
+                return await self.get_response(request)
+
+        with use_primary():
+            response = await self.get_response(request)
+        if response.status_code < 400:
+            await astick_to_primary(request)
+        return response
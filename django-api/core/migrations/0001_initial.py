@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 03:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=32)),
+                ('object_id', models.UUIDField()),
+                ('doctor_id', models.UUIDField(null=True)),
+                ('patient_id', models.UUIDField(null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor_id', 'deleted_at'], name='core_tombst_doctor__df72ca_idx'), models.Index(fields=['patient_id', 'deleted_at'], name='core_tombst_patient_ceb1da_idx'), models.Index(fields=['deleted_at'], name='core_tombst_deleted_51085d_idx')],
+            },
+        ),
+    ]
@@ -1,15 +1,116 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-import uuid
+from django.utils import timezone
+from core.ids import new_id
 
 class TimeStampedModel(models.Model):
     """
     An abstract base model that provides self-updating
     created_at and updated_at fields.
+
+    Primary keys are random UUIDs, or time-ordered ones with
+    settings.TIME_ORDERED_IDS (see core.ids).
     """
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=new_id, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
-        ordering = ['-created_at', '-updated_at']
\ No newline at end of file
+        ordering = ['-created_at', '-updated_at']
+
+
+class Tombstone(models.Model):
+    """
+    A hard-deleted row that sync clients (see core.sync) may still hold,
+    kept for settings.SYNC_TOMBSTONE_RETENTION_DAYS.
+
+    The owners are plain ids rather than foreign keys: they're often
+    deleted along with the row.
+    """
+    collection = models.CharField(max_length=32)
+    object_id = models.UUIDField()
+    doctor_id = models.UUIDField(null=True)
+    patient_id = models.UUIDField(null=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor_id', 'deleted_at']),
+            models.Index(fields=['patient_id', 'deleted_at']),
+            # Purging expired tombstones
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.collection} {self.object_id} deleted at {self.deleted_at}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a POST sent with an Idempotency-Key header (see
+    core.idempotency), kept for settings.IDEMPOTENCY_KEY_TTL_HOURS so a
+    retry gets the same response without running the request again.
+
+    `status_code` is null while the first request is being processed.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the method, path and body")
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            # Purging expired keys
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of {self.user_id}"
+
+
+class Job(models.Model):
+    """
+    A call of a background job (see core.jobs): the dotted path of the job
+    function and its keyword arguments, run by the `run_workers` command.
+
+    `attempts` counts the runs started, `run_at` is when the job is next
+    due, and `locked_by`/`locked_at` name the worker running it.
+    """
+    STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    name = models.CharField(max_length=200)
+    queue = models.CharField(max_length=50, default='default')
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=200, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming the next due job of a queue
+            models.Index(fields=['queue', 'status', 'run_at']),
+            # Requeueing stale jobs and purging finished ones
+            models.Index(fields=['status', 'locked_at']),
+            models.Index(fields=['status', 'finished_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,128 @@
+"""
+Query plan audit of the API's viewsets.
+
+Every viewset routed in the URLconf builds its list queryset the way a
+request from an admin, a doctor and a patient would, and the database
+explains it. Plans reading a whole table or sorting rows in a temporary
+B-tree are flagged: on a growing table they're usually a missing index.
+See the `explain_querysets` management command.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.slow_queries import explain
+
+ROLES = ('admin', 'doctor', 'patient')
+
+# Plan lines flagged per database: (pattern, issue). SQLite's "SCAN t USING
+# INDEX i" walks an index in order and isn't flagged.
+PLAN_ISSUES = {
+    'sqlite': [
+        (re.compile(r'^SCAN (?!.*\bUSING\b.*\bINDEX\b)(?!CONSTANT ROW)'), 'full scan'),
+        (re.compile(r'USE TEMP B-TREE'), 'temp b-tree sort'),
+    ],
+    'postgresql': [
+        (re.compile(r'Seq Scan on'), 'full scan'),
+        (re.compile(r'(^|-> +)(Incremental )?Sort\b'), 'sort'),
+    ],
+}
+
+
+def routed_viewsets(patterns=None):
+    """
+    The viewset classes routed in the URLconf that have a list action, in
+    URLconf order.
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    viewsets = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            found = routed_viewsets(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            callback = pattern.callback
+            actions = getattr(callback, 'actions', None) or {}
+            found = [callback.cls] if actions.get('get') == 'list' else []
+        else:
+            found = []
+        viewsets.extend(view_class for view_class in found if view_class not in viewsets)
+    return viewsets
+
+
+def role_users():
+    """
+    A user for each role, or None for the roles nobody has.
+    """
+    User = get_user_model()
+    return {
+        'admin': User.objects.filter(is_staff=True).order_by('pk').first(),
+        'doctor': User.objects.filter(is_staff=False, doctorprofile__isnull=False).order_by('pk').first(),
+        'patient': User.objects.filter(is_staff=False, patientprofile__isnull=False).order_by('pk').first(),
+    }
+
+
+def list_queryset(view_class, user, action='list'):
+    """
+    The queryset `view_class` would serve to `user` for `action`, filters
+    and all.
+    """
+    request = Request(APIRequestFactory().get('/'))
+    request.user = user
+    view = view_class()
+    view.action_map = {'get': action}
+    view.action = action
+    view.request = request
+    view.args = ()
+    view.kwargs = {}
+    view.format_kwarg = None
+    return view.filter_queryset(view.get_queryset())
+
+
+def plan_issues(vendor, plan):
+    """
+    The (issue, plan line) pairs flagged in `plan`.
+    """
+    issues = []
+    for line in plan or []:
+        for pattern, issue in PLAN_ISSUES.get(vendor, []):
+            if pattern.search(line.strip()):
+                issues.append((issue, line.strip()))
+    return issues
+
+
+def audit_viewsets(roles=ROLES):
+    """
+    Explain the list queryset of every routed viewset for each of `roles`.
+    Returns one dict per (viewset, role) with the SQL, the plan and the
+    issues found in it, or an error when the queryset couldn't be built.
+    Querysets that can't match anything (.none()) have no SQL.
+    """
+    users = role_users()
+    results = []
+    for view_class in routed_viewsets():
+        for role in roles:
+            user = users[role]
+            result = {'view': view_class.__name__, 'role': role, 'sql': None, 'plan': None, 'issues': [], 'error': None}
+            results.append(result)
+            if user is None:
+                result['error'] = f"no {role} user in the database"
+                continue
+            try:
+                queryset = list_queryset(view_class, user)
+                sql, params = queryset.query.sql_with_params()
+            except EmptyResultSet:
+                continue
+            except Exception as exc:
+                result['error'] = f"{type(exc).__name__}: {exc}"
+                continue
+            connection = connections[queryset.db]
+            result['sql'] = sql
+            result['plan'] = explain(connection, sql, params)
+            result['issues'] = plan_issues(connection.vendor, result['plan'])
+    return results
@@ -0,0 +1,89 @@
+"""
+Per-view query budgets.
+
+A view declares the most queries a request to each of its actions may run:
+
+    class AppointmentViewSet(viewsets.ModelViewSet):
+        query_budgets = {'list': 4, 'doctor_schedule': 4}
+
+Budgets count every statement of the request, authentication included, but
+not transaction control (BEGIN, COMMIT, savepoints), which only some
+databases send as separate statements. A budget that holds with any amount
+of data rules out N+1 queries.
+
+They are enforced by QueryBudgetTestMixin in tests and, in DEBUG, by
+core.middleware.QueryBudgetMiddleware.
+"""
+from contextlib import contextmanager
+
+from core.db import observe_queries
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, view, action, budget, statements):
+        self.view = view
+        self.action = action
+        self.budget = budget
+        self.statements = statements
+        super().__init__(
+            f"{view}.{action} ran {len(statements)} queries, over its budget of {budget}:\n"
+            + "\n".join(f"  {number}. {sql}" for number, sql in enumerate(statements, 1))
+        )
+
+
+def get_query_budget(view_class, action):
+    """
+    The budget `view_class` declares for `action`, or None.
+    """
+    return getattr(view_class, 'query_budgets', {}).get(action)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper keeping the SQL of every statement that counts
+    against a budget.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+def record_queries():
+    return observe_queries(QueryRecorder())
+
+
+def check_query_budget(view_class, action, statements):
+    """
+    Raise QueryBudgetExceeded if `statements` don't fit the budget of
+    `view_class` for `action`. Views without a budget always pass.
+    """
+    budget = get_query_budget(view_class, action)
+    if budget is not None and len(statements) > budget:
+        raise QueryBudgetExceeded(view_class.__name__, action, budget, statements)
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin for checking requests against their view's budget:
+
+        with self.assertWithinQueryBudget(AppointmentViewSet, 'doctor_schedule'):
+            self.client.get(reverse('appointment-doctor-schedule'))
+    """
+
+    @contextmanager
+    def assertWithinQueryBudget(self, view_class, action):
+        if get_query_budget(view_class, action) is None:
+            self.fail(f"{view_class.__name__} has no query budget for {action!r}.")
+        with record_queries() as recorder:
+            yield recorder
+        try:
+            check_query_budget(view_class, action, recorder.statements)
+        except QueryBudgetExceeded as exc:
+            self.fail(str(exc))
@@ -0,0 +1,66 @@
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, see the "json" extra
+    orjson = None
+
+# Output matching JSONRenderer's: UTC datetimes end in "Z", and keys that
+# aren't strings (ints, UUIDs) are converted like json.dumps does
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it's installed, several times
+    faster on large lists. UUIDs and datetimes are encoded natively, and
+    anything else orjson doesn't know (Decimals, lazy strings, querysets)
+    the way JSONRenderer would. Without orjson, and for indented or
+    ASCII-only output, this is JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.ensure_ascii or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits, which the json module handles
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape the two characters valid in JSON but not
+        # in JavaScript string literals
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Renderer for views that return file responses of any media type.
+    Errors raised by those views are still rendered as JSON.
+    """
+    media_type = '*/*'
+    format = None
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return FastJSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    """
+    Renderer for the Prometheus text exposition format. Errors are rendered
+    as JSON.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return FastJSONRenderer().render(data, renderer_context=renderer_context)
@@ -0,0 +1,93 @@
+"""
+Read replica routing.
+
+Reads go to one of settings.DATABASE_REPLICAS and writes to the primary
+('default'). Replicas lag behind the primary, so a client that just
+changed something (booked an appointment, say) is pinned to the primary
+for settings.REPLICA_STICKY_SECONDS, and every request that isn't a safe
+method runs entirely on the primary. See
+core.middleware.ReplicaRoutingMiddleware.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+PRIMARY = 'default'
+
+# Read from the primary even outside a pinned request: a token is usually
+# used right after it's created at login, before the replicas have it.
+PRIMARY_ONLY_MODELS = {'authtoken.token'}
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Send every query in the block to the primary.
+    """
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def sticky_key(request):
+    """
+    Cache key identifying the client of a request by its credentials, or
+    None for anonymous requests.
+    """
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'replica-sticky:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def stick_to_primary(request):
+    key = sticky_key(request)
+    if key is not None:
+        caches[settings.REPLICA_STICKY_CACHE].set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(request):
+    key = sticky_key(request)
+    return key is not None and caches[settings.REPLICA_STICKY_CACHE].get(key, False)
+
+
+async def astick_to_primary(request):
+    key = sticky_key(request)
+    if key is not None:
+        await caches[settings.REPLICA_STICKY_CACHE].aset(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+async def ais_sticky(request):
+    key = sticky_key(request)
+    return key is not None and await caches[settings.REPLICA_STICKY_CACHE].aget(key, False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _use_primary.get() or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return PRIMARY
+        # Follow the database the related instance was loaded from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
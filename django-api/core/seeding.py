@@ -0,0 +1,324 @@
+"""
+Synthetic data at realistic volumes for load tests and benchmarks.
+
+Everything is inserted with bulk_create, so model save() methods, clean()
+and signals don't run; the generator keeps the data consistent itself
+(e.g. a doctor's appointments never overlap and fall inside their weekly
+availability).
+"""
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from appointments.models import Appointment, AppointmentReminder, AppointmentType
+from core.events import unpublished_events
+from core.sync import untracked_deletions
+from doctor_management.models import DoctorAvailability, DoctorProfile, DoctorTimeOff, Specialization
+from medical_records.models import MedicalRecord, MedicalRecordAccess
+from patient_management.models import InsuranceProvider, PatientInsurance, PatientProfile
+
+User = get_user_model()
+
+SEED_EMAIL_DOMAIN = 'load.test'
+SEED_PASSWORD = 'load-test-password'
+
+FIRST_NAMES = [
+    'Amina', 'Brian', 'Chloe', 'David', 'Esther', 'Faith', 'George', 'Hannah', 'Ian', 'Joy',
+    'Kevin', 'Lucy', 'Mark', 'Njeri', 'Oscar', 'Purity', 'Quentin', 'Rose', 'Samuel', 'Tabitha',
+    'Umar', 'Violet', 'Wanjiru', 'Xavier', 'Yusuf', 'Zawadi',
+]
+LAST_NAMES = [
+    'Achieng', 'Baraka', 'Chebet', 'Otieno', 'Kamau', 'Mwangi', 'Njoroge', 'Odhiambo', 'Wambui',
+    'Kiptoo', 'Smith', 'Johnson', 'Brown', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Taylor',
+]
+CITIES = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Nyeri', 'Machakos']
+SPECIALIZATIONS = [
+    'Cardiology', 'Dermatology', 'Endocrinology', 'Family Medicine', 'Gastroenterology',
+    'Neurology', 'Obstetrics and Gynecology', 'Oncology', 'Ophthalmology', 'Orthopedics',
+    'Pediatrics', 'Psychiatry', 'Pulmonology', 'Radiology', 'Urology',
+]
+APPOINTMENT_TYPES = [
+    ('General Consultation', False),
+    ('Follow-up', False),
+    ('Annual Physical', False),
+    ('Telehealth Visit', True),
+]
+INSURANCE_PROVIDERS = ['AAR', 'Britam', 'CIC', 'Jubilee', 'Madison', 'NHIF', 'Old Mutual', 'Resolution']
+DIAGNOSES = [
+    'Hypertension', 'Type 2 diabetes', 'Upper respiratory tract infection', 'Migraine',
+    'Lower back pain', 'Seasonal allergies', 'Gastritis', 'Anxiety disorder', 'Asthma',
+    'Urinary tract infection', 'Routine check, no findings',
+]
+# Weekly availability templates: {day_of_week: [(start, end), ...]}
+WEEKLY_TEMPLATES = [
+    {day: [(time(9), time(12)), (time(13), time(17))] for day in range(5)},
+    {day: [(time(8), time(13))] for day in range(6)},
+    {**{day: [(time(10), time(18))] for day in (0, 2, 4)}, 5: [(time(9), time(12))]},
+]
+SLOT_MINUTES = 30
+
+
+class LoadSeeder:
+    """
+    Generate doctors, patients, appointments, medical records and access logs.
+
+    Appointments are spread over the past `history_days` and the next
+    `future_days`. Past ones are mostly completed and `record_ratio` of the
+    completed ones get a medical record with `access_logs_per_record`
+    access log entries; future ones get a reminder.
+
+    Rows go to the `using` database. `timings` has the seconds spent
+    inserting each model.
+    """
+
+    def __init__(self, doctors, patients, appointments, record_ratio=0.6, access_logs_per_record=2,
+                 history_days=365, future_days=90, batch_size=5000, seed=0, log=None, using='default'):
+        self.doctors = doctors
+        self.patients = patients
+        self.appointments = appointments
+        self.record_ratio = record_ratio
+        self.access_logs_per_record = access_logs_per_record
+        self.history_days = history_days
+        self.future_days = future_days
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.using = using
+        self.counts = {}
+        self.timings = {}
+
+    def run(self):
+        self.password = make_password(SEED_PASSWORD)
+        self.seed_reference_data()
+        doctors = self.seed_doctors()
+        patients = self.seed_patients()
+        self.seed_appointments(doctors, patients)
+        return self.counts
+
+    def insert(self, model, objects):
+        """
+        Insert `objects` in batches of batch_size, one transaction per batch.
+        """
+        objects = list(objects)
+        started = perf_counter()
+        for start in range(0, len(objects), self.batch_size):
+            with transaction.atomic(using=self.using):
+                model.objects.using(self.using).bulk_create(objects[start:start + self.batch_size])
+        name = model.__name__
+        self.timings[name] = self.timings.get(name, 0) + perf_counter() - started
+        self.counts[name] = self.counts.get(name, 0) + len(objects)
+        return objects
+
+    def person_name(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def seed_reference_data(self):
+        self.specializations = [
+            Specialization.objects.using(self.using).get_or_create(name=name)[0] for name in SPECIALIZATIONS
+        ]
+        self.appointment_types = [
+            (AppointmentType.objects.using(self.using).get_or_create(name=name, defaults={'duration_minutes': SLOT_MINUTES})[0], virtual)
+            for name, virtual in APPOINTMENT_TYPES
+        ]
+        self.insurance_providers = [
+            InsuranceProvider.objects.using(self.using).get_or_create(name=name)[0] for name in INSURANCE_PROVIDERS
+        ]
+
+    def create_users(self, role, count):
+        users = []
+        for number in range(count):
+            first_name, last_name = self.person_name()
+            users.append(User(
+                email=f"{role.lower()}{number}@{SEED_EMAIL_DOMAIN}",
+                password=self.password,
+                first_name=first_name,
+                last_name=last_name,
+                role=role,
+            ))
+        return self.insert(User, users)
+
+    def seed_doctors(self):
+        self.log(f"Creating {self.doctors} doctors")
+        users = self.create_users('DOCTOR', self.doctors)
+        doctors = self.insert(DoctorProfile, (
+            DoctorProfile(
+                user=user,
+                license_number=f"LOAD-{number:07d}",
+                years_of_experience=self.random.randint(1, 35),
+                biography=f"Dr. {user.last_name} has been practising for many years.",
+                accepting_new_patients=self.random.random() < 0.8,
+                consultation_fee=Decimal(self.random.randrange(1000, 10000, 500)),
+                city=self.random.choice(CITIES),
+            )
+            for number, user in enumerate(users)
+        ))
+
+        through = DoctorProfile.specialization.through
+        self.insert(through, (
+            through(doctorprofile_id=doctor.id, specialization_id=specialization.id)
+            for doctor in doctors
+            for specialization in self.random.sample(self.specializations, self.random.randint(1, 2))
+        ))
+
+        availabilities = []
+        time_offs = []
+        for doctor in doctors:
+            doctor.weekly_template = self.random.choice(WEEKLY_TEMPLATES)
+            availabilities.extend(
+                DoctorAvailability(doctor=doctor, day_of_week=day, start_time=start, end_time=end)
+                for day, windows in doctor.weekly_template.items()
+                for start, end in windows
+            )
+            start = self.now + timedelta(days=self.random.randint(-self.history_days, self.future_days))
+            time_offs.append(DoctorTimeOff(
+                doctor=doctor, start_datetime=start, end_datetime=start + timedelta(days=7), reason='Vacation'
+            ))
+        self.insert(DoctorAvailability, availabilities)
+        self.insert(DoctorTimeOff, time_offs)
+        return doctors
+
+    def seed_patients(self):
+        self.log(f"Creating {self.patients} patients")
+        users = self.create_users('PATIENT', self.patients)
+        patients = self.insert(PatientProfile, (
+            PatientProfile(
+                user=user,
+                date_of_birth=(self.now - timedelta(days=self.random.randint(365, 90 * 365))).date(),
+                gender=self.random.choice('MF'),
+                blood_type=self.random.choice(['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']),
+                city=self.random.choice(CITIES),
+            )
+            for user in users
+        ))
+        self.insert(PatientInsurance, (
+            PatientInsurance(
+                patient=patient,
+                insurance_provider=self.random.choice(self.insurance_providers),
+                policy_number=f"POL-{number:08d}",
+                policy_holder_name=f"{patient.user.first_name} {patient.user.last_name}",
+                start_date=(self.now - timedelta(days=self.random.randint(0, 5 * 365))).date(),
+                is_primary=True,
+            )
+            for number, patient in enumerate(patients)
+            if self.random.random() < 0.8
+        ))
+        return patients
+
+    def doctor_slots(self, doctor):
+        """
+        Start of every free slot in the doctor's weekly availability over the
+        seeded period.
+        """
+        today = self.now.date()
+        slots = []
+        for offset in range(-self.history_days, self.future_days):
+            day = today + timedelta(days=offset)
+            for start, end in doctor.weekly_template.get(day.weekday(), ()):
+                slot = timezone.make_aware(datetime.combine(day, start))
+                window_end = timezone.make_aware(datetime.combine(day, end))
+                while slot + timedelta(minutes=SLOT_MINUTES) <= window_end:
+                    slots.append(slot)
+                    slot += timedelta(minutes=SLOT_MINUTES)
+        return slots
+
+    def seed_appointments(self, doctors, patients):
+        self.log(f"Creating {self.appointments} appointments with records and reminders")
+        per_doctor, extra = divmod(self.appointments, len(doctors)) if doctors else (0, 0)
+        appointments, reminders, records, access_logs = [], [], [], []
+
+        for index, doctor in enumerate(doctors):
+            slots = self.doctor_slots(doctor)
+            count = min(per_doctor + (1 if index < extra else 0), len(slots))
+            for start in sorted(self.random.sample(slots, count)):
+                patient = self.random.choice(patients)
+                appointment_type, virtual = self.random.choice(self.appointment_types)
+                past = start < self.now
+                if past:
+                    status = self.random.choices(['COMPLETED', 'CANCELLED', 'NO_SHOW'], [80, 10, 10])[0]
+                else:
+                    status = self.random.choices(['SCHEDULED', 'CONFIRMED', 'CANCELLED'], [70, 25, 5])[0]
+
+                appointment = Appointment(
+                    patient=patient,
+                    doctor=doctor,
+                    appointment_type=appointment_type,
+                    start_datetime=start,
+                    end_datetime=start + timedelta(minutes=SLOT_MINUTES),
+                    status=status,
+                    reason=self.random.choice(DIAGNOSES),
+                    is_virtual=virtual,
+                )
+                appointments.append(appointment)
+
+                if not past and status != 'CANCELLED':
+                    reminders.append(AppointmentReminder(
+                        appointment=appointment,
+                        scheduled_time=start - timedelta(hours=24),
+                        message=f"Reminder: appointment with Dr. {doctor.user.last_name}",
+                    ))
+                if status == 'COMPLETED' and self.random.random() < self.record_ratio:
+                    record = MedicalRecord(
+                        patient=patient,
+                        doctor=doctor,
+                        appointment=appointment,
+                        diagnosis=self.random.choice(DIAGNOSES),
+                        treatment_plan='Rest, fluids and review in two weeks.',
+                        temperature=Decimal(self.random.randrange(3600, 3900)) / 100,
+                        blood_pressure_systolic=self.random.randint(100, 160),
+                        blood_pressure_diastolic=self.random.randint(60, 100),
+                        pulse_rate=self.random.randint(55, 110),
+                        is_confidential=self.random.random() < 0.05,
+                    )
+                    records.append(record)
+                    access_logs.extend(
+                        MedicalRecordAccess(
+                            medical_record=record,
+                            user_id=self.random.choice((doctor.user_id, patient.user_id)),
+                            access_reason='Viewed record',
+                        )
+                        for _ in range(self.access_logs_per_record)
+                    )
+
+            if len(appointments) >= self.batch_size or index == len(doctors) - 1:
+                # Appointments first: the other rows point at them
+                self.insert(Appointment, appointments)
+                self.insert(AppointmentReminder, reminders)
+                self.insert(MedicalRecord, records)
+                self.insert(MedicalRecordAccess, access_logs)
+                appointments, reminders, records, access_logs = [], [], [], []
+                self.log(f"  {self.counts.get('Appointment', 0)} appointments")
+
+
+def flush_seeded_data():
+    """
+    Delete everything that belongs to seeded users. Reference data
+    (specializations, appointment types, insurance providers) is kept.
+    """
+    users = User.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}")
+    doctors = DoctorProfile.objects.filter(user__in=users)
+    patients = PatientProfile.objects.filter(user__in=users)
+    appointments = Appointment.objects.filter(doctor__in=doctors)
+
+    # Children first, and with the tombstone and event receivers
+    # disconnected: Django then deletes each model in bulk rather than
+    # collecting its rows and sending signals for each, and the cascades
+    # find nothing left to delete
+    with transaction.atomic(), untracked_deletions(), unpublished_events():
+        MedicalRecordAccess.objects.filter(user__in=users).delete()
+        MedicalRecord.objects.filter(doctor__in=doctors).delete()
+        AppointmentReminder.objects.filter(appointment__in=appointments).delete()
+        appointments.update(original_appointment=None)
+        appointments.delete()
+        PatientInsurance.objects.filter(patient__in=patients).delete()
+        DoctorAvailability.objects.filter(doctor__in=doctors).delete()
+        DoctorTimeOff.objects.filter(doctor__in=doctors).delete()
+        DoctorProfile.specialization.through.objects.filter(doctorprofile__in=doctors).delete()
+        doctors.delete()
+        patients.delete()
+        return users.delete()[0]
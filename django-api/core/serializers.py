@@ -0,0 +1,33 @@
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that can be narrowed to a subset of its fields and can
+    replace relations with nested objects.
+
+    - `fields`: names of the fields to keep (sparse fieldset)
+    - `expand`: names of relations to render with the serializer declared
+      for them in Meta.expandable_fields, as a class or dotted path
+
+    Meta.field_dependencies maps fields whose data can't be inferred from
+    their source (e.g. SerializerMethodField) to the lookups they read, so
+    views can prepare querysets for them (see core.views.SparseFieldsetMixin).
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        expandable_fields = getattr(self.Meta, 'expandable_fields', {})
+        for field_name in expand or ():
+            if field_name not in expandable_fields or field_name not in self.fields:
+                continue
+            serializer_class = expandable_fields[field_name]
+            if isinstance(serializer_class, str):
+                serializer_class = import_string(serializer_class)
+            self.fields[field_name] = serializer_class(read_only=True)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
@@ -0,0 +1,218 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Request being handled, set by core.middleware.SlowQueryLogMiddleware. Its
+# view is only resolved when a slow query is logged.
+current_request = ContextVar('current_request', default=None)
+
+_explaining = threading.local()
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Reduce a statement to its shape: literals and placeholders become `?`
+    and IN lists of any length collapse to `IN (...)`.
+    """
+    sql = sql.replace('%s', '?')
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()[:16]
+
+
+def project_stack():
+    """
+    The current call stack limited to frames from this project's code.
+    """
+    base_dir = os.path.join(str(settings.BASE_DIR), '')
+    frames = []
+    for frame in traceback.extract_stack()[:-1]:
+        filename = frame.filename
+        if not filename.startswith(base_dir) or filename == __file__ or 'site-packages' in filename:
+            continue
+        frames.append(f"{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}")
+    return frames
+
+
+def run_explain(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def explain(connection, sql, params):
+    """
+    Return the query plan of a SELECT as a list of lines, or None when the
+    database or statement isn't supported.
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+
+    _explaining.active = True
+    try:
+        # A savepoint, so a failing EXPLAIN can't break the caller's
+        # transaction. Outside one, atomic() would start a transaction, which
+        # takes SQLite's write lock with transaction_mode IMMEDIATE.
+        if connection.in_atomic_block:
+            with transaction.atomic(using=connection.alias):
+                rows = run_explain(connection, prefix + sql, params)
+        else:
+            rows = run_explain(connection, prefix + sql, params)
+    except Exception as exc:
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        _explaining.active = False
+
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail): indent each step under its parent
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            lines.append('  ' * (depth[node_id] - 1) + detail)
+        return lines
+    return [row[0] for row in rows]
+
+
+class SlowQueryLog:
+    """
+    Ring buffer of the slow queries seen by this process.
+
+    With settings.SLOW_QUERY_LOG_DIR set, the buffer is also written to a
+    file per process in that directory (slow queries are rare, so on every
+    entry), which is where the `slow_queries` management command reads them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.entries = deque()
+
+    def _check_pid(self):
+        # Entries recorded before a fork belong to the parent process
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self.entries = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+
+    def record(self, entry):
+        with self._lock:
+            self._check_pid()
+            self.entries.append(entry)
+            entries = list(self.entries)
+
+        directory = settings.SLOW_QUERY_LOG_DIR
+        if directory:
+            write_entries(directory, f"slow-queries-{self._pid}.json", entries)
+
+    def clear(self):
+        with self._lock:
+            self._check_pid()
+            self.entries.clear()
+
+
+def write_entries(directory, filename, entries):
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.slow-queries-')
+    try:
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(entries, temp_file)
+        os.replace(temp_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_entries(directory):
+    """
+    All entries logged to `directory` by any process, oldest first.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(directory, 'slow-queries-*.json')):
+        try:
+            with open(path) as log_file:
+                entries.extend(json.load(log_file))
+        except (OSError, ValueError):
+            continue
+    return sorted(entries, key=lambda entry: entry['logged_at'])
+
+
+def clear_entries(directory):
+    for path in glob.glob(os.path.join(directory, 'slow-queries-*.json')):
+        os.remove(path)
+
+
+slow_query_log = SlowQueryLog()
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper logging every query slower than
+    settings.SLOW_QUERY_THRESHOLD_MS, with its plan.
+    """
+    if getattr(_explaining, 'active', False):
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - start) * 1000
+
+    if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+        # core.middleware imports this module
+        from core.middleware import resolve_view_labels
+
+        connection = context['connection']
+        request = current_request.get()
+        view = '.'.join(resolve_view_labels(request)) if request is not None else None
+        slow_query_log.record({
+            'logged_at': timezone.now().isoformat(),
+            'database': connection.alias,
+            'duration_ms': round(duration_ms, 3),
+            'fingerprint': fingerprint(sql),
+            # Parameters are left out on purpose: they can hold patient data
+            'sql': sql,
+            'view': view,
+            'stack': project_stack(),
+            'plan': None if many else explain(connection, sql, params),
+        })
+    return result
+
+
+def install(connection, **kwargs):
+    """
+    connection_created handler adding log_slow_queries to every connection.
+    """
+    if settings.SLOW_QUERY_THRESHOLD_MS is None:
+        return
+    if log_slow_queries not in connection.execute_wrappers:
+        # First, because connection.execute_wrapper() pops the last wrapper
+        # when it exits, and connections are often opened inside one
+        connection.execute_wrappers.insert(0, log_slow_queries)
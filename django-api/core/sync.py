@@ -0,0 +1,213 @@
+"""
+Delta sync for offline clients.
+
+A doctor keeps their appointments, reminders, medical records and weekly
+availability locally, a patient their appointments, reminders and medical
+records. The first sync returns everything with a change token; passing
+the token back returns only what changed since: the rows updated since
+(by `updated_at`, on the (owner, updated_at) indexes) and the ids of the
+rows deleted since, from Tombstone.
+
+Tokens overlap by settings.SYNC_OVERLAP_SECONDS so a row committed late
+with an earlier `updated_at` isn't missed; clients apply upserts by id, so
+seeing a row twice is harmless. A token older than the tombstone retention
+gets a full snapshot again, flagged with `reset`.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from appointments.models import Appointment, AppointmentReminder
+from appointments.serializers import AppointmentReminderSerializer, AppointmentSerializer
+from core.models import Tombstone
+from doctor_management.models import DoctorAvailability
+from doctor_management.serializers import DoctorAvailabilitySerializer
+from medical_records.models import MedicalRecord
+from medical_records.serializers import MedicalRecordSummarySerializer
+
+TOKEN_SALT = 'core.sync'
+
+def reminder_owners(row, origin):
+    """
+    The owners of a deleted reminder. Those deleted along with their
+    appointment take them from it (see note_appointment_owners()) rather
+    than loading each appointment again.
+    """
+    owners = getattr(origin, '_appointment_owners', {}).get(row.appointment_id)
+    return owners or (row.appointment.doctor_id, row.appointment.patient_id)
+
+
+# Collection of each synced model, and the (doctor id, patient id) owning a
+# row, recorded in its tombstone, given the row and the origin of the delete
+TRACKED_MODELS = {
+    Appointment: ('appointments', lambda row, origin: (row.doctor_id, row.patient_id)),
+    AppointmentReminder: ('reminders', reminder_owners),
+    MedicalRecord: ('medical_records', lambda row, origin: (row.doctor_id, row.patient_id)),
+    DoctorAvailability: ('availabilities', lambda row, origin: (row.doctor_id, None)),
+}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def note_appointment_owners(sender, instance, origin=None, **kwargs):
+    """
+    pre_delete handler keeping the owners of the appointments being deleted
+    on the origin of the delete (the instance or queryset deleted), for the
+    tombstones of their reminders, which are deleted first by cascade.
+    """
+    if origin is not None:
+        owners = origin.__dict__.setdefault('_appointment_owners', {})
+        owners[instance.pk] = (instance.doctor_id, instance.patient_id)
+
+
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    """
+    post_delete handler recording the deletion of a synced row. Being a
+    signal, it also covers rows deleted by cascade.
+    """
+    collection, owners = TRACKED_MODELS[sender]
+    doctor_id, patient_id = owners(instance, origin)
+    Tombstone.objects.create(
+        collection=collection, object_id=instance.pk, doctor_id=doctor_id, patient_id=patient_id
+    )
+
+
+def track_deletions():
+    pre_delete.connect(note_appointment_owners, sender=Appointment, dispatch_uid='tombstone:owners')
+    for model in TRACKED_MODELS:
+        post_delete.connect(record_tombstone, sender=model, dispatch_uid=f"tombstone:{model._meta.label_lower}")
+
+
+@contextmanager
+def untracked_deletions():
+    """
+    Delete without tombstones, for data no client syncs. Without a
+    post_delete receiver, querysets of the tracked models are deleted in a
+    single statement again instead of row by row.
+    """
+    pre_delete.disconnect(sender=Appointment, dispatch_uid='tombstone:owners')
+    for model in TRACKED_MODELS:
+        post_delete.disconnect(sender=model, dispatch_uid=f"tombstone:{model._meta.label_lower}")
+    try:
+        yield
+    finally:
+        track_deletions()
+
+
+def purge_tombstones(now=None):
+    """
+    Delete the tombstones past their retention, returning how many.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+def make_token(moment):
+    return signing.dumps(moment.isoformat(), salt=TOKEN_SALT)
+
+
+def parse_since(token=None, updated_since=None):
+    """
+    The moment a client last synced, from a change token or an ISO 8601
+    `updated_since`, or None for a first sync.
+    """
+    if token:
+        try:
+            return parse_datetime(signing.loads(token, salt=TOKEN_SALT))
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidToken("Invalid change token.")
+    if updated_since:
+        try:
+            moment = parse_datetime(updated_since)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise InvalidToken("updated_since must be an ISO 8601 datetime.")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+    return None
+
+
+def collections(user):
+    """
+    What `user` keeps in sync: the filter of their tombstones, and
+    {collection: (queryset, serializer class, hidden)}, where `hidden` holds
+    the rows the user may no longer see, which are sent as deletions.
+    (None, None) for users who are neither doctors nor patients.
+    """
+    if hasattr(user, 'doctorprofile'):
+        doctor = user.doctorprofile
+        return Q(doctor_id=doctor.id), {
+            'appointments': (Appointment.objects.filter(doctor=doctor), AppointmentSerializer, None),
+            'reminders': (
+                AppointmentReminder.objects.filter(appointment__doctor=doctor), AppointmentReminderSerializer, None
+            ),
+            'medical_records': (
+                MedicalRecord.objects.filter(doctor=doctor).with_summary(), MedicalRecordSummarySerializer, None
+            ),
+            'availabilities': (DoctorAvailability.objects.filter(doctor=doctor), DoctorAvailabilitySerializer, None),
+        }
+    if hasattr(user, 'patientprofile'):
+        patient = user.patientprofile
+        records = MedicalRecord.objects.filter(patient=patient)
+        return Q(patient_id=patient.id), {
+            'appointments': (Appointment.objects.filter(patient=patient), AppointmentSerializer, None),
+            'reminders': (
+                AppointmentReminder.objects.filter(appointment__patient=patient), AppointmentReminderSerializer, None
+            ),
+            # Like my_records: confidential records wait for the doctor's explanation
+            'medical_records': (
+                records.filter(is_confidential=False).with_summary(), MedicalRecordSummarySerializer,
+                records.filter(is_confidential=True)
+            ),
+        }
+    return None, None
+
+
+def tombstones(owner, names, since):
+    """
+    Ids of the rows deleted since `since`, by collection.
+    """
+    deleted = {name: [] for name in names}
+    rows = Tombstone.objects.filter(owner, collection__in=names, deleted_at__gte=since)
+    for collection, object_id in rows.values_list('collection', 'object_id'):
+        deleted[collection].append(object_id)
+    return deleted
+
+
+def sync(user, since, serialize):
+    """
+    The changes of `user` since `since` (None for everything), with the
+    token for the next sync, or None if the user has nothing to sync.
+    `serialize(queryset, serializer_class)` returns the serialized rows.
+    """
+    now = timezone.now()
+    owner, owned = collections(user)
+    if owned is None:
+        return None
+    reset = since is None or since < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    since = None if reset else since - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+
+    deleted = {name: [] for name in owned} if reset else tombstones(owner, list(owned), since)
+    changes = {}
+    for name, (queryset, serializer_class, hidden) in owned.items():
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+            if hidden is not None:
+                deleted[name].extend(hidden.filter(updated_at__gte=since).values_list('id', flat=True))
+        changes[name] = {
+            'upserts': serialize(queryset.order_by('updated_at'), serializer_class),
+            'deletes': deleted[name],
+        }
+    return {'token': make_token(now), 'reset': reset, 'changes': changes}
@@ -1,3 +1,844 @@
-from django.test import TestCase
+import asyncio
+import io
+import uuid
+from decimal import Decimal
+import tempfile
+import time
+from unittest import mock
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.management import call_command
+from datetime import timedelta
+from django.db import connection, connections
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+from accounts.models import User
+from accounts.views import UserViewSet
+from appointments.models import Appointment, AppointmentReminder
+from appointments.views import (
+    AppointmentReminderViewSet, AppointmentTypeViewSet, AppointmentViewSet, AsyncDoctorScheduleView,
+    AsyncMyAppointmentsView,
+)
+from core.benchmark import Benchmark, JSONBenchmark
+from core.db import observe_queries, pragma_statement, read_pragmas
+from core.events import RESET, LocalBroker, get_broker
+from core.ids import new_id, uuid7
+from core.metrics import MetricsRegistry, registry, render_prometheus
+from core.middleware import ReplicaRoutingMiddleware, RequestMetricsMiddleware
+from core.idempotency import claim, purge_idempotency_keys
+from core.jobs import Worker, enqueue, job, purge_jobs, requeue_stale
+from core.models import IdempotencyKey, Job, Tombstone
+from core.parsers import FastJSONParser
+from core.query_audit import audit_viewsets, plan_issues, routed_viewsets
+from core.query_budget import QueryBudgetExceeded, QueryBudgetTestMixin, QueryRecorder
+from core.renderers import FastJSONRenderer
+from core.routers import ReplicaRouter, use_primary
+from core.seeding import LoadSeeder, flush_seeded_data
+from core.slow_queries import explain, normalize_sql, read_entries, slow_query_log
+from core.sync import make_token, purge_tombstones
+from core.views import SyncView
+from doctor_management.models import DoctorProfile, Specialization
+from doctor_management.views import (
+    AsyncAvailableSlotsView, AsyncDoctorListView, DoctorAvailabilityViewSet, DoctorProfileViewSet,
+    DoctorTimeOffViewSet, SpecializationViewSet,
+)
+from medical_records.models import MedicalRecord
+from medical_records.views import MedicalImageViewSet, MedicalRecordAccessViewSet, MedicalRecordViewSet
+from patient_management.models import PatientInsurance
+from patient_management.views import InsuranceProviderViewSet, PatientInsuranceViewSet, PatientProfileViewSet
 
-# Create your tests here.
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        registry.clear()
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com', password='adminpassword', role="ADMIN"
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='patientpassword', role="PATIENT"
+        )
+
+    def test_request_is_recorded_per_view_and_action(self):
+        self.client.force_authenticate(user=self.admin_user)
+        self.client.get(reverse('user-list'))
+
+        samples = registry.collect()
+        labels = (('view', 'UserViewSet'), ('action', 'list'))
+        self.assertEqual(samples[('http_requests_total', labels + (('status', '200'),))], 1)
+
+        queries = samples[('http_request_db_queries', labels)]
+        self.assertEqual(queries[-1], 1)
+        self.assertGreaterEqual(queries[-2], 1)
+        self.assertGreater(samples[('http_response_size_bytes', labels)][-2], 0)
+
+    def test_metrics_endpoint_admin_only(self):
+        self.client.force_authenticate(user=self.patient_user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_requests_total{view="MetricsView",action="get",status="403"} 1', body)
+
+
+class MetricsRegistryTests(TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = MetricsRegistry()
+        for query_count in (0, 2, 2, 500):
+            metrics.observe('http_request_db_queries', (('view', 'v'), ('action', 'a')), query_count)
+
+        body = render_prometheus(metrics.collect())
+        self.assertIn('http_request_db_queries_bucket{view="v",action="a",le="0"} 1', body)
+        self.assertIn('http_request_db_queries_bucket{view="v",action="a",le="2"} 3', body)
+        self.assertIn('http_request_db_queries_bucket{view="v",action="a",le="100"} 3', body)
+        self.assertIn('http_request_db_queries_bucket{view="v",action="a",le="+Inf"} 4', body)
+        self.assertIn('http_request_db_queries_sum{view="v",action="a"} 504', body)
+        self.assertIn('http_request_db_queries_count{view="v",action="a"} 4', body)
+
+    def test_multiprocess_totals(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            # Two workers of the same server
+            first, second = MetricsRegistry(), MetricsRegistry()
+            first.observe_request('AppointmentViewSet', 'list', 200, 0.02, 3, 0.01, 512)
+            second.observe_request('AppointmentViewSet', 'list', 200, 0.3, 3, 0.2, 512)
+            second.observe_request('AppointmentViewSet', 'list', 404, 0.01, 1, 0.001, 20)
+            first.flush()
+
+            samples = second.collect()
+
+        labels = (('view', 'AppointmentViewSet'), ('action', 'list'))
+        self.assertEqual(samples[('http_requests_total', labels + (('status', '200'),))], 2)
+        self.assertEqual(samples[('http_requests_total', labels + (('status', '404'),))], 1)
+        self.assertEqual(samples[('http_request_duration_seconds', labels)][-1], 3)
+
+
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.log_dir.cleanup)
+        slow_query_log.clear()
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com', password='adminpassword', role="ADMIN"
+        )
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "a" FROM "t"\n WHERE "b" IN (%s, %s, %s) AND "c" = \'x\' LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "b" IN (...) AND "c" = ? LIMIT ?'
+        )
+
+    def test_slow_queries_are_logged_with_view_and_plan(self):
+        self.client.force_authenticate(user=self.admin_user)
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_DIR=self.log_dir.name):
+            self.client.get(reverse('user-list'))
+
+        entries = [e for e in read_entries(self.log_dir.name) if e['view'] == 'UserViewSet.list']
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertIn('FROM "accounts_user"', entry['sql'])
+        self.assertEqual(len(entry['fingerprint']), 16)
+        self.assertTrue(any('SCAN' in line or 'SEARCH' in line for line in entry['plan']))
+
+        out = io.StringIO()
+        with override_settings(SLOW_QUERY_LOG_DIR=self.log_dir.name):
+            call_command('slow_queries', '--summary', '--view', 'UserViewSet.list', stdout=out)
+        self.assertIn(entry['fingerprint'], out.getvalue())
+        self.assertIn('1x', out.getvalue())
+
+    def test_explain_outside_a_transaction_starts_none(self):
+        db = connections['default']
+        with mock.patch.object(db, 'in_atomic_block', False), mock.patch('core.slow_queries.transaction') as tx:
+            plan = explain(db, 'SELECT "id" FROM "accounts_user"', ())
+        tx.atomic.assert_not_called()
+        self.assertTrue(plan and not plan[0].startswith('EXPLAIN failed'))
+
+        with mock.patch('core.slow_queries.transaction') as tx:
+            explain(db, 'SELECT "id" FROM "accounts_user"', ())
+        tx.atomic.assert_called_once_with(using='default')
+
+
+class LoadSeedingTests(TestCase):
+    def test_seed_and_benchmark(self):
+        counts = LoadSeeder(doctors=3, patients=10, appointments=60, seed=1).run()
+        self.assertEqual(counts['Appointment'], 60)
+        self.assertEqual(Appointment.objects.count(), 60)
+
+        report = Benchmark(iterations=2, warmup=0, host='testserver').run()
+        self.assertEqual(report['meta']['rows']['appointments'], 60)
+        self.assertEqual(set(report['results']), set(Benchmark.scenarios))
+        for scenario, result in report['results'].items():
+            self.assertEqual(result['status_codes'], {'200': 2}, scenario)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+
+    def test_flush_deletes_in_bulk(self):
+        query_counts = []
+        for appointments in (20, 60):
+            LoadSeeder(doctors=2, patients=5, appointments=appointments, seed=1).run()
+            with mock.patch('core.events.publish') as publish, self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    flush_seeded_data()
+            publish.assert_not_called()
+            query_counts.append(len(queries))
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(Tombstone.objects.exists())
+        # The same statements however many rows there are
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    # (doctors, patients, appointments): budgets must hold however much data there is
+    sizes = [(2, 5, 20), (6, 40, 400)]
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@example.com', password='adminpassword', role="ADMIN"
+        )
+
+    def get_as(self, user, view_class, action, url, data=None):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        with self.subTest(view=view_class.__name__, action=action, role=user.role):
+            with self.assertWithinQueryBudget(view_class, action):
+                response = self.client.get(url, data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def check_budgets(self):
+        doctor = DoctorProfile.objects.filter(appointments__isnull=False).select_related('user').first()
+        record = MedicalRecord.objects.select_related('patient__user').first()
+        patient = record.patient
+        appointment = Appointment.objects.filter(patient=patient).first()
+        reminder = AppointmentReminder.objects.first()
+        insurance = PatientInsurance.objects.first()
+        admin, doctor_user, patient_user = self.admin_user, doctor.user, patient.user
+
+        for user in (admin, doctor_user, patient_user):
+            for view_class, name in [
+                (AppointmentViewSet, 'appointment-list'),
+                (AppointmentTypeViewSet, 'appointmenttype-list'),
+                (AppointmentReminderViewSet, 'appointmentreminder-list'),
+                (SpecializationViewSet, 'specialization-list'),
+                (DoctorProfileViewSet, 'doctorprofile-list'),
+                (DoctorAvailabilityViewSet, 'doctoravailability-list'),
+                (DoctorTimeOffViewSet, 'doctortimeoff-list'),
+                (MedicalRecordViewSet, 'medicalrecord-list'),
+                (MedicalImageViewSet, 'medicalimage-list'),
+                (MedicalRecordAccessViewSet, 'medicalrecordaccess-list'),
+                (InsuranceProviderViewSet, 'insuranceprovider-list'),
+            ]:
+                self.get_as(user, view_class, 'list', reverse(name))
+            self.get_as(user, UserViewSet, 'me', reverse('user-me'))
+            self.get_as(user, DoctorProfileViewSet, 'retrieve', reverse('doctorprofile-detail', args=[doctor.id]))
+            self.get_as(user, AsyncDoctorListView, 'get', reverse('async-doctorprofile-list'))
+
+        self.get_as(admin, UserViewSet, 'list', reverse('user-list'))
+        self.get_as(admin, PatientProfileViewSet, 'list', reverse('patientprofile-list'))
+        self.get_as(admin, PatientProfileViewSet, 'retrieve', reverse('patientprofile-detail', args=[patient.id]))
+        self.get_as(admin, PatientInsuranceViewSet, 'list', reverse('patientinsurance-list'))
+        self.get_as(admin, PatientInsuranceViewSet, 'retrieve', reverse('patientinsurance-detail', args=[insurance.id]))
+        self.get_as(admin, AppointmentReminderViewSet, 'retrieve', reverse('appointmentreminder-detail', args=[reminder.id]))
+        for user in (admin, doctor_user):
+            for action in ('availabilities', 'time_offs'):
+                url = reverse(f"doctorprofile-{action.replace('_', '-')}", args=[doctor.id])
+                self.get_as(user, DoctorProfileViewSet, action, url)
+
+        self.get_as(doctor_user, AppointmentViewSet, 'doctor_schedule', reverse('appointment-doctor-schedule'))
+        self.get_as(doctor_user, AsyncDoctorScheduleView, 'get', reverse('async-appointment-doctor-schedule'))
+        self.get_as(doctor_user, DoctorProfileViewSet, 'me', reverse('doctorprofile-me'))
+        day = doctor.availabilities.first().day_of_week
+        date = timezone.localdate() + timedelta(days=(day - timezone.localdate().weekday()) % 7)
+        self.get_as(
+            doctor_user, DoctorProfileViewSet, 'available_slots',
+            reverse('doctorprofile-available-slots', args=[doctor.id]), {'date': date.isoformat()}
+        )
+        self.get_as(
+            doctor_user, AsyncAvailableSlotsView, 'get',
+            reverse('async-doctorprofile-available-slots', args=[doctor.id]), {'date': date.isoformat()}
+        )
+
+        self.get_as(patient_user, AppointmentViewSet, 'my_appointments', reverse('appointment-my-appointments'))
+        self.get_as(patient_user, AsyncMyAppointmentsView, 'get', reverse('async-appointment-my-appointments'))
+        self.get_as(patient_user, AppointmentViewSet, 'retrieve', reverse('appointment-detail', args=[appointment.id]))
+        self.get_as(patient_user, MedicalRecordViewSet, 'my_records', reverse('medicalrecord-my-records'))
+        self.get_as(patient_user, MedicalRecordViewSet, 'retrieve', reverse('medicalrecord-detail', args=[record.id]))
+        self.get_as(patient_user, PatientProfileViewSet, 'me', reverse('patientprofile-me'))
+        for user in (doctor_user, patient_user):
+            self.get_as(user, SyncView, 'get', reverse('sync'))
+
+    def test_middleware_warns_or_fails_over_budget(self):
+        self.client.force_authenticate(user=self.admin_user)
+        with mock.patch.object(UserViewSet, 'query_budgets', {'list': 0}):
+            with override_settings(DEBUG=True, QUERY_BUDGET_MODE='warn'):
+                with self.assertLogs('core.middleware', 'WARNING') as logs:
+                    response = self.client.get(reverse('user-list'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('UserViewSet.list ran 1 queries, over its budget of 0', logs.output[0])
+
+            self.client = self.client_class()
+            self.client.force_authenticate(user=self.admin_user)
+            with override_settings(DEBUG=True, QUERY_BUDGET_MODE='fail'):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse('user-list'))
+
+    def test_budgets_hold_for_every_data_size(self):
+        for doctors, patients, appointments in self.sizes:
+            flush_seeded_data()
+            LoadSeeder(doctors=doctors, patients=patients, appointments=appointments, seed=1).run()
+            self.check_budgets()
+
+
+class SQLiteProfileTests(TestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        pragmas = {'synchronous': 'NORMAL', 'cache_size': -1024, 'busy_timeout': 1234}
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            new_connection = connections.create_connection('default')
+            self.addCleanup(new_connection.close)
+            new_connection.ensure_connection()
+            self.assertEqual(read_pragmas(new_connection), {'synchronous': 1, 'cache_size': -1024, 'busy_timeout': 1234})
+
+    def test_pragma_values_are_validated(self):
+        self.assertEqual(pragma_statement('journal_mode', 'wal'), 'PRAGMA journal_mode = WAL')
+        with self.assertRaises(ValueError):
+            pragma_statement('journal_mode', 'WAL; DROP TABLE accounts_user')
+        with self.assertRaises(ValueError):
+            pragma_statement('mmap_size', '1; DROP TABLE accounts_user')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=30)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.routed_to = []
+
+        def get_response(request):
+            self.routed_to.append(self.router.db_for_read(Appointment))
+            return HttpResponse(status=request.GET.get('status', 200))
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+        self.factory = RequestFactory(HTTP_AUTHORIZATION='Token abc')
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Appointment), 'replica1')
+        self.assertEqual(self.router.db_for_write(Appointment), 'default')
+        self.assertEqual(self.router.db_for_read(Token), 'default')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Appointment), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'appointments'))
+
+    def test_client_sticks_to_primary_after_a_write(self):
+        self.middleware(self.factory.get('/'))
+        self.middleware(self.factory.post('/?status=400'))
+        self.middleware(self.factory.get('/'))
+        self.assertEqual(self.routed_to, ['replica1', 'default', 'replica1'])
+
+        self.middleware(self.factory.post('/'))
+        self.middleware(self.factory.get('/'))
+        self.middleware(RequestFactory(HTTP_AUTHORIZATION='Token other').get('/'))
+        self.assertEqual(self.routed_to[3:], ['default', 'default', 'replica1'])
+
+        # The window is over
+        cache.clear()
+        self.middleware(self.factory.get('/'))
+        self.assertEqual(self.routed_to[-1], 'replica1')
+
+    async def test_async_client_sticks_to_primary_after_a_write(self):
+        async def get_response(request):
+            self.routed_to.append(self.router.db_for_read(Appointment))
+            return HttpResponse(status=request.GET.get('status', 200))
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(self.factory.get('/'))
+        await middleware(self.factory.post('/'))
+        await middleware(self.factory.get('/'))
+        self.assertEqual(self.routed_to, ['replica1', 'default', 'default'])
+
+
+class AsyncMiddlewareTests(TestCase):
+    @override_settings(
+        METRICS_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=200, DEBUG=True, QUERY_BUDGET_MODE='warn',
+        DATABASE_REPLICAS=['replica1'],
+    )
+    def test_asgi_chain_is_not_adapted_to_sync(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_queries_observed_across_threads(self):
+        # Async ORM queries run in another thread, on its connections
+        with observe_queries(QueryRecorder()) as recorder:
+            await User.objects.acount()
+            await sync_to_async(User.objects.count)()
+        self.assertEqual(len(recorder.statements), 2)
+
+    @override_settings(METRICS_ENABLED=True)
+    async def test_async_request_metrics_count_queries(self):
+        async def get_response(request):
+            await User.objects.acount()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(get_response)
+        with mock.patch.object(registry, 'observe_request') as observe_request:
+            await middleware(RequestFactory().get('/'))
+        view, action, status_code, duration, queries, *_ = observe_request.call_args.args
+        self.assertEqual((view, action, status_code, queries), ('unresolved', 'get', 200, 1))
+
+
+class TimeOrderedIdTests(TestCase):
+    def test_uuid7_layout_and_order(self):
+        before = time.time_ns() // 1_000_000
+        ids = [uuid7() for _ in range(5000)]
+        after = time.time_ns() // 1_000_000
+
+        self.assertEqual({value.version for value in ids}, {7})
+        self.assertEqual({value.variant for value in ids}, {ids[0].variant})
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertLessEqual(before, ids[0].int >> 80)
+        self.assertLessEqual(ids[-1].int >> 80, after + 1)
+
+    def test_new_id_follows_setting(self):
+        with override_settings(TIME_ORDERED_IDS=True):
+            self.assertEqual(new_id().version, 7)
+            self.assertEqual(User.objects.create_user(email='v7@example.com', password='x').id.version, 7)
+        with override_settings(TIME_ORDERED_IDS=False):
+            self.assertEqual(new_id().version, 4)
+
+
+class QueryAuditTests(TestCase):
+    def test_plan_issues(self):
+        plan = [
+            'SCAN appointments_appointment',
+            'SCAN medical_records_medicalrecord USING INDEX medical_rec_patient_a8c112_idx',
+            '  SEARCH accounts_user USING INDEX sqlite_autoindex_accounts_user_1 (id=?)',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(plan_issues('sqlite', plan), [
+            ('full scan', 'SCAN appointments_appointment'),
+            ('temp b-tree sort', 'USE TEMP B-TREE FOR ORDER BY'),
+        ])
+        self.assertEqual(
+            [issue for issue, _ in plan_issues('postgresql', [
+                'Sort  (cost=10.1..10.2 rows=1 width=8)',
+                '  ->  Seq Scan on appointments_appointment  (cost=0.00..1.01 rows=1 width=8)',
+                'Index Scan using medical_rec_patient_a8c112_idx on medical_records_medicalrecord',
+            ])],
+            ['sort', 'full scan'],
+        )
+
+    def test_audit_every_viewset_and_role(self):
+        LoadSeeder(doctors=3, patients=10, appointments=60, seed=1).run()
+        User.objects.create_superuser(email='audit-admin@example.com', password='x')
+
+        results = audit_viewsets()
+        self.assertIn(MedicalRecordViewSet, routed_viewsets())
+        self.assertEqual(len(results), 3 * len(routed_viewsets()))
+        self.assertEqual([result for result in results if result['error']], [])
+
+        out = io.StringIO()
+        call_command('explain_querysets', '--role', 'patient', stdout=out)
+        self.assertIn('MedicalRecordViewSet (patient)', out.getvalue())
+
+
+class FastJSONTests(TestCase):
+    data = [{
+        'id': uuid.UUID('0190b5a4-7c1e-7a3b-8f00-123456789abc'),
+        'consultation_fee': Decimal('125.50'),
+        'start_datetime': timezone.make_aware(timezone.datetime(2026, 3, 1, 9, 30, 15, 250)),
+        'status': gettext_lazy('Scheduled'),
+        'notes': 'Caf\u00e9 \u2028 line',
+        'vitals': {1: 98.6, 'pulse_rate': None},
+    }]
+
+    def test_renders_like_json_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch('core.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+
+    def test_parses_like_json_parser(self):
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"id": '))
+
+    def test_benchmark(self):
+        LoadSeeder(doctors=2, patients=5, appointments=20, seed=1).run()
+        report = JSONBenchmark(iterations=2, host='testserver').run()
+        for payload in JSONBenchmark.payloads:
+            result = report['results'][payload]
+            self.assertGreater(result['items'], 0)
+            self.assertEqual(result['json']['bytes'], result.get('orjson', result['json'])['bytes'])
+
+
+class VersionedCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='cache@example.com', password='x')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.user).key}")
+        self.specialization = Specialization.objects.create(name='Cardiology')
+        self.url = reverse('specialization-list')
+
+    def test_not_modified_and_cached(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        # Only the token lookup is left
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Cardiology'])
+
+        detail_url = reverse('specialization-detail', args=[self.specialization.id])
+        self.assertNotEqual(self.client.get(detail_url)['ETag'], etag)
+
+    def test_save_and_delete_change_the_version(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.specialization.name = 'Neurology'
+            self.specialization.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data], ['Neurology'])
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.specialization.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data, [])
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(QueryBudgetTestMixin, APITestCase):
+    def setUp(self):
+        LoadSeeder(doctors=2, patients=5, appointments=20, seed=1).run()
+        self.doctor = DoctorProfile.objects.filter(appointments__isnull=False).select_related('user').first()
+        self.url = reverse('sync')
+
+    def get_as(self, user, data=None):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return self.client.get(self.url, data)
+
+    def test_first_sync_then_changes(self):
+        response = self.get_as(self.doctor.user)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['reset'])
+        changes = response.data['changes']
+        self.assertEqual(len(changes['appointments']['upserts']), self.doctor.appointments.count())
+        self.assertEqual(len(changes['availabilities']['upserts']), self.doctor.availabilities.count())
+        token = response.data['token']
+
+        response = self.get_as(self.doctor.user, {'token': token})
+        self.assertFalse(response.data['reset'])
+        for name, collection in response.data['changes'].items():
+            self.assertEqual((collection['upserts'], collection['deletes']), ([], []), name)
+
+        appointment = self.doctor.appointments.first()
+        appointment_id = appointment.id
+        reminder_ids = list(appointment.reminders.values_list('id', flat=True))
+        appointment.delete()
+        record = MedicalRecord.objects.filter(doctor=self.doctor).first()
+        record.notes = 'Follow up in two weeks'
+        record.save()
+
+        changes = self.get_as(self.doctor.user, {'token': token}).data['changes']
+        self.assertEqual(changes['appointments']['deletes'], [appointment_id])
+        self.assertCountEqual(changes['reminders']['deletes'], reminder_ids)
+        self.assertEqual([row['id'] for row in changes['medical_records']['upserts']], [str(record.id)])
+
+    def test_reminder_tombstones_take_owners_from_their_appointment(self):
+        appointments = list(Appointment.objects.filter(doctor=self.doctor)[:2])
+        for appointment in appointments:
+            for hours in (1, 24):
+                AppointmentReminder.objects.create(
+                    appointment=appointment, reminder_type='EMAIL', message='Reminder',
+                    scheduled_time=appointment.start_datetime - timedelta(hours=hours),
+                )
+        reminder_ids = list(
+            AppointmentReminder.objects.filter(appointment__in=appointments).values_list('id', flat=True)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            appointments[0].delete()
+            Appointment.objects.filter(pk=appointments[1].pk).delete()
+        appointment_selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and 'FROM "appointments_appointment"' in query['sql']
+        ]
+        # Only the queryset delete's collection of its appointments
+        self.assertEqual(len(appointment_selects), 1)
+
+        tombstones = Tombstone.objects.filter(collection='reminders')
+        self.assertCountEqual(tombstones.values_list('object_id', flat=True), reminder_ids)
+        self.assertEqual(set(tombstones.values_list('doctor_id', flat=True)), {self.doctor.id})
+        self.assertEqual(
+            set(tombstones.values_list('patient_id', flat=True)), {a.patient_id for a in appointments}
+        )
+
+    def test_confidential_records_are_deleted_for_patients(self):
+        record = MedicalRecord.objects.filter(is_confidential=False).select_related('patient__user').first()
+        since = timezone.now().isoformat()
+        record.is_confidential = True
+        record.save()
+
+        token = Token.objects.create(user=record.patient.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        with self.assertWithinQueryBudget(SyncView, 'get'):
+            response = self.client.get(self.url, {'updated_since': since})
+        self.assertEqual(response.data['changes']['medical_records'], {'upserts': [], 'deletes': [record.id]})
+        self.assertNotIn('availabilities', response.data['changes'])
+
+    def test_invalid_and_expired_tokens(self):
+        self.assertEqual(self.get_as(self.doctor.user, {'token': 'nope'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.get_as(self.doctor.user, {'updated_since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        long_ago = (timezone.now() - timedelta(days=365)).isoformat()
+        self.assertTrue(self.get_as(self.doctor.user, {'updated_since': long_ago}).data['reset'])
+
+        admin = User.objects.create_superuser(email='sync-admin@example.com', password='x')
+        self.assertEqual(self.get_as(admin).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_purge_tombstones(self):
+        self.doctor.availabilities.first().delete()
+        Tombstone.objects.create(
+            collection='appointments', object_id=uuid.uuid4(), deleted_at=timezone.now() - timedelta(days=400)
+        )
+        self.assertEqual(purge_tombstones(), 1)
+        self.assertEqual(Tombstone.objects.get().collection, 'availabilities')
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=0.05, EVENTS_MAX_STREAM_SECONDS=0.3)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        LoadSeeder(doctors=2, patients=5, appointments=10, seed=1).run()
+        self.appointment = Appointment.objects.select_related('doctor__user', 'patient__user').first()
+        self.doctor_token = Token.objects.create(user=self.appointment.doctor.user)
+        self.url = reverse('events')
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    async def test_local_broker(self):
+        broker = LocalBroker()
+        async with broker.subscribe(['doctor:1']) as subscription:
+            await asyncio.to_thread(broker.publish, 'doctor:1', 'first')
+            broker.publish('patient:1', 'other')
+            self.assertEqual(await subscription.get(1), 'first')
+            self.assertIsNone(await subscription.get(0.01))
+
+            # A subscriber that falls behind is told to start over
+            for n in range(3):
+                broker.publish('doctor:1', str(n))
+            await asyncio.sleep(0)
+            messages = [await subscription.get(0.01) for _ in range(4)]
+            self.assertEqual(messages, ['0', '1', RESET, None])
+        self.assertEqual(broker.subscriptions, {})
+
+    def test_appointment_changes_are_published(self):
+        channels = [f"doctor:{self.appointment.doctor_id}", f"patient:{self.appointment.patient_id}"]
+        with mock.patch('core.events.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.appointment.status = 'CONFIRMED'
+                self.appointment.save()
+            self.assertEqual(publish.call_count, 1)
+            # Unpublished until the deletion commits
+            self.appointment.delete()
+            self.assertEqual(publish.call_count, 1)
+        self.assertEqual(publish.call_args.args[0], channels)
+        self.assertIn('"action": "updated"', publish.call_args.args[1])
+        self.assertIn('"status": "CONFIRMED"', publish.call_args.args[1])
+
+    async def test_stream_pushes_events(self):
+        response = await self.async_client.get(self.url, headers={'authorization': f"Token {self.doctor_token.key}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+
+        get_broker().publish(f"doctor:{self.appointment.doctor_id}", '{"action": "updated"}')
+        self.assertEqual(await anext(chunks), b'event: appointment\ndata: {"action": "updated"}\n\n')
+        self.assertEqual(await anext(chunks), b': keepalive\n\n')
+        # The stream ends after EVENTS_MAX_STREAM_SECONDS
+        remaining = [chunk async for chunk in chunks]
+        self.assertTrue(remaining and all(chunk == b': keepalive\n\n' for chunk in remaining))
+
+    async def test_stream_token_in_query_string(self):
+        response = await self.async_client.post(reverse('events-token'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.post(
+            reverse('events-token'), headers={'authorization': f"Token {self.doctor_token.key}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = response.json()['token']
+
+        response = await self.async_client.get(self.url, {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+
+        # Tokens are single-purpose and short-lived
+        response = await self.async_client.get(self.url, {'token': make_token(timezone.now())})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.settings(EVENTS_STREAM_TOKEN_SECONDS=-1):
+            response = await self.async_client.get(self.url, {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'Invalid or expired stream token.')
+
+    async def test_stream_rejects_other_users_and_wsgi(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(self.url, headers={'authorization': 'Token invalid'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        admin = await sync_to_async(User.objects.create_superuser)(
+            email='admin@example.com', password='adminpassword', role='ADMIN'
+        )
+        token = await Token.objects.acreate(user=admin)
+        response = await self.async_client.get(self.url, headers={'authorization': f"Token {token.key}"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = await sync_to_async(self.client.get)(
+            self.url, headers={'authorization': f"Token {self.doctor_token.key}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='patient@example.com', password='patientpassword', role="PATIENT")
+
+    def test_claims_of_running_abandoned_and_expired_keys(self):
+        record, created = claim(self.user, 'key', 'a' * 64)
+        self.assertTrue(created)
+        self.assertEqual(claim(self.user, 'key', 'a' * 64), (record, False))
+
+        # A request that never finished gives its key up after IDEMPOTENCY_LOCK_SECONDS
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        taken, created = claim(self.user, 'key', 'a' * 64)
+        self.assertEqual((taken.pk, created), (record.pk, True))
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=201, response={'id': 1})
+        self.assertFalse(claim(self.user, 'key', 'b' * 64)[1])
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(days=2))
+        record, created = claim(self.user, 'key', 'b' * 64)
+        self.assertTrue(created)
+        self.assertIsNone(record.status_code)
+
+    def test_purge_idempotency_keys(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key='old', fingerprint='a' * 64, created_at=timezone.now() - timedelta(days=2)
+        )
+        IdempotencyKey.objects.create(user=self.user, key='new', fingerprint='a' * 64)
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+job_calls = []
+
+
+@job(max_attempts=2)
+def record_job_call(value):
+    job_calls.append(value)
+
+
+@job(max_attempts=2)
+def failing_job():
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        job_calls.clear()
+        registry.clear()
+        self.worker = Worker(name='test-worker')
+
+    def test_jobs_run_in_order_when_due(self):
+        enqueue(record_job_call, value='second', run_at=timezone.now() - timedelta(seconds=1))
+        enqueue(record_job_call, value='first', run_at=timezone.now() - timedelta(seconds=2))
+        later = enqueue(record_job_call, value='later', run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(self.worker.run_pending(), 2)
+        self.assertEqual(job_calls, ['first', 'second'])
+        self.assertEqual(Job.objects.filter(status='DONE', attempts=1).count(), 2)
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'QUEUED')
+
+        # Other queues are left alone
+        enqueue(record_job_call, value='other', run_at=timezone.now())
+        Job.objects.filter(status='QUEUED').update(queue='email', run_at=timezone.now())
+        self.assertEqual(self.worker.run_pending(), 0)
+        self.assertEqual(Worker(['email']).run_pending(), 2)
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        failed = enqueue(failing_job)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(self.worker.run_pending(), 1)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), ('QUEUED', 1))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+        # JOBS_RETRY_BASE_SECONDS, halved at most by the jitter
+        self.assertGreater(failed.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertEqual(self.worker.run_pending(), 0)
+
+        Job.objects.filter(pk=failed.pk).update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.worker.run_pending()
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), ('FAILED', 2))
+        self.assertIsNotNone(failed.finished_at)
+
+        samples = registry.collect()
+        self.assertEqual(samples[('jobs_total', (('job', 'core.tests.failing_job'), ('outcome', 'retried')))], 1)
+        self.assertEqual(samples[('jobs_total', (('job', 'core.tests.failing_job'), ('outcome', 'failed')))], 1)
+        self.assertIn('job_delay_seconds_count', render_prometheus(samples))
+
+    def test_only_job_functions_run(self):
+        Job.objects.create(name='os.remove', kwargs={'path': '/tmp/nothing'})
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.worker.run_pending()
+        self.assertIn('is not a job', Job.objects.get().last_error)
+
+    def test_stale_jobs_are_requeued_and_finished_jobs_purged(self):
+        stale = enqueue(record_job_call, value='stale')
+        claimed = self.worker.claim()
+        self.assertEqual((claimed.pk, claimed.status, claimed.locked_by), (stale.pk, 'RUNNING', 'test-worker'))
+        self.assertIsNone(self.worker.claim())
+
+        self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.worker.run_pending(), 1)
+        self.assertEqual(Job.objects.get().attempts, 2)
+
+        self.assertEqual(purge_jobs(), 0)
+        self.assertEqual(purge_jobs(now=timezone.now() + timedelta(days=30)), 1)
+
+    def test_run_workers_once(self):
+        enqueue(record_job_call, value='queued')
+        out = io.StringIO()
+        call_command('run_workers', '--once', '--queue', 'default', stdout=out)
+        self.assertIn('Ran 1 jobs.', out.getvalue())
+        self.assertEqual(job_calls, ['queued'])
@@ -1,3 +1,469 @@
-from django.shortcuts import render
+import hashlib
+import inspect
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import exceptions, permissions, serializers, status
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.response import Response
+from rest_framework.request import Request
+from rest_framework.views import APIView
+from accounts.permissions import IsAdminUser
+from core.cache import get_cache, get_model_version, response_cache_key
+from core.events import channels_for, event_stream, make_stream_token, parse_stream_token
+from core.metrics import registry, render_prometheus
+from core.renderers import PrometheusTextRenderer
+from core.sync import InvalidToken, parse_since, sync
+from core.serializers import DynamicFieldsModelSerializer
+
+
+class QueryPlan:
+    """
+    The joins, prefetches and columns a serializer needs from its queryset.
+
+    `columns` are the base model's own columns; related models are loaded
+    whole. `complete` turns False as soon as a field reads something that
+    can't be traced back to a column, in which case no column is deferred.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.columns = {queryset.model._meta.pk.name}
+        self.complete = True
+
+    def add_serializer(self, serializer, model, prefix='', prefetched=False):
+        dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+
+        for field_name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+
+            if field_name in dependencies:
+                for lookup in dependencies[field_name]:
+                    self.add_lookup(model, lookup, prefix, prefetched)
+            elif field.source == '*':
+                self.complete = self.complete and not prefix
+            elif not prefix and field.source in self.queryset.query.annotations:
+                pass
+            elif isinstance(field, serializers.ListSerializer):
+                self.add_lookup(model, field.source, prefix, prefetched, field.child)
+            elif isinstance(field, serializers.BaseSerializer):
+                self.add_lookup(model, field.source, prefix, prefetched, field)
+            elif isinstance(field, (ManyRelatedField, RelatedField)) or len(field.source_attrs) > 1:
+                self.add_lookup(model, '__'.join(field.source_attrs), prefix, prefetched)
+            elif isinstance(field, serializers.SerializerMethodField):
+                self.complete = self.complete and bool(prefix)
+            else:
+                self.add_lookup(model, field.source, prefix, prefetched)
+
+    def add_lookup(self, model, lookup, prefix, prefetched, serializer=None):
+        """
+        Walk `lookup` from `model`, joining forward relations with
+        select_related and everything else with prefetch_related, and then
+        let `serializer` (if any) add what it needs from the last model.
+        """
+        hops = lookup.split('__')
+        path = prefix
+
+        for index, hop in enumerate(hops):
+            try:
+                field = model._meta.get_field(hop)
+            except FieldDoesNotExist:
+                # A property or method: nothing to join, but no telling which
+                # columns it reads either.
+                if not path:
+                    self.complete = False
+                return
+
+            is_last = index == len(hops) - 1
+            if not path and field.concrete and not field.many_to_many:
+                self.columns.add(field.name)
+
+            if not field.is_relation:
+                return
+
+            path = f"{path}__{hop}" if path else hop
+            model = field.related_model
+            if is_last and serializer is None:
+                # The relation is rendered as primary key(s)
+                if field.many_to_many or field.one_to_many:
+                    self.prefetch_related.add(path)
+                return
+
+            if not prefetched and field.concrete and (field.many_to_one or field.one_to_one):
+                self.select_related.add(path)
+            else:
+                prefetched = True
+                self.prefetch_related.add(path)
+
+        self.add_serializer(serializer, model, path, prefetched)
+
+    def apply(self, queryset, defer_columns=False):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        if defer_columns and self.complete:
+            columns = set(self.columns)
+            # Relations joined by the view itself can't be deferred either
+            if isinstance(queryset.query.select_related, dict):
+                columns.update(queryset.query.select_related)
+            columns.update(path.split('__')[0] for path in self.select_related)
+            queryset = queryset.only(*sorted(columns))
+        return queryset
+
+
+class SparseFieldsetMixin:
+    """
+    ViewSet mixin adding `?fields=a,b` and `?expand=c` to read requests.
+
+    Besides trimming the response, the serializer's fields decide which
+    relations get joined or prefetched and, for sparse fieldsets, which
+    columns are loaded at all.
+    """
+    fields_param = 'fields'
+    expand_param = 'expand'
+
+    def _query_param_list(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def get_requested_fields(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        return self._query_param_list(self.fields_param)
+
+    def get_expanded_fields(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        return self._query_param_list(self.expand_param)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, DynamicFieldsModelSerializer):
+            kwargs.setdefault('fields', self.get_requested_fields())
+            kwargs.setdefault('expand', self.get_expanded_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def optimize_queryset(self, queryset):
+        """
+        Join, prefetch and select only what the response serializer reads.
+        """
+        serializer = self.get_serializer()
+        plan = QueryPlan(queryset)
+        plan.add_serializer(serializer, queryset.model)
+        return plan.apply(queryset, defer_columns=self.get_requested_fields() is not None)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in SAFE_METHODS:
+            queryset = self.optimize_queryset(queryset)
+        return queryset
+
+
+class VersionedCacheMixin:
+    """
+    ViewSet mixin caching list and retrieve responses under the version of
+    the queryset's model (see core.cache), which must be one of
+    settings.VERSIONED_CACHE_MODELS.
+
+    Responses carry a strong ETag, and a request whose If-None-Match
+    matches it gets a 304 without querying the data. Only for views that
+    return the same list and retrieve responses to every user.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        model = self.queryset.model
+        key = response_cache_key(
+            model, get_model_version(model), self.action, request.get_full_path(), request.accepted_media_type
+        )
+        etag = quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, settings.VERSIONED_CACHE_TIMEOUT)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin for conditional GETs of per-user lists and profiles:
+
+        not_modified = self.check_not_modified(queryset)
+        if not_modified is not None:
+            return not_modified
+
+    The validators come from one aggregate query over the filtered
+    queryset, the newest `updated_at` and the row count, so a match returns
+    the 304 before anything is serialized or logged. Changes to related rows
+    only show when they also touch a field passed in `fields`; pass the
+    to-many relations in `counts` as well, so a deleted related row shows.
+
+    The ETag is weak, and Last-Modified is only informative: a deleted row
+    can leave the newest `updated_at` as it was, so only If-None-Match,
+    which also covers the count, is honoured.
+    """
+
+    def check_not_modified(self, queryset, fields=('updated_at',), counts=()):
+        values = queryset.order_by().aggregate(**self.validator_aggregates(fields, counts))
+        return self.not_modified_response(values, fields, counts)
+
+    async def acheck_not_modified(self, queryset, fields=('updated_at',), counts=()):
+        values = await queryset.order_by().aaggregate(**self.validator_aggregates(fields, counts))
+        return self.not_modified_response(values, fields, counts)
+
+    def validator_aggregates(self, fields, counts=()):
+        # Distinct, as fields across to-many relations join several rows
+        return {
+            'count': Count('pk', distinct=True),
+            **{f'newest_{index}': Max(field) for index, field in enumerate(fields)},
+            **{f'count_{index}': Count(relation, distinct=True) for index, relation in enumerate(counts)},
+        }
+
+    def not_modified_response(self, values, fields, counts=()):
+        request = self.request
+        stamps = [values[f'newest_{index}'] for index in range(len(fields))]
+        parts = [
+            values['count'], *stamps, *(values[f'count_{index}'] for index in range(len(counts))),
+            self.action, request.user.pk, request.get_full_path(), request.accepted_media_type,
+        ]
+        digest = hashlib.sha256('\n'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+        self.conditional_headers = {'ETag': f'W/"{digest}"', 'Cache-Control': 'private, no-cache'}
+        stamps = [stamp for stamp in stamps if stamp is not None]
+        if stamps:
+            self.conditional_headers['Last-Modified'] = http_date(max(stamps).timestamp())
+
+        response = get_conditional_response(request, etag=self.conditional_headers['ETag'])
+        if response is not None:
+            for header, value in self.conditional_headers.items():
+                response[header] = value
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        headers = getattr(self, 'conditional_headers', None)
+        if headers and response.status_code == 200:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+
+class AsyncAPIViewMixin:
+    """
+    APIView mixin for views whose handlers are `async def`, so that under
+    ASGI a request waiting on the database doesn't hold a worker thread.
+
+    DRF's authentication, permissions and throttling are sync (and token
+    authentication queries the database), so they run in a thread before
+    the handler. Handlers read through the async ORM (`afirst()`,
+    `aaggregate()`, `async for`) and must load everything their serializer
+    reads up front (see SparseFieldsetMixin.optimize_queryset): a lazy load
+    on the event loop raises SynchronousOnlyOperation.
+    """
+    # Django's check wants every handler async, APIView.options isn't
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """
+        GenericAPIView.get_object() through the async ORM.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).afirst()
+        if obj is None:
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def alist(self, queryset):
+        """
+        The serialized rows of `queryset`.
+        """
+        rows = [row async for row in queryset]
+        return self.get_serializer(rows, many=True).data
+
+
+class MetricsView(APIView):
+    """
+    Request metrics of the whole server in Prometheus text format (admin only).
+    """
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusTextRenderer]
+    swagger_schema = None
+
+    def get(self, request):
+        return Response(
+            render_prometheus(registry.collect()),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+class SyncView(APIView):
+    """
+    Delta sync of the current doctor's or patient's data (see core.sync).
+    Pass the `token` of the previous response to get only what changed
+    since, or an ISO 8601 `updated_since`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'get': 8}
+
+    def serialize(self, queryset, serializer_class):
+        context = {'request': self.request, 'view': self}
+        plan = QueryPlan(queryset)
+        plan.add_serializer(serializer_class(context=context), queryset.model)
+        return serializer_class(plan.apply(queryset), many=True, context=context).data
+
+    def get(self, request):
+        try:
+            since = parse_since(request.query_params.get('token'), request.query_params.get('updated_since'))
+        except InvalidToken as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = sync(request.user, since, self.serialize)
+        if changes is None:
+            return Response(
+                {'detail': 'Only doctors and patients have data to sync.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(changes)
+
+
+class StreamTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates the `token` query parameter of EventStreamView, issued by
+    EventStreamTokenView.
+    """
+
+    def authenticate(self, request):
+        token = request.query_params.get('token')
+        if token is None:
+            return None
+        user_id = parse_stream_token(token)
+        user = user_id and get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if not user:
+            raise exceptions.AuthenticationFailed('Invalid or expired stream token.')
+        return user, None
+
+
+class EventStreamTokenView(APIView):
+    """
+    Issue a short-lived token opening the current user's event stream, for
+    clients that can't send an Authorization header:
+
+        const {token} = await post('/api/v1/events/token/');
+        new EventSource(`/api/v1/events/?token=${encodeURIComponent(token)}`);
+
+    The token is checked when the stream is opened. When the stream ends, or
+    the connection drops after the token expired, EventSource's reconnection
+    fails with 401 and closes it: fetch a new token and open a new stream.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response({
+            'token': make_stream_token(request.user),
+            'expires_in': settings.EVENTS_STREAM_TOKEN_SECONDS,
+        })
+
+
+class EventStreamView(View):
+    """
+    Server-Sent Events stream of the changes to the current doctor's or
+    patient's appointments (see core.events), authenticated by the API token
+    in the Authorization header or by a stream token in `?token=`. Needs an
+    ASGI server: a WSGI worker would be held by every open stream.
+    """
+    authentication_classes = [StreamTokenAuthentication, TokenAuthentication]
+
+    def authenticate(self, request):
+        drf_request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        user = drf_request.user
+        if not user.is_authenticated:
+            return None, []
+        doctor = getattr(user, 'doctorprofile', None)
+        patient = getattr(user, 'patientprofile', None)
+        return user, channels_for(doctor and doctor.id, patient and patient.id)
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {'detail': 'Event streams are only served by the ASGI application.'},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        try:
+            user, channels = await sync_to_async(self.authenticate)(request)
+        except exceptions.AuthenticationFailed as exc:
+            user, detail = None, str(exc.detail)
+        else:
+            detail = 'Authentication credentials were not provided.'
+        if user is None:
+            response = JsonResponse({'detail': detail}, status=status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        if not channels:
+            return JsonResponse(
+                {'detail': 'Only doctors and patients have appointment events.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        response = StreamingHttpResponse(
+            event_stream(channels, settings.EVENTS_MAX_STREAM_SECONDS), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Keep nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DoctorManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'doctor_management'
+
+    def ready(self):
+        from doctor_management import signals  # noqa: F401
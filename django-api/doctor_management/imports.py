@@ -0,0 +1,153 @@
+"""
+Bulk doctor import (see accounts.imports), for onboarding a clinic.
+
+NDJSON rows have the shape of a DoctorWithUserSerializer request:
+
+    {"user": {"email": ..., "first_name": ..., "last_name": ...},
+     "license_number": "L-1", "specialization_ids": ["Cardiology"],
+     "availabilities": [{"day_of_week": 0, "start_time": "09:00", "end_time": "12:00"}]}
+
+CSV rows are flat: the user columns (email, first_name, last_name,
+phone_number, password), the profile fields, `specializations` and
+`availabilities`, both separated by ";":
+
+    email,...,license_number,specializations,availabilities
+    ann@example.com,...,L-1,Cardiology;Neurology,Monday 09:00-12:00;Wednesday 14:00-17:00
+
+Specializations are given by id or name, days by number (0 is Monday) or
+name. Each doctor's weekly template is checked in memory
+(validate_availability_template()) rather than by DoctorAvailability.clean(),
+which queries the doctor's other availabilities: the specializations and
+availabilities of a chunk are then inserted in one statement each.
+"""
+from rest_framework import serializers
+
+from accounts.imports import ImportUserSerializer, UserImporter
+from doctor_management.models import DoctorAvailability, DoctorProfile, Specialization
+from doctor_management.serializers import (
+    DoctorAvailabilitySerializer, DoctorWithUserSerializer, validate_availability_template
+)
+
+DAYS = {
+    key: number
+    for number, name in DoctorAvailability.DAYS_OF_WEEK
+    for key in (str(number), name.casefold(), name[:3].casefold())
+}
+
+
+def parse_availability(text):
+    """
+    The availability of "<day> <start>-<end>", e.g. "Monday 09:00-12:00",
+    or None.
+    """
+    day, _, hours = text.strip().partition(' ')
+    start_time, _, end_time = hours.strip().partition('-')
+    if day.casefold() not in DAYS or not start_time or not end_time:
+        return None
+    return {'day_of_week': DAYS[day.casefold()], 'start_time': start_time.strip(), 'end_time': end_time.strip()}
+
+
+class DoctorImportSerializer(serializers.ModelSerializer):
+    user = ImportUserSerializer()
+    # Resolved against the specializations loaded once per import
+    specialization_ids = serializers.ListField(
+        child=serializers.CharField(), help_text="Ids or names of the specializations"
+    )
+    availabilities = DoctorAvailabilitySerializer(many=True, required=False)
+
+    class Meta:
+        model = DoctorProfile
+        fields = DoctorWithUserSerializer.Meta.fields
+        extra_kwargs = {
+            # Checked per chunk
+            'license_number': {'validators': []},
+        }
+
+    def validate_availabilities(self, availabilities):
+        return validate_availability_template(availabilities)
+
+
+class DoctorImporter(UserImporter):
+    role = 'DOCTOR'
+    serializer_class = DoctorImportSerializer
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.license_numbers = set()
+        self.specializations = {}
+        names = {}
+        for pk, name in Specialization.objects.values_list('id', 'name'):
+            self.specializations[str(pk)] = pk
+            names.setdefault(name.casefold(), []).append(pk)
+        # Names differing only by case must be given by id
+        self.specializations.update({name: pks[0] for name, pks in names.items() if len(pks) == 1})
+
+    def from_csv(self, values):
+        availabilities = []
+        for text in values.pop('availabilities', '').split(';'):
+            if not text.strip():
+                continue
+            availability = parse_availability(text)
+            if availability is None:
+                return f"Invalid availability {text.strip()!r}, use e.g. 'Monday 09:00-12:00'."
+            availabilities.append(availability)
+
+        specializations = values.pop('specializations', '')
+        row = super().from_csv(values)
+        row['specialization_ids'] = [name.strip() for name in specializations.split(';') if name.strip()]
+        if availabilities:
+            row['availabilities'] = availabilities
+        return row
+
+    def check_row(self, row):
+        specialization_ids, unknown = [], []
+        for specialization in row['specialization_ids']:
+            pk = self.specializations.get(specialization) or self.specializations.get(specialization.casefold())
+            if pk is None:
+                unknown.append(f"Unknown specialization {specialization!r}.")
+            elif pk not in specialization_ids:
+                specialization_ids.append(pk)
+        if unknown:
+            return {'specialization_ids': unknown}
+        row['specialization_ids'] = specialization_ids
+        return None
+
+    def find_clashes(self, entries):
+        clashes = super().find_clashes(entries)
+        existing = set(
+            DoctorProfile.objects.filter(license_number__in=[row['license_number'] for _, row in entries])
+            .values_list('license_number', flat=True)
+        )
+        for line, row in entries:
+            if line in clashes:
+                continue
+            license_number = row['license_number']
+            if license_number in existing:
+                clashes[line] = {'license_number': ["A doctor with this license number already exists."]}
+            elif license_number in self.license_numbers:
+                clashes[line] = {'license_number': ["Duplicate license number in this import."]}
+            else:
+                self.license_numbers.add(license_number)
+        return clashes
+
+    def create_profiles(self, entries):
+        through = DoctorProfile.specialization.through
+        profiles, specializations, availabilities = [], [], []
+        for _, row, user in entries:
+            values = {
+                name: value for name, value in row.items()
+                if name not in ('user', 'specialization_ids', 'availabilities')
+            }
+            profile = DoctorProfile(user=user, **values)
+            profiles.append(profile)
+            specializations.extend(
+                through(doctorprofile_id=profile.pk, specialization_id=pk)
+                for pk in row['specialization_ids']
+            )
+            availabilities.extend(
+                DoctorAvailability(doctor=profile, **availability)
+                for availability in row.get('availabilities', [])
+            )
+        DoctorProfile.objects.bulk_create(profiles)
+        through.objects.bulk_create(specializations)
+        DoctorAvailability.objects.bulk_create(availabilities)
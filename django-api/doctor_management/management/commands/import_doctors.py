@@ -0,0 +1,13 @@
+from accounts.imports import ImportCommand
+from doctor_management.imports import DoctorImporter
+
+
+class Command(ImportCommand):
+    help = (
+        "Create doctors in bulk, with their specializations and weekly availabilities, from a CSV "
+        "or NDJSON file (see doctor_management.imports). Rows that fail are reported by line and "
+        "skipped; the others are inserted in chunks of IMPORT_BATCH_SIZE, one transaction each. "
+        "Users without a password are emailed an invite by the job workers."
+    )
+    importer_class = DoctorImporter
+    noun = 'doctors'
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 02:48
+
+import core.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor_management', '0002_alter_doctoravailability_doctor'),
+    ]
+
+    # Only the Python-side default changes, the columns stay the same:
+    # without this SQLite would rebuild every table.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='doctoravailability',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='doctorprofile',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='doctortimeoff',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='specialization',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
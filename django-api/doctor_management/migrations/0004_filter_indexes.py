@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor_management', '0003_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctortimeoff',
+            index=models.Index(fields=['doctor', 'start_datetime', 'end_datetime'], name='doctor_mana_doctor__acd490_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor_management', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctoravailability',
+            index=models.Index(fields=['doctor', 'updated_at'], name='doctor_mana_doctor__27a25b_idx'),
+        ),
+    ]
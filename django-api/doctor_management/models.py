@@ -57,6 +57,10 @@ class DoctorAvailability(TimeStampedModel):
         verbose_name_plural = "Doctor Availabilities"
         unique_together = ('doctor', 'day_of_week', 'start_time')
         ordering = ['day_of_week', 'start_time']
+        indexes = [
+            # Delta sync (core.sync)
+            models.Index(fields=['doctor', 'updated_at']),
+        ]
 
     def __str__(self):
         return f"{self.doctor} - {self.get_day_of_week_display()} ({self.start_time} - {self.end_time})"
@@ -94,6 +98,30 @@ class DoctorAvailability(TimeStampedModel):
         super().save(*args, **kwargs)
 
 
+def overlapping_availabilities(availabilities):
+    """
+    (index, overlapped) of each of `availabilities` (dicts of day_of_week,
+    start_time and end_time) that overlaps an earlier interval of the same
+    day, found by sorting the intervals of each day, without a query. As in
+    DoctorAvailability.clean(), intervals sharing an end overlap.
+    """
+    order = sorted(
+        range(len(availabilities)),
+        key=lambda index: (availabilities[index]['day_of_week'], availabilities[index]['start_time'])
+    )
+    overlaps = []
+    latest = None  # Interval of the day ending last so far
+    for index in order:
+        availability = availabilities[index]
+        if latest is not None and latest['day_of_week'] == availability['day_of_week'] \
+                and availability['start_time'] <= latest['end_time']:
+            overlaps.append((index, latest))
+            if availability['end_time'] <= latest['end_time']:
+                continue
+        latest = availability
+    return overlaps
+
+
 class DoctorTimeOff(TimeStampedModel):
     """
     Records when a doctor is not available (vacation, sick leave, etc.)
@@ -107,6 +135,9 @@ class DoctorTimeOff(TimeStampedModel):
         verbose_name = "Doctor Time Off"
         verbose_name_plural = "Doctor Time Offs"
         ordering = ['start_datetime']
+        indexes = [
+            models.Index(fields=['doctor', 'start_datetime', 'end_datetime']),
+        ]
 
     def __str__(self):
         return f"{self.doctor} - Time Off ({self.start_datetime} to {self.end_datetime})"
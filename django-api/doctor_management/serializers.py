@@ -1,12 +1,15 @@
 from rest_framework import serializers
+from core.serializers import DynamicFieldsModelSerializer
 from django.db import transaction
 from django.contrib.auth import get_user_model
-from doctor_management.models import DoctorProfile, Specialization, DoctorAvailability, DoctorTimeOff
+from doctor_management.models import (
+    DoctorProfile, Specialization, DoctorAvailability, DoctorTimeOff, overlapping_availabilities
+)
 from accounts.serializers import UserSerializer
 
 User = get_user_model()
 
-class SpecializationSerializer(serializers.ModelSerializer):
+class SpecializationSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for Specialization model.
     """
@@ -15,7 +18,7 @@ class SpecializationSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description']
 
 
-class DoctorAvailabilitySerializer(serializers.ModelSerializer):
+class DoctorAvailabilitySerializer(DynamicFieldsModelSerializer):
     """
     Serializer for DoctorAvailability model.
     """
@@ -25,6 +28,9 @@ class DoctorAvailabilitySerializer(serializers.ModelSerializer):
         model = DoctorAvailability
         fields = ['id', 'day_of_week', 'day_name', 'start_time', 'end_time']
         read_only_fields = ['id']
+        field_dependencies = {
+            'day_name': ['day_of_week'],
+        }
 
     def validate(self, data):
         """
@@ -39,7 +45,23 @@ class DoctorAvailabilitySerializer(serializers.ModelSerializer):
         return data
 
 
-class DoctorTimeOffSerializer(serializers.ModelSerializer):
+def validate_availability_template(availabilities):
+    """
+    Check a new doctor's weekly availabilities against each other in
+    memory, in the shape of the errors of a many=True serializer.
+    """
+    overlaps = overlapping_availabilities(availabilities)
+    if not overlaps:
+        return availabilities
+    errors = [{} for _ in availabilities]
+    for index, overlapped in overlaps:
+        errors[index] = {'start_time': [
+            f"This availability overlaps with {overlapped['start_time']} - {overlapped['end_time']}"
+        ]}
+    raise serializers.ValidationError(errors)
+
+
+class DoctorTimeOffSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for DoctorTimeOff model.
     """
@@ -61,7 +83,7 @@ class DoctorTimeOffSerializer(serializers.ModelSerializer):
         return data
 
 
-class DoctorProfileSerializer(serializers.ModelSerializer):
+class DoctorProfileSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for DoctorProfile model.
     """
@@ -79,6 +101,9 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
             'state', 'zip_code', 'availabilities'
         ]
         read_only_fields = ['id', 'user', 'user_email', 'user_full_name', 'availabilities']
+        field_dependencies = {
+            'user_full_name': ['user__first_name', 'user__last_name'],
+        }
 
     def get_user_full_name(self, obj):
         return f"Dr. {obj.user.first_name} {obj.user.last_name}".strip()
@@ -103,6 +128,9 @@ class DoctorWithUserSerializer(serializers.ModelSerializer):
             'address', 'city', 'state', 'zip_code', 'availabilities'
         ]
 
+    def validate_availabilities(self, availabilities):
+        return validate_availability_template(availabilities)
+
     @transaction.atomic
     def create(self, validated_data):
         user_data = validated_data.pop('user')
@@ -118,15 +146,14 @@ class DoctorWithUserSerializer(serializers.ModelSerializer):
         doctor_profile = DoctorProfile.objects.create(user=user, **validated_data)
 
         # Add specializations
-        for specialization in specialization_ids:
-            doctor_profile.specialization.add(specialization)
-
-        # Create availabilities if provided
-        for availability_data in availabilities_data:
-            DoctorAvailability.objects.create(
-                doctor=doctor_profile,
-                **availability_data
-            )
+        doctor_profile.specialization.set(specialization_ids)
+
+        # Create availabilities if provided, checked against each other in
+        # validate_availabilities() rather than one query each in clean()
+        DoctorAvailability.objects.bulk_create(
+            DoctorAvailability(doctor=doctor_profile, **availability_data)
+            for availability_data in availabilities_data
+        )
 
         return doctor_profile
 
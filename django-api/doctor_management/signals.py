@@ -0,0 +1,22 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from doctor_management.models import DoctorProfile
+
+
+@receiver(m2m_changed, sender=DoctorProfile.specialization.through)
+def touch_doctors_on_specialization_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Bump the updated_at of the doctors whose specializations changed: the
+    link rows have no timestamp of their own, and conditional GETs and
+    delta sync go by the profile's.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        doctor_ids = [instance.pk]
+    elif action == 'pre_clear':
+        doctor_ids = list(instance.doctors_specializations.values_list('pk', flat=True))
+    else:
+        doctor_ids = pk_set
+    DoctorProfile.objects.filter(pk__in=doctor_ids).update(updated_at=timezone.now())
@@ -1,10 +1,20 @@
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
 from doctor_management.models import DoctorProfile, Specialization, DoctorAvailability, DoctorTimeOff
 from django.urls import reverse
 from rest_framework import status
 from django.utils import timezone
-from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from datetime import time, timedelta
+from doctor_management.imports import DoctorImporter
+import io
+import json
+import tempfile
 
 
 User = get_user_model()
@@ -147,6 +157,30 @@ class DoctorProfileViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(DoctorProfile.objects.count() > 0)
 
+    def test_create_doctor_with_overlapping_availabilities(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('doctorprofile-list')
+        data = {
+            'user': {
+                'first_name': 'New',
+                'last_name': 'Doctor',
+                'email': 'newdoctor@test.com',
+                'password': 'password',
+                'password_confirmation': 'password',
+            },
+            'license_number': '67890',
+            'specialization_ids': [self.specialization.id],
+            'availabilities': [
+                {'day_of_week': 0, 'start_time': '13:00', 'end_time': '17:00'},
+                {'day_of_week': 1, 'start_time': '10:00', 'end_time': '12:00'},
+                {'day_of_week': 0, 'start_time': '09:00', 'end_time': '13:00'},
+            ]
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([bool(errors) for errors in response.data['availabilities']], [True, False, False])
+        self.assertFalse(User.objects.filter(email='newdoctor@test.com').exists())
+
     def test_create_doctor_by_non_admin(self):
         self.client.force_authenticate(user=self.doctor_user)
         url = reverse('doctorprofile-list')
@@ -175,6 +209,74 @@ class DoctorProfileViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['user_full_name'], 'Dr. doctor')
 
+    def test_get_doctor_me_sparse_fields(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        url = reverse('doctorprofile-me')
+        # The conditional GET validators, then the profile
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'id,user_full_name,city'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'id': str(self.doctor_profile.id), 'user_full_name': 'Dr. doctor', 'city': 'Test City'
+        })
+
+    def test_get_doctor_me_not_modified(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        url = reverse('doctorprofile-me')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.doctor_user.last_name = 'renamed'
+        self.doctor_user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user_full_name'], 'Dr. doctor renamed')
+
+    def test_get_doctor_me_modified_by_nested_rows(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        url = reverse('doctorprofile-me')
+        cardiology = self.specialization
+        neurology = Specialization.objects.create(name='Neurology')
+
+        def change_availability():
+            self.doctor_availability.end_time = '22:00'
+            self.doctor_availability.save()
+
+        changes = [
+            change_availability,
+            lambda: DoctorAvailability.objects.create(
+                doctor=self.doctor_profile, day_of_week=3, start_time='09:00', end_time='12:00'
+            ),
+            lambda: self.doctor_profile.availabilities.filter(day_of_week=3).delete(),
+            # Swapped for an older specialization, then renamed
+            lambda: self.doctor_profile.specialization.set([neurology]),
+            lambda: self.doctor_profile.specialization.set([cardiology]),
+            lambda: Specialization.objects.filter(pk=cardiology.pk).update(
+                name='Cardiac surgery', updated_at=timezone.now()
+            ),
+        ]
+        for change in changes:
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['specializations'][0]['name'], 'Cardiac surgery')
+        self.assertEqual(response.data['availabilities'][0]['end_time'], '22:00:00')
+
+    def test_list_doctors_prefetches_nested_fields(self):
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('doctorprofile-list')
+        # Doctors with users, specializations, availabilities
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        doctor = next(item for item in response.data if item['id'] == str(self.doctor_profile.id))
+        self.assertEqual(doctor['specializations'][0]['name'], 'Cardiology')
+        self.assertEqual(doctor['availabilities'][0]['day_name'], 'Monday')
+
     def test_get_doctor_availabilities(self):
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('doctorprofile-availabilities', kwargs={'pk': self.doctor_profile.pk})
@@ -237,6 +339,47 @@ class DoctorProfileViewSet(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_available_slots_skip_booked_appointments(self):
+        from appointments.models import Appointment, AppointmentType
+        from patient_management.models import PatientProfile
+
+        today = timezone.localdate()
+        monday = today + timedelta(days=7 - today.weekday())
+        start = timezone.make_aware(timezone.datetime.combine(monday, timezone.datetime.min.time())) + timedelta(hours=9)
+        Appointment.objects.bulk_create([Appointment(
+            patient=PatientProfile.objects.create(user=self.patient_user), doctor=self.doctor_profile,
+            appointment_type=AppointmentType.objects.create(name='Checkup', duration_minutes=30),
+            start_datetime=start, end_datetime=start + timedelta(minutes=30),
+        )])
+
+        self.client.force_authenticate(user=self.doctor_user)
+        url = reverse('doctorprofile-available-slots', kwargs={'pk': self.doctor_profile.pk})
+        response = self.client.get(url, {'date': monday.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        starts = [slot['start_time'] for slot in response.data]
+        self.assertIn('08:30', starts)
+        self.assertNotIn('09:00', starts)
+
+    async def test_async_reads_match_sync(self):
+        doctor_token = await Token.objects.acreate(user=self.doctor_user)
+        patient_token = await Token.objects.acreate(user=self.patient_user)
+        monday = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        for token, name, kwargs, params in [
+            (patient_token, 'doctorprofile-list', {}, {'specialization': self.specialization.id}),
+            (doctor_token, 'doctorprofile-available-slots', {'pk': self.doctor_profile.pk}, {'date': monday}),
+            (doctor_token, 'doctorprofile-available-slots', {'pk': self.doctor_profile.pk}, {'date': 'monday'}),
+        ]:
+            headers = {'authorization': f"Token {token.key}"}
+            expected = await self.async_client.get(reverse(name, kwargs=kwargs), params, headers=headers)
+            response = await self.async_client.get(reverse(f"async-{name}", kwargs=kwargs), params, headers=headers)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+        # Like the viewset, only the doctor's own slots
+        url = reverse('async-doctorprofile-available-slots', kwargs={'pk': self.doctor2_profile.pk})
+        response = await self.async_client.get(url, {'date': monday}, headers={'authorization': f"Token {doctor_token.key}"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_available_slots_bad_request(self):
         self.client.force_authenticate(user=self.doctor_user)
         url = reverse('doctorprofile-available-slots', kwargs={'pk': self.doctor_profile.pk})
@@ -289,4 +432,83 @@ class DoctorAvailabilityViewSetTests(APITestCase):
         )
         self.patient_user = User.objects.create_user(
             email='patient@example.com', password='patientpassword', role="PATIENT"
-        )
\ No newline at end of file
+        )
+
+
+@override_settings(IMPORT_HASHING_WORKERS=0)
+class DoctorImportTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            password='adminpassword', email='admin@example.com',
+        )
+        self.cardiology = Specialization.objects.create(name='Cardiology')
+        self.neurology = Specialization.objects.create(name='Neurology')
+        DoctorProfile.objects.create(
+            user=User.objects.create_user(email='doctor@example.com', password='doctorpassword', role='DOCTOR'),
+            license_number='L-0',
+        )
+        self.url = reverse('doctorprofile-import-doctors')
+
+    def test_import_csv(self):
+        rows = [
+            'email,first_name,last_name,license_number,years_of_experience,specializations,availabilities',
+            f'ann@example.com,Ann,Lee,L-1,7,cardiology;{self.neurology.id},Monday 09:00-12:00;Mon 13:00-17:00;4 10:00-14:00',
+            'bob@example.com,Bob,Ray,L-2,,Cardiology,Monday 09:00-12:00;Monday 11:00-13:00',
+            'tim@example.com,Tim,Ken,L-3,,Dermatology,',
+            'eve@example.com,Eve,Hill,L-0,,Cardiology,',
+            'sam@example.com,Sam,Ford,L-4,,Cardiology,Someday 09:00-12:00',
+        ]
+        upload = SimpleUploadedFile('doctors.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(self.url, {'file': upload, 'send_invites': 'false'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 4))
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 5, 6])
+        self.assertEqual(set(response.data['errors'][2]['errors']), {'license_number'})
+
+        doctor = DoctorProfile.objects.get(user__email='ann@example.com')
+        self.assertEqual((doctor.user.role, doctor.years_of_experience), ('DOCTOR', 7))
+        self.assertEqual(set(doctor.specialization.all()), {self.cardiology, self.neurology})
+        self.assertEqual(
+            [(availability.day_of_week, availability.start_time) for availability in doctor.availabilities.all()],
+            [(0, time(9)), (0, time(13)), (4, time(10))],
+        )
+
+    def test_import_requires_admin(self):
+        doctor_user = User.objects.get(email='doctor@example.com')
+        self.client.force_authenticate(user=doctor_user)
+        upload = SimpleUploadedFile('doctors.ndjson', b'{}', content_type='application/x-ndjson')
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_queries_per_chunk(self):
+        def doctors(count, offset):
+            return io.StringIO('\n'.join(
+                json.dumps({
+                    'user': {'email': f'doctor{number}@example.com', 'first_name': 'D', 'last_name': str(number)},
+                    'license_number': f'L-{number}',
+                    'specialization_ids': ['Cardiology', 'Neurology'],
+                    'availabilities': [
+                        {'day_of_week': day, 'start_time': '09:00', 'end_time': '17:00'} for day in range(5)
+                    ],
+                })
+                for number in range(offset, offset + count)
+            ))
+
+        with CaptureQueriesContext(connection) as one:
+            DoctorImporter().run(doctors(1, 100), 'ndjson')
+        with CaptureQueriesContext(connection) as ten:
+            report = DoctorImporter().run(doctors(10, 200), 'ndjson')
+        self.assertEqual(report.created, 10)
+        self.assertEqual(len(ten), len(one))
+        self.assertEqual(DoctorAvailability.objects.filter(doctor__license_number__startswith='L-2').count(), 50)
+
+    def test_import_doctors_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write('email,first_name,last_name,license_number,specializations\n')
+            csv_file.write('ann@example.com,Ann,Lee,L-1,Neurology\n')
+            csv_file.flush()
+            out = io.StringIO()
+            call_command('import_doctors', csv_file.name, stdout=out, stderr=io.StringIO())
+        self.assertIn('Imported 1 of 1 doctors (0 failed).', out.getvalue())
+        self.assertFalse(User.objects.get(email='ann@example.com').has_usable_password())
@@ -10,4 +10,10 @@ router.register(r'doctor-time-offs', views.DoctorTimeOffViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Async versions of the hottest reads, for ASGI workers
+    path('async/doctors/', views.AsyncDoctorListView.as_view(), name='async-doctorprofile-list'),
+    path(
+        'async/doctors/<uuid:pk>/available_slots/', views.AsyncAvailableSlotsView.as_view(),
+        name='async-doctorprofile-available-slots'
+    ),
 ]
\ No newline at end of file
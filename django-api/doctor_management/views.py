@@ -1,9 +1,14 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import generics, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
+import itertools
+from appointments.models import Appointment
 from doctor_management.models import DoctorProfile, Specialization, DoctorAvailability, DoctorTimeOff
 from doctor_management.serializers import (
     DoctorProfileSerializer, DoctorWithUserSerializer,
@@ -11,13 +16,94 @@ from doctor_management.serializers import (
     DoctorTimeOffSerializer, DoctorAvailabilityCreateUpdateSerializer,
     DoctorTimeOffCreateUpdateSerializer
 )
+from accounts.imports import import_upload
 from accounts.permissions import IsAdminUser, IsDoctor
+from doctor_management.imports import DoctorImporter
+from core.views import AsyncAPIViewMixin, ConditionalGetMixin, SparseFieldsetMixin, VersionedCacheMixin
 
-class SpecializationViewSet(viewsets.ModelViewSet):
+def filter_doctors(queryset, query_params):
+    """
+    Filter the doctor list by specialization and by accepting new patients.
+    """
+    specialization_id = query_params.get('specialization')
+    if specialization_id:
+        queryset = queryset.filter(specialization__id=specialization_id)
+
+    accepting_new = query_params.get('accepting_new_patients')
+    if accepting_new and accepting_new.lower() == 'true':
+        queryset = queryset.filter(accepting_new_patients=True)
+    return queryset
+
+
+def slot_querysets(doctor, date):
+    """
+    The availabilities, active appointments and time offs of `doctor` that
+    free_slots() needs for `date`.
+    """
+    start_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+    end_datetime = timezone.make_aware(datetime.combine(date, datetime.max.time()))
+
+    # Get day of week (0=Monday, 6=Sunday)
+    availabilities = DoctorAvailability.objects.filter(doctor=doctor, day_of_week=date.weekday())
+    appointments = Appointment.objects.filter(
+        doctor=doctor,
+        start_datetime__gte=start_datetime,
+        start_datetime__lt=end_datetime,
+        status__in=['SCHEDULED', 'CONFIRMED', 'CHECKED_IN', 'IN_PROGRESS']
+    )
+    time_offs = DoctorTimeOff.objects.filter(
+        doctor=doctor,
+        start_datetime__lt=end_datetime,
+        end_datetime__gt=start_datetime
+    )
+    return availabilities, appointments, time_offs
+
+
+def free_slots(date, duration_minutes, availabilities, appointments, time_offs):
+    """
+    The `duration_minutes` slots of `date` within the availabilities that
+    don't overlap an appointment or a time off. Appointments and time offs
+    are only read when the doctor works that day.
+    """
+    available_slots = []
+    if duration_minutes <= 0:
+        return available_slots
+
+    for availability in availabilities:
+        # Convert availability times to datetime objects for this date
+        start_time = timezone.make_aware(datetime.combine(date, availability.start_time))
+        end_time = timezone.make_aware(datetime.combine(date, availability.end_time))
+
+        # Generate potential slots
+        current_slot = start_time
+        while current_slot + timedelta(minutes=duration_minutes) <= end_time:
+            slot_end = current_slot + timedelta(minutes=duration_minutes)
+
+            # Check if slot overlaps with existing appointments or time offs
+            is_available = not any(
+                current_slot < busy.end_datetime and slot_end > busy.start_datetime
+                for busy in itertools.chain(appointments, time_offs)
+            )
+
+            # Add to available slots if not overlapping
+            if is_available:
+                available_slots.append({
+                    'start_time': current_slot.strftime('%H:%M'),
+                    'end_time': slot_end.strftime('%H:%M'),
+                })
+
+            # Move to next slot
+            current_slot += timedelta(minutes=duration_minutes)
+
+    return available_slots
+
+
+class SpecializationViewSet(VersionedCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing medical specializations.
     """
     queryset = Specialization.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2}
     serializer_class = SpecializationSerializer
 
     def get_permissions(self):
@@ -32,11 +118,14 @@ class SpecializationViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class DoctorProfileViewSet(viewsets.ModelViewSet):
+class DoctorProfileViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing doctor profiles.
     """
     queryset = DoctorProfile.objects.all()
+    query_budgets = {
+        'list': 4, 'retrieve': 4, 'me': 5, 'availabilities': 5, 'time_offs': 6, 'available_slots': 9,
+    }
 
     def get_serializer_class(self):
         """
@@ -55,7 +144,7 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
         """
         if self.action in ['list', 'retrieve']:
             permission_classes = [permissions.IsAuthenticated]
-        elif self.action == 'create':
+        elif self.action in ['create', 'import_doctors']:
             permission_classes = [IsAdminUser]
         elif self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [IsDoctor| IsAdminUser ]
@@ -81,15 +170,7 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
 
         # For list action, add filtering options
         if self.action == 'list':
-            # Filter by specialization
-            specialization_id = self.request.query_params.get('specialization')
-            if specialization_id:
-                queryset = queryset.filter(specialization__id=specialization_id)
-
-            # Filter by accepting new patients
-            accepting_new = self.request.query_params.get('accepting_new_patients')
-            if accepting_new and accepting_new.lower() == 'true':
-                queryset = queryset.filter(accepting_new_patients=True)
+            queryset = filter_doctors(queryset, self.request.query_params)
         return queryset
 
     def perform_update(self, serializer):
@@ -146,8 +227,19 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
         """
         API endpoint for getting the current user's doctor profile.
         """
-        doctor = get_object_or_404(DoctorProfile, user=request.user)
-        serializer = DoctorProfileSerializer(doctor)
+        # The user's own changes (name, phone) and the nested availabilities
+        # and specializations are part of the profile. Changing the
+        # specializations of a doctor touches the profile (see signals).
+        not_modified = self.check_not_modified(
+            DoctorProfile.objects.filter(user=request.user),
+            fields=('updated_at', 'user__updated_at', 'availabilities__updated_at', 'specialization__updated_at'),
+            counts=('availabilities', 'specialization'),
+        )
+        if not_modified is not None:
+            return not_modified
+
+        doctor = get_object_or_404(self.optimize_queryset(DoctorProfile.objects.all()), user=request.user)
+        serializer = self.get_serializer(doctor)
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
@@ -245,95 +337,44 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            # Parse the date string
-            from datetime import datetime
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
-
-            # Get day of week (0=Monday, 6=Sunday)
-            day_of_week = date.weekday()
-
-            # Get availabilities for that day
-            availabilities = doctor.availabilities.filter(day_of_week=day_of_week)
-
-            if not availabilities.exists():
-                return Response([])  # No availability on this day
-
             # Get appointment duration (default to 30 minutes)
             duration_minutes = int(request.query_params.get('duration', 30))
-
-            # Get existing appointments for that day
-            start_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
-            end_datetime = timezone.make_aware(datetime.combine(date, datetime.max.time()))
-
-            from appointments.models import Appointment
-            existing_appointments = Appointment.objects.filter(
-                doctor=doctor,
-                start_datetime__gte=start_datetime,
-                start_datetime__lt=end_datetime,
-                status__in=['SCHEDULED', 'CONFIRMED', 'CHECKED_IN', 'IN_PROGRESS']
-            )
-
-            # Get time offs for that day
-            time_offs = doctor.time_offs.filter(
-                start_datetime__lt=end_datetime,
-                end_datetime__gt=start_datetime
-            )
-
-            # Generate available slots
-            available_slots = []
-
-            for availability in availabilities:
-                # Convert availability times to datetime objects for this date
-                start_time = datetime.combine(date, availability.start_time)
-                end_time = datetime.combine(date, availability.end_time)
-
-                # Generate potential slots
-                current_slot = start_time
-                while current_slot + timedelta(minutes=duration_minutes) <= end_time:
-                    slot_end = current_slot + timedelta(minutes=duration_minutes)
-
-                    # Check if slot overlaps with existing appointments
-                    is_available = True
-
-                    # Check against existing appointments
-                    for appointment in existing_appointments:
-                        if (current_slot < appointment.end_datetime and
-                            slot_end > appointment.start_datetime):
-                            is_available = False
-                            break
-
-                    # Check against time offs
-                    if is_available:
-                        for time_off in time_offs:
-                            if (current_slot < time_off.end_datetime and
-                                slot_end > time_off.start_datetime):
-                                is_available = False
-                                break
-
-                    # Add to available slots if not overlapping
-                    if is_available:
-                        available_slots.append({
-                            'start_time': current_slot.strftime('%H:%M'),
-                            'end_time': slot_end.strftime('%H:%M'),
-                        })
-
-                    # Move to next slot
-                    current_slot += timedelta(minutes=duration_minutes)
-
-            return Response(available_slots)
-
         except ValueError:
             return Response(
                 {'detail': 'Invalid date format. Use YYYY-MM-DD.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        availabilities, appointments, time_offs = slot_querysets(doctor, date)
+        return Response(free_slots(date, duration_minutes, availabilities, appointments, time_offs))
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_doctors(self, request):
+        """
+        API endpoint for creating doctors in bulk, with their specializations
+        and availabilities, from an uploaded CSV or NDJSON `file` (see
+        doctor_management.imports). Rows that fail are reported by line and
+        skipped.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ParseError("Upload the doctors to import as `file`.")
+
+        importer = DoctorImporter(send_invites=request.data.get('send_invites', 'true').lower() != 'false')
+        try:
+            report = import_upload(importer, upload, request.data.get('format'))
+        except ValueError as exc:
+            raise ValidationError({'format': [str(exc)]})
+        return Response(report.as_dict(settings.IMPORT_MAX_REPORTED_ERRORS))
+
 
-class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
+class DoctorAvailabilityViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing doctor availability.
     """
     queryset = DoctorAvailability.objects.all()
+    query_budgets = {'list': 3, 'retrieve': 3}
     serializer_class = DoctorAvailabilitySerializer
 
     def get_permissions(self):
@@ -403,11 +444,12 @@ class DoctorAvailabilityViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class DoctorTimeOffViewSet(viewsets.ModelViewSet):
+class DoctorTimeOffViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing doctor time off.
     """
     queryset = DoctorTimeOff.objects.all()
+    query_budgets = {'list': 3, 'retrieve': 3}
     serializer_class = DoctorTimeOffSerializer
 
     def get_permissions(self):
@@ -477,3 +519,62 @@ class DoctorTimeOffViewSet(viewsets.ModelViewSet):
             )
 
         instance.delete()
+
+
+class AsyncDoctorListView(AsyncAPIViewMixin, SparseFieldsetMixin, generics.GenericAPIView):
+    """
+    Async version of the doctor list, for the ASGI application.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = DoctorProfileSerializer
+    query_budgets = {'get': 4}
+
+    def get_queryset(self):
+        return filter_doctors(DoctorProfile.objects.all(), self.request.query_params)
+
+    async def get(self, request):
+        return Response(await self.alist(self.filter_queryset(self.get_queryset())))
+
+
+class AsyncAvailableSlotsView(AsyncAPIViewMixin, generics.GenericAPIView):
+    """
+    Async version of DoctorProfileViewSet.available_slots, for the ASGI
+    application.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'get': 6}
+
+    def get_queryset(self):
+        # Like DoctorProfileViewSet's detail actions: non-staff users only
+        # get their own profile
+        user = self.request.user
+        if user.is_staff:
+            return DoctorProfile.objects.all()
+        return DoctorProfile.objects.filter(user=user)
+
+    async def get(self, request, pk=None):
+        doctor = await self.aget_object()
+        date_str = request.query_params.get('date')
+
+        if not date_str:
+            return Response(
+                {'detail': 'Date parameter is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            duration_minutes = int(request.query_params.get('duration', 30))
+        except ValueError:
+            return Response(
+                {'detail': 'Invalid date format. Use YYYY-MM-DD.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        availabilities, appointments, time_offs = slot_querysets(doctor, date)
+        availabilities = [availability async for availability in availabilities]
+        if not availabilities:
+            return Response([])
+        appointments = [appointment async for appointment in appointments]
+        time_offs = [time_off async for time_off in time_offs]
+        return Response(free_slots(date, duration_minutes, availabilities, appointments, time_offs))
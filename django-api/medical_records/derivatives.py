@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from core.jobs import enqueue, job
+from medical_records.rendering import INVALID_IMAGE_ERRORS, Image, render_derivatives
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def derivative_sizes():
+    """
+    Bounding box (in pixels) of each derivative, keyed by MedicalImage field.
+    """
+    return {
+        'preview': settings.MEDICAL_IMAGE_PREVIEW_SIZE,
+        'thumbnail': settings.MEDICAL_IMAGE_THUMBNAIL_SIZE,
+    }
+
+
+def get_executor():
+    """
+    Process pool rendering the derivatives (see medical_records.rendering),
+    for the job and the `generate_image_derivatives` command, created lazily.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.MEDICAL_IMAGE_DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def queue_derivatives(image):
+    """
+    Generate the thumbnail and preview of `image` in the background: as a
+    job for the `run_workers` command, or inline once the current
+    transaction has committed when MEDICAL_IMAGE_DERIVATIVES_EAGER is set
+    (e.g. in tests).
+    """
+    from medical_records.models import MedicalImage
+
+    if Image is None:
+        MedicalImage.objects.filter(pk=image.pk).update(derivatives_status='UNAVAILABLE')
+        return
+
+    if settings.MEDICAL_IMAGE_DERIVATIVES_EAGER:
+        transaction.on_commit(partial(generate_derivatives, image.pk, image.image_file.name))
+        return
+
+    enqueue(generate_derivatives, image_id=image.pk, source_name=image.image_file.name)
+
+
+@job(queue='images', max_attempts=3)
+def generate_derivatives(image_id, source_name):
+    """
+    Render the derivatives of one image in the process pool and store
+    them. An image Pillow can't read is marked FAILED; other errors are
+    raised, for the queue to retry.
+    """
+    global _executor
+    from medical_records.storage import medical_image_storage
+
+    source_path = medical_image_storage().path(source_name)
+    try:
+        rendered = get_executor().submit(render_derivatives, source_path, derivative_sizes()).result()
+    except INVALID_IMAGE_ERRORS:
+        logger.exception("Could not generate derivatives for medical image %s", image_id)
+        mark_derivatives_failed(image_id, source_name)
+        return
+    except BrokenProcessPool:
+        # A pool process died (e.g. out of memory): start a new pool next time
+        _executor = None
+        raise
+    store_derivatives(image_id, source_name, rendered)
+
+
+def store_derivatives(image_id, source_name, rendered):
+    """
+    Save rendered derivatives on the image, unless the image was deleted or
+    its file replaced while they were being generated.
+    """
+    from medical_records.models import MedicalImage
+
+    image = MedicalImage.objects.filter(pk=image_id, image_file=source_name).first()
+    if image is None:
+        return
+
+    for field_name, data in rendered.items():
+        getattr(image, field_name).save(f"{field_name}.jpg", ContentFile(data), save=False)
+    image.derivatives_status = 'READY'
+    image.save(update_fields=[*rendered, 'derivatives_status', 'updated_at'])
+
+
+def mark_derivatives_failed(image_id, source_name):
+    from medical_records.models import MedicalImage
+
+    MedicalImage.objects.filter(pk=image_id, image_file=source_name).update(derivatives_status='FAILED')
@@ -0,0 +1,44 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from medical_records import derivatives
+from medical_records.models import MedicalImage
+from medical_records.storage import medical_image_storage
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and previews for medical images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--failed', action='store_true',
+            help="Also retry images whose derivatives previously failed."
+        )
+
+    def handle(self, *args, **options):
+        if derivatives.Image is None:
+            raise CommandError("Pillow is required to generate image derivatives.")
+
+        statuses = ['PENDING', 'UNAVAILABLE'] + (['FAILED'] if options['failed'] else [])
+        images = MedicalImage.objects.filter(derivatives_status__in=statuses).exclude(image_file='')
+        storage = medical_image_storage()
+        sizes = derivatives.derivative_sizes()
+
+        executor = derivatives.get_executor()
+        futures = {
+            executor.submit(derivatives.render_derivatives, storage.path(name), sizes): (image_id, name)
+            for image_id, name in images.values_list('id', 'image_file').iterator()
+        }
+
+        ready = failed = 0
+        for future in as_completed(futures):
+            image_id, name = futures[future]
+            try:
+                derivatives.store_derivatives(image_id, name, future.result())
+                ready += 1
+            except Exception as exc:
+                derivatives.mark_derivatives_failed(image_id, name)
+                self.stderr.write(f"{image_id}: {exc}")
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {ready} images ({failed} failed)."))
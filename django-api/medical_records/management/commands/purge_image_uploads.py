@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from medical_records.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the resumable image uploads that received no chunk for MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS, "
+        "and their staged files. Run it hourly; clients have to start such uploads over."
+    )
+
+    def handle(self, *args, **options):
+        uploads, files = purge_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {uploads} uploads and {files} orphaned staged files older than "
+            f"{settings.MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS} hours."
+        ))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 02:15
+
+import medical_records.storage
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalImageBlob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(db_index=True, help_text='SHA-256 of the file content', max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0, help_text='Size in bytes')),
+                ('reference_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='medicalimage',
+            name='image_file',
+            field=models.FileField(storage=medical_records.storage.medical_image_storage, upload_to='medical_images/'),
+        ),
+    ]
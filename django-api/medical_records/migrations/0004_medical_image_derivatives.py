@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 02:21
+
+import medical_records.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0003_medical_image_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalimage',
+            name='derivatives_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('FAILED', 'Failed'), ('UNAVAILABLE', 'Unavailable')], default='PENDING', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='medicalimage',
+            name='preview',
+            field=models.FileField(blank=True, storage=medical_records.storage.medical_image_storage, upload_to='medical_images/derivatives/'),
+        ),
+        migrations.AddField(
+            model_name='medicalimage',
+            name='thumbnail',
+            field=models.FileField(blank=True, storage=medical_records.storage.medical_image_storage, upload_to='medical_images/derivatives/'),
+        ),
+    ]
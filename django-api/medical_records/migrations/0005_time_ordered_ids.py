@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 02:48
+
+import core.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0004_medical_image_derivatives'),
+    ]
+
+    # Only the Python-side default changes, the columns stay the same:
+    # without this SQLite would rebuild every table.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='medicalimage',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='medicalimageblob',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='medicalimageupload',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='medicalrecord',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='medicalrecordaccess',
+                    name='id',
+                    field=models.UUIDField(default=core.ids.new_id, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 02:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_filter_indexes'),
+        ('doctor_management', '0004_filter_indexes'),
+        ('medical_records', '0005_time_ordered_ids'),
+        ('patient_management', '0003_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'created_at'], name='medical_rec_patient_a8c112_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['doctor', 'created_at'], name='medical_rec_doctor__7bb914_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecordaccess',
+            index=models.Index(fields=['medical_record', 'accessed_at'], name='medical_rec_medical_2b5b0d_idx'),
+        ),
+    ]
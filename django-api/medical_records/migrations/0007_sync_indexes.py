@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_sync_indexes'),
+        ('doctor_management', '0005_sync_indexes'),
+        ('medical_records', '0006_filter_indexes'),
+        ('patient_management', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'updated_at'], name='medical_rec_patient_fe6c51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['doctor', 'updated_at'], name='medical_rec_doctor__007b96_idx'),
+        ),
+    ]
@@ -1,11 +1,38 @@
 # medical_records/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Concat, Trim
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from core.models import TimeStampedModel
 from patient_management.models import PatientProfile
 from doctor_management.models import DoctorProfile
 from appointments.models import Appointment
+from medical_records.storage import digest_from_name, medical_image_storage
+
+class MedicalRecordQuerySet(models.QuerySet):
+
+    def with_summary(self, fields=None):
+        """
+        Annotate the names, appointment date and image count used by list
+        views, so a page of records is fetched in a single query.
+
+        With `fields`, only the annotations among them are added.
+        """
+        annotations = {
+            'patient_name': Trim(Concat(
+                'patient__user__first_name', Value(' '), 'patient__user__last_name'
+            )),
+            'doctor_name': Trim(Concat(
+                Value('Dr. '), 'doctor__user__first_name', Value(' '), 'doctor__user__last_name'
+            )),
+            'appointment_date': F('appointment__start_datetime'),
+            'image_count': Count('images'),
+        }
+        if fields is not None:
+            annotations = {name: value for name, value in annotations.items() if name in fields}
+        return self.annotate(**annotations)
+
 
 class MedicalRecord(TimeStampedModel):
     """
@@ -35,8 +62,17 @@ class MedicalRecord(TimeStampedModel):
     # For record tracking
     is_confidential = models.BooleanField(default=False, help_text="Set to true for sensitive records with restricted access")
 
+    objects = MedicalRecordQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient', 'created_at']),
+            models.Index(fields=['doctor', 'created_at']),
+            # Delta sync (core.sync)
+            models.Index(fields=['patient', 'updated_at']),
+            models.Index(fields=['doctor', 'updated_at']),
+        ]
 
     def __str__(self):
         return f"Medical Record for {self.patient} - {self.created_at.date()}"
@@ -58,16 +94,132 @@ class MedicalImage(TimeStampedModel):
     """
     Medical images (X-rays, MRIs, etc.) linked to a medical record.
     """
+    DERIVATIVES_STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+        ('FAILED', 'Failed'),
+        ('UNAVAILABLE', 'Unavailable'),
+    )
+    FILE_FIELDS = ('image_file', 'thumbnail', 'preview')
+
     medical_record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, related_name='images')
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
-    image_file = models.FileField(upload_to='medical_images/%Y/%m/%d/')
+    image_file = models.FileField(upload_to='medical_images/', storage=medical_image_storage)
     image_type = models.CharField(max_length=50, blank=True, help_text="Type of medical image (X-ray, MRI, etc.)")
 
+    # Downscaled copies generated in the background for timelines and lists
+    thumbnail = models.FileField(upload_to='medical_images/derivatives/', storage=medical_image_storage, blank=True)
+    preview = models.FileField(upload_to='medical_images/derivatives/', storage=medical_image_storage, blank=True)
+    derivatives_status = models.CharField(max_length=20, choices=DERIVATIVES_STATUS_CHOICES, default='PENDING')
+
     def __str__(self):
         return f"{self.title} - {self.medical_record.patient}"
 
 
+class MedicalImageBlobManager(models.Manager):
+    """
+    Reference counting for content-addressed image files.
+    """
+
+    def acquire(self, name):
+        """
+        Register one more MedicalImage pointing at the stored file `name`.
+        """
+        digest = digest_from_name(name)
+        if digest is None:
+            return None
+
+        blob, created = self.get_or_create(
+            name=name,
+            defaults={'digest': digest, 'size': medical_image_storage().size(name)}
+        )
+        self.filter(pk=blob.pk).update(reference_count=F('reference_count') + 1)
+        return blob
+
+    def release(self, name):
+        """
+        Drop one reference to the stored file `name` and garbage collect the
+        file once the last MedicalImage using it is gone.
+        """
+        if digest_from_name(name) is None:
+            return
+
+        with transaction.atomic():
+            blob = self.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+
+            if blob.reference_count > 1:
+                self.filter(pk=blob.pk).update(reference_count=F('reference_count') - 1)
+                return
+
+            blob.delete()
+            transaction.on_commit(lambda: self.collect(name))
+
+    def collect(self, name):
+        """
+        Delete the stored file unless it was re-acquired in the meantime.
+        """
+        if not self.filter(name=name).exists():
+            medical_image_storage().delete(name)
+
+
+class MedicalImageBlob(TimeStampedModel):
+    """
+    A stored image file shared by every MedicalImage with identical content.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the file content")
+    size = models.PositiveBigIntegerField(default=0, help_text="Size in bytes")
+    reference_count = models.PositiveIntegerField(default=0)
+
+    objects = MedicalImageBlobManager()
+
+    def __str__(self):
+        return f"{self.digest} ({self.reference_count} references)"
+
+
+class MedicalImageUpload(TimeStampedModel):
+    """
+    A resumable, chunked upload of a medical image. Chunks are written to a
+    staged file in the image storage and the MedicalImage is only created
+    once every byte has been received.
+    """
+    STATUS_CHOICES = (
+        ('IN_PROGRESS', 'In Progress'),
+        ('COMPLETED', 'Completed'),
+    )
+
+    medical_record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, related_name='image_uploads')
+    uploaded_by = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='image_uploads')
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    image_type = models.CharField(max_length=50, blank=True)
+    total_size = models.PositiveBigIntegerField(help_text="Expected size of the file in bytes")
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
+    image = models.OneToOneField(
+        MedicalImage, on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='upload'
+    )
+
+    # Directory of the staged files in the image storage
+    STAGED_DIRECTORY = 'medical_images/.partial'
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received_bytes}/{self.total_size} bytes)"
+
+    @property
+    def staged_name(self):
+        return f"{self.STAGED_DIRECTORY}/{self.id}"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes == self.total_size
+
+
 class MedicalRecordAccess(TimeStampedModel):
     """
     Tracks access to medical records for audit purposes.
@@ -81,6 +233,9 @@ class MedicalRecordAccess(TimeStampedModel):
     class Meta:
         ordering = ['-accessed_at']
         verbose_name_plural = "Medical Record Access Logs"
+        indexes = [
+            models.Index(fields=['medical_record', 'accessed_at']),
+        ]
 
     def __str__(self):
         return f"{self.user} accessed {self.medical_record} at {self.accessed_at}"
\ No newline at end of file
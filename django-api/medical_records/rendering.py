@@ -0,0 +1,41 @@
+"""
+Rendering of medical image derivatives, run in the process pool of
+medical_records.derivatives. The pool's processes import this module only,
+so it must not import Django's apps (models, or modules importing them).
+"""
+import io
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Pillow is optional, see the "images" extra
+    Image = ImageOps = UnidentifiedImageError = None
+
+# Errors of images that will never render, as opposed to transient ones
+# (storage, a broken pool) worth retrying
+if Image is not None:
+    INVALID_IMAGE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+else:
+    INVALID_IMAGE_ERRORS = ()
+
+
+def render_derivatives(source_path, sizes):
+    """
+    Render a downscaled JPEG of the image for each entry of `sizes`.
+
+    This may run in a pool process and must not touch the database; it only
+    returns the encoded bytes, keyed like `sizes`.
+    """
+    largest = max(sizes.values())
+    with Image.open(source_path) as original:
+        # Let the JPEG decoder downscale while decoding when it can
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    rendered = {}
+    # Largest first, so each smaller size is resampled from the previous one
+    for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85, optimize=True)
+        rendered[name] = buffer.getvalue()
+    return rendered
@@ -1,21 +1,54 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from core.serializers import DynamicFieldsModelSerializer
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from medical_records.models import MedicalRecord, MedicalImage, MedicalRecordAccess
+from medical_records.models import MedicalRecord, MedicalImage, MedicalImageUpload, MedicalRecordAccess
 from appointments.models import Appointment
 
 
-class MedicalImageSerializer(serializers.ModelSerializer):
+class MedicalImageDownloadField(serializers.FileField):
+    """
+    File field rendered as the URL of the image download endpoint, which
+    checks permissions and logs access, rather than as the storage URL: the
+    medical images storage isn't served publicly.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        field_file = super().get_attribute(instance)
+        return (instance.pk, field_file) if field_file else None
+
+    def to_representation(self, value):
+        pk, _ = value
+        url = reverse('medicalimage-download', args=[pk], request=self.context.get('request'))
+        if self.variant:
+            url += f"?variant={self.variant}"
+        return url
+
+
+class MedicalImageSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for MedicalImage model.
     """
+    image_file = MedicalImageDownloadField()
+    thumbnail = MedicalImageDownloadField(variant='thumbnail', read_only=True)
+    preview = MedicalImageDownloadField(variant='preview', read_only=True)
+
     class Meta:
         model = MedicalImage
-        fields = ['id', 'title', 'description', 'image_file', 'image_type', 'created_at', 'medical_record']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'title', 'description', 'image_file', 'image_type',
+            'thumbnail', 'preview', 'derivatives_status', 'created_at', 'medical_record'
+        ]
+        read_only_fields = ['id', 'thumbnail', 'preview', 'derivatives_status', 'created_at']
 
 
-class MedicalRecordAccessSerializer(serializers.ModelSerializer):
+class MedicalRecordAccessSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for MedicalRecordAccess model.
     """
@@ -26,6 +59,9 @@ class MedicalRecordAccessSerializer(serializers.ModelSerializer):
         model = MedicalRecordAccess
         fields = ['id', 'user', 'user_email', 'user_name', 'accessed_at', 'access_reason', 'ip_address']
         read_only_fields = ['id', 'user', 'user_email', 'user_name', 'accessed_at', 'ip_address']
+        field_dependencies = {
+            'user_name': ['user__first_name', 'user__last_name'],
+        }
 
     def get_user_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}".strip()
@@ -34,7 +70,7 @@ class MedicalImageUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updateing MedicalImage model.
     """
-    image_file = serializers.FileField(required=False)
+    image_file = MedicalImageDownloadField(required=False)
     class Meta:
         model = MedicalImage
         fields = ['id', 'title', 'description', 'image_file', 'image_type', 'created_at', 'medical_record']
@@ -42,7 +78,7 @@ class MedicalImageUpdateSerializer(serializers.ModelSerializer):
 
 
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for MedicalRecord model.
     """
@@ -63,6 +99,14 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'patient_name', 'doctor_name',
                            'appointment_date', 'images', 'created_at', 'updated_at']
+        field_dependencies = {
+            'patient_name': ['patient__user__first_name', 'patient__user__last_name'],
+            'doctor_name': ['doctor__user__first_name', 'doctor__user__last_name'],
+            'appointment_date': ['appointment__start_datetime'],
+        }
+        expandable_fields = {
+            'appointment': 'appointments.serializers.AppointmentSerializer',
+        }
 
     def get_patient_name(self, obj):
         return f"{obj.patient.user.first_name} {obj.patient.user.last_name}".strip()
@@ -123,6 +167,29 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         return record
 
 
+class MedicalRecordSummarySerializer(DynamicFieldsModelSerializer):
+    """
+    Lightweight serializer for lists of medical records, without nested images.
+    Expects a queryset annotated with MedicalRecord.objects.with_summary().
+    """
+    patient_name = serializers.CharField(read_only=True)
+    doctor_name = serializers.CharField(read_only=True)
+    appointment_date = serializers.DateTimeField(read_only=True)
+    image_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = MedicalRecord
+        fields = [
+            'id', 'patient', 'patient_name', 'doctor', 'doctor_name',
+            'appointment', 'appointment_date', 'diagnosis', 'is_confidential',
+            'image_count', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+        expandable_fields = {
+            'appointment': 'appointments.serializers.AppointmentSerializer',
+        }
+
+
 class MedicalRecordCreateSerializer(MedicalRecordSerializer):
     """
     Serializer for creating a medical record with images.
@@ -203,3 +270,42 @@ class MedicalImageCreateSerializer(serializers.ModelSerializer):
         )
 
         return MedicalImage.objects.create(medical_record=medical_record, **validated_data)
+
+
+
+class MedicalImageUploadSerializer(DynamicFieldsModelSerializer):
+    """
+    Serializer for the state of a resumable MedicalImage upload.
+    """
+    class Meta:
+        model = MedicalImageUpload
+        fields = [
+            'id', 'medical_record', 'filename', 'title', 'description', 'image_type',
+            'total_size', 'received_bytes', 'status', 'image', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class MedicalImageUploadInitiateSerializer(serializers.ModelSerializer):
+    """
+    Serializer for starting a resumable upload of an image to a medical record.
+    """
+    class Meta:
+        model = MedicalImageUpload
+        fields = ['filename', 'title', 'description', 'image_type', 'total_size']
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File size must be greater than zero.")
+        if value > settings.MEDICAL_IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size may not exceed {settings.MEDICAL_IMAGE_UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
+
+    def create(self, validated_data):
+        return MedicalImageUpload.objects.create(
+            medical_record_id=self.context['medical_record_id'],
+            uploaded_by=self.context['request'].user,
+            **validated_data
+        )
@@ -0,0 +1,63 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from medical_records.derivatives import queue_derivatives
+from medical_records.models import MedicalImage, MedicalImageBlob
+
+
+@receiver(pre_save, sender=MedicalImage)
+def remember_previous_image_files(sender, instance, **kwargs):
+    """
+    Remember which files the image pointed at before this save.
+    """
+    instance._previous_file_names = {}
+    if not instance._state.adding:
+        instance._previous_file_names = (
+            MedicalImage.objects.filter(pk=instance.pk).values(*MedicalImage.FILE_FIELDS).first() or {}
+        )
+
+
+@receiver(post_save, sender=MedicalImage)
+def update_image_blob_references(sender, instance, created, **kwargs):
+    """
+    Move blob references when an image (or one of its derivatives) is
+    created or replaced, and regenerate derivatives for new originals.
+    """
+    previous_names = getattr(instance, '_previous_file_names', {})
+
+    for field_name in MedicalImage.FILE_FIELDS:
+        previous_name = previous_names.get(field_name) or ''
+        current_name = getattr(instance, field_name).name or ''
+        if current_name == previous_name:
+            continue
+
+        if current_name:
+            MedicalImageBlob.objects.acquire(current_name)
+        if previous_name:
+            MedicalImageBlob.objects.release(previous_name)
+
+    if created or previous_names.get('image_file') != instance.image_file.name:
+        if not created:
+            # Never show derivatives of the file that was replaced
+            for field_name in ('thumbnail', 'preview'):
+                name = getattr(instance, field_name).name
+                if name:
+                    MedicalImageBlob.objects.release(name)
+                    setattr(instance, field_name, '')
+            instance.derivatives_status = 'PENDING'
+            MedicalImage.objects.filter(pk=instance.pk).update(
+                thumbnail='', preview='', derivatives_status='PENDING'
+            )
+
+        if instance.image_file.name:
+            queue_derivatives(instance)
+
+
+@receiver(post_delete, sender=MedicalImage)
+def release_image_blobs(sender, instance, **kwargs):
+    """
+    Release the blob references of a deleted image, including cascaded deletes.
+    """
+    for field_name in MedicalImage.FILE_FIELDS:
+        name = getattr(instance, field_name).name
+        if name:
+            MedicalImageBlob.objects.release(name)
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files import File, locks
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+DIGEST_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.[0-9a-z]+)?$')
+
+
+class StagedFile(File):
+    """
+    A file already written to local disk that storages may move into place
+    instead of copying, like Django's TemporaryUploadedFile.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 digest of its
+    content, so identical uploads are stored once and share the same name.
+
+    The digest is computed while the upload is streamed to a temporary file
+    next to its final location, which is then atomically moved into place.
+    """
+    max_extension_length = 10
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save(), so there is
+        # no need to probe the file system for a free name here.
+        return name
+
+    def blob_name(self, directory, digest, extension=''):
+        """
+        Build the storage name for a digest, sharded by its first two bytes.
+        """
+        return posixpath.join(directory, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        if len(extension) > self.max_extension_length:
+            extension = ''
+
+        if hasattr(content, 'temporary_file_path'):
+            return self._save_from_path(directory, extension, content.temporary_file_path())
+
+        incoming_dir = self.path(directory or '.')
+        os.makedirs(incoming_dir, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=incoming_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+
+            name = self.blob_name(directory, hasher.hexdigest(), extension)
+            full_path = self.path(name)
+
+            # Identical content is already stored under this name
+            if os.path.exists(full_path):
+                os.remove(temp_path)
+                return name
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return name
+
+    def _save_from_path(self, directory, extension, source_path):
+        """
+        Hash a file that is already on disk and move it into place, avoiding
+        a second copy of large uploads.
+        """
+        hasher = hashlib.sha256()
+        with open(source_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(File.DEFAULT_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+
+        name = self.blob_name(directory, hasher.hexdigest(), extension)
+        full_path = self.path(name)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_move_safe(source_path, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    @contextmanager
+    def lock_staged(self, name):
+        """
+        Hold an exclusive lock on the staged file `name`, creating it if
+        needed. Yields whether the lock was acquired: it isn't waited for
+        when another request or process holds it.
+        """
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'ab') as staged:
+            locked = locks.lock(staged, locks.LOCK_EX | locks.LOCK_NB)
+            try:
+                yield locked
+            finally:
+                if locked:
+                    locks.unlock(staged)
+
+    def write_chunk(self, name, offset, chunks):
+        """
+        Write `chunks` into the staged file `name` starting at `offset` and
+        return the new size of the file. Anything previously written past
+        `offset` (e.g. an interrupted chunk) is discarded.
+        """
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'r+b' if os.path.exists(full_path) else 'wb') as staged:
+            staged.seek(offset)
+            staged.truncate()
+            for chunk in chunks:
+                staged.write(chunk)
+            return staged.tell()
+
+
+def digest_from_name(name):
+    """
+    Return the SHA-256 digest encoded in a content-addressed file name,
+    or None for files stored under any other naming scheme.
+    """
+    match = DIGEST_NAME_RE.search(name or '')
+    return match.group('digest') if match else None
+
+
+class MedicalImageStorage(LazyObject):
+    """
+    STORAGES['medical_images'], looked up again when STORAGES changes (e.g.
+    override_settings() in tests), like Django's default_storage: FileFields
+    resolve their storage once, when the model is defined.
+    """
+
+    def _setup(self):
+        self._wrapped = storages['medical_images']
+
+
+_medical_image_storage = MedicalImageStorage()
+
+
+@receiver(setting_changed)
+def reset_medical_image_storage(*, setting, **kwargs):
+    if setting == 'STORAGES':
+        _medical_image_storage._wrapped = empty
+
+
+def medical_image_storage():
+    """
+    Storage used for MedicalImage files, configurable through STORAGES.
+    """
+    return _medical_image_storage
@@ -1,16 +1,49 @@
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
-from medical_records.models import MedicalRecord, MedicalImage, MedicalRecordAccess
-from appointments.models import Appointment
+from medical_records.models import (
+    MedicalRecord, MedicalImage, MedicalImageBlob, MedicalImageUpload, MedicalRecordAccess
+)
+from appointments.models import Appointment, AppointmentType
 from django.utils import timezone
 from accounts.models import User
 from doctor_management.models import DoctorProfile
 from patient_management.models import PatientProfile
 from django.core.files.uploadedfile import SimpleUploadedFile
-
-
-class MedicalRecordViewSetTests(APITestCase):
+from django.core.management import call_command
+from django.conf import settings
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from core.jobs import Worker
+from core.models import Job
+from medical_records import derivatives
+from medical_records.storage import medical_image_storage
+
+
+class TemporaryImageStorageMixin:
+    """
+    Keep the medical images a test class stores in a temporary directory,
+    removed once the class has run.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.image_storage_location = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.image_storage_location, ignore_errors=True)
+        medical_images = {**settings.STORAGES['medical_images'], 'OPTIONS': {'location': cls.image_storage_location}}
+        cls.enterClassContext(override_settings(STORAGES={**settings.STORAGES, 'medical_images': medical_images}))
+        super().setUpClass()
+
+
+class MedicalRecordViewSetTests(TemporaryImageStorageMixin, APITestCase):
     def setUp(self):
         self.admin_user = User.objects.create_superuser(
             password='adminpassword', email='admin@example.com', role="ADMIN"
@@ -135,6 +168,100 @@ class MedicalRecordViewSetTests(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(MedicalRecordAccess.objects.count(), 2)
 
+    def test_medical_record_my_records_not_modified(self):
+        url = reverse('medicalrecord-my-records')
+        response = self.patient_client.get(url)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', response)
+
+        # Not viewed again, so not logged again
+        response = self.patient_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(MedicalRecordAccess.objects.count(), 2)
+
+        etag = response['ETag']
+        MedicalRecord.objects.create(patient=self.patient_profile, doctor=self.doctor_profile)
+        response = self.patient_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_medical_record_my_records_modified_by_nested_rows(self):
+        url = reverse('medicalrecord-my-records')
+        etag = self.patient_client.get(url)['ETag']
+
+        MedicalImage.objects.create(medical_record=self.medical_record, title="MRI", image_file="test.jpg")
+        response = self.patient_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        self.doctor_user.first_name = 'Renamed'
+        self.doctor_user.save()
+        response = self.patient_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Renamed', response.data[0]['doctor_name'])
+
+    def test_medical_record_list_summary(self):
+        MedicalImage.objects.create(medical_record=self.medical_record, title="MRI", image_file="test.jpg")
+        url = reverse('medicalrecord-list')
+        response = self.doctor_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        record = response.data[0]
+        self.assertNotIn('images', record)
+        self.assertEqual(record['image_count'], 2)
+        self.assertEqual(record['doctor_name'], 'Dr. doctor')
+
+    def test_medical_record_list_sparse_fields(self):
+        url = reverse('medicalrecord-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.doctor_client.get(url, {'fields': 'id,diagnosis'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'diagnosis'})
+        # Neither the name joins nor the image count are computed
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('accounts_user', sql)
+
+    def test_medical_record_retrieve_expand_appointment(self):
+        # bulk_create skips the availability checks of Appointment.save()
+        appointment_type = AppointmentType.objects.create(name='Checkup', duration_minutes=30)
+        appointment, = Appointment.objects.bulk_create([Appointment(
+            patient=self.patient_profile, doctor=self.doctor_profile, appointment_type=appointment_type,
+            start_datetime=timezone.now(), end_datetime=timezone.now() + timezone.timedelta(minutes=30)
+        )])
+        self.medical_record.appointment = appointment
+        self.medical_record.save()
+        url = reverse('medicalrecord-detail', args=[self.medical_record.id])
+        response = self.doctor_client.get(url, {'fields': 'id,appointment', 'expand': 'appointment'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['appointment']['id'], str(appointment.id))
+        self.assertEqual(response.data['appointment']['doctor_name'], 'Dr. doctor')
+
+    def test_medical_record_list_constant_queries(self):
+        url = reverse('medicalrecord-list')
+        with CaptureQueriesContext(connection) as small:
+            self.admin_client.get(url)
+
+        for _ in range(5):
+            record = MedicalRecord.objects.create(patient=self.patient_profile, doctor=self.doctor_profile)
+            MedicalImage.objects.create(medical_record=record, title="X-Ray", image_file="test.jpg")
+
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.admin_client.get(url)
+        self.assertEqual(len(response.data), 7)
+
+    def test_medical_record_my_records_constant_queries(self):
+        url = reverse('medicalrecord-my-records')
+        with CaptureQueriesContext(connection) as small:
+            self.patient_client.get(url)
+
+        for _ in range(5):
+            MedicalRecord.objects.create(patient=self.patient_profile, doctor=self.doctor_profile)
+
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.patient_client.get(url)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(MedicalRecordAccess.objects.count(), 1 + 1 + 6)
+
     def test_medical_record_access_logs(self):
         MedicalRecordAccess.objects.create(medical_record=self.medical_record, user=self.doctor_user, access_reason="Test")
         url = reverse('medicalrecord-access-logs', args=[self.medical_record.id])
@@ -158,6 +285,27 @@ class MedicalRecordViewSetTests(APITestCase):
         self.assertEqual(MedicalImage.objects.count(), 2)
         self.assertEqual(MedicalRecordAccess.objects.count(), 2)
 
+    def test_medical_record_add_image_idempotent_retry(self):
+        dummy_file = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        url = reverse('medicalrecord-add-image', args=[self.medical_record.id])
+        responses = []
+        for content in (dummy_file, dummy_file, dummy_file + b'\x00'):
+            image_file = SimpleUploadedFile('retried.gif', content, content_type='image/gif')
+            data = {'title': 'Test Image', 'image_file': image_file}
+            responses.append(self.doctor_client.post(url, data, format='multipart', headers={'Idempotency-Key': 'scan-1'}))
+
+        first, retry, changed = responses
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(MedicalImage.objects.filter(title='Test Image').count(), 1)
+        # The same key with another file
+        self.assertEqual(changed.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
     def test_medical_image_list_admin(self):
         url = reverse('medicalimage-list')
         response = self.admin_client.get(url)
@@ -262,3 +410,364 @@ class MedicalRecordViewSetTests(APITestCase):
         response = self.second_patient_client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
+
+
+@override_settings(MEDICAL_IMAGE_DERIVATIVES_EAGER=True)
+class MedicalImageBlobTests(TemporaryImageStorageMixin, APITestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='doctorpassword', role="DOCTOR", first_name='doctor',
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='patientpassword', role="PATIENT"
+        )
+        self.doctor_profile = DoctorProfile.objects.create(user=self.doctor_user, license_number="2345")
+        self.patient_profile = PatientProfile.objects.create(user=self.patient_user)
+        self.medical_record = MedicalRecord.objects.create(
+            patient=self.patient_profile, doctor=self.doctor_profile)
+        self.content = b'GIF89a' + timezone.now().isoformat().encode()
+
+    def _upload(self, name='scan.gif'):
+        return MedicalImage.objects.create(
+            medical_record=self.medical_record, title="Scan",
+            image_file=SimpleUploadedFile(name, self.content, content_type='image/gif')
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self._upload('first.gif')
+        second = self._upload('second.gif')
+
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertEqual(MedicalImageBlob.objects.count(), 1)
+        blob = MedicalImageBlob.objects.get()
+        self.assertEqual(blob.reference_count, 2)
+        self.assertEqual(blob.size, len(self.content))
+        self.assertIn(blob.digest, first.image_file.name)
+
+    def test_blob_collected_when_last_reference_deleted(self):
+        first = self._upload()
+        second = self._upload()
+        name = first.image_file.name
+        storage = first.image_file.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(MedicalImageBlob.objects.get(name=name).reference_count, 1)
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(MedicalImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_replacing_file_moves_reference(self):
+        image = self._upload()
+        old_name = image.image_file.name
+
+        image.image_file = SimpleUploadedFile('other.gif', b'GIF89a-other', content_type='image/gif')
+        # Not a readable GIF: its derivatives fail
+        with self.assertLogs('medical_records', level='ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                image.save()
+        self.assertIn(f"Could not generate derivatives for medical image {image.pk}", logs.output[0])
+
+        self.assertFalse(MedicalImageBlob.objects.filter(name=old_name).exists())
+        self.assertEqual(MedicalImageBlob.objects.get(name=image.image_file.name).reference_count, 1)
+
+
+@override_settings(MEDICAL_IMAGE_DERIVATIVES_EAGER=True)
+class MedicalImageUploadTests(TemporaryImageStorageMixin, APITestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='doctorpassword', role="DOCTOR", first_name='doctor',
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='patientpassword', role="PATIENT"
+        )
+        self.doctor_profile = DoctorProfile.objects.create(user=self.doctor_user, license_number="2345")
+        self.patient_profile = PatientProfile.objects.create(user=self.patient_user)
+        self.medical_record = MedicalRecord.objects.create(
+            patient=self.patient_profile, doctor=self.doctor_profile)
+
+        self.doctor_client = APIClient()
+        self.doctor_client.force_authenticate(user=self.doctor_user)
+        self.patient_client = APIClient()
+        self.patient_client.force_authenticate(user=self.patient_user)
+
+        self.content = b'DICM' + timezone.now().isoformat().encode() * 50
+
+    def _initiate(self):
+        url = reverse('medicalrecord-initiate-upload', args=[self.medical_record.id])
+        data = {'filename': 'scan.dcm', 'title': 'MRI', 'total_size': len(self.content)}
+        return self.doctor_client.post(url, data)
+
+    def _send_chunk(self, upload_id, offset, data):
+        url = reverse('medicalimageupload-chunk', args=[upload_id])
+        return self.doctor_client.put(
+            url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunked_upload_creates_image(self):
+        response = self._initiate()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.data['id']
+
+        half = len(self.content) // 2
+        response = self._send_chunk(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        response = self._send_chunk(upload_id, half, self.content[half:])
+        self.assertEqual(response.data['received_bytes'], len(self.content))
+
+        url = reverse('medicalimageupload-finalize', args=[upload_id])
+        response = self.doctor_client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = MedicalImage.objects.get(id=response.data['id'])
+        self.assertEqual(image.title, 'MRI')
+        self.assertEqual(image.image_file.read(), self.content)
+        self.assertEqual(MedicalRecordAccess.objects.count(), 1)
+
+        # A retried finalize returns the same image
+        response = self.doctor_client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], str(image.id))
+        self.assertEqual(MedicalImage.objects.count(), 1)
+
+    def test_chunk_with_wrong_offset(self):
+        upload_id = self._initiate().data['id']
+        response = self._send_chunk(upload_id, 10, self.content[10:20])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_concurrent_chunk_rejected(self):
+        upload = MedicalImageUpload.objects.get(id=self._initiate().data['id'])
+        storage = medical_image_storage()
+        with storage.lock_staged(upload.staged_name) as locked:
+            self.assertTrue(locked)
+            response = self._send_chunk(upload.id, 0, self.content[:10])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        upload.refresh_from_db()
+        self.assertEqual(upload.received_bytes, 0)
+
+        response = self._send_chunk(upload.id, 0, self.content[:10])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with storage.open(upload.staged_name) as staged:
+            self.assertEqual(staged.read(), self.content[:10])
+
+    def test_purge_expired_uploads(self):
+        expired = MedicalImageUpload.objects.get(id=self._initiate().data['id'])
+        self._send_chunk(expired.id, 0, self.content[:10])
+        MedicalImageUpload.objects.filter(id=expired.id).update(updated_at=timezone.now() - timedelta(days=2))
+        active = MedicalImageUpload.objects.get(id=self._initiate().data['id'])
+        self._send_chunk(active.id, 0, self.content[:10])
+
+        storage = medical_image_storage()
+        orphan = f"{MedicalImageUpload.STAGED_DIRECTORY}/{uuid.uuid4()}"
+        with open(storage.path(orphan), 'wb') as staged:
+            staged.write(b'partial')
+        stale = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(storage.path(orphan), (stale, stale))
+
+        call_command('purge_image_uploads', stdout=io.StringIO())
+        self.assertFalse(MedicalImageUpload.objects.filter(id=expired.id).exists())
+        self.assertFalse(storage.exists(expired.staged_name))
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(active.staged_name))
+
+        response = self._send_chunk(expired.id, 10, self.content[10:20])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abort_upload(self):
+        upload = MedicalImageUpload.objects.get(id=self._initiate().data['id'])
+        self._send_chunk(upload.id, 0, self.content[:10])
+        storage = medical_image_storage()
+        self.assertTrue(storage.exists(upload.staged_name))
+
+        response = self.doctor_client.delete(reverse('medicalimageupload-detail', args=[upload.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(MedicalImageUpload.objects.exists())
+        self.assertFalse(storage.exists(upload.staged_name))
+
+    def test_chunk_larger_than_declared_size(self):
+        upload_id = self._initiate().data['id']
+        response = self._send_chunk(upload_id, 0, self.content + b'extra')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(MedicalImageUpload.objects.get(id=upload_id).received_bytes, 0)
+
+    def test_finalize_incomplete_upload(self):
+        upload_id = self._initiate().data['id']
+        self._send_chunk(upload_id, 0, self.content[:10])
+        url = reverse('medicalimageupload-finalize', args=[upload_id])
+        response = self.doctor_client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(MedicalImage.objects.count(), 0)
+
+    def test_initiate_upload_patient(self):
+        url = reverse('medicalrecord-initiate-upload', args=[self.medical_record.id])
+        data = {'filename': 'scan.dcm', 'title': 'MRI', 'total_size': 10}
+        response = self.patient_client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class MedicalImageDownloadTests(TemporaryImageStorageMixin, APITestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='doctorpassword', role="DOCTOR", first_name='doctor',
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='patientpassword', role="PATIENT"
+        )
+        self.second_patient_user = User.objects.create_user(
+            email='patient2@example.com', password='patient2password', role="PATIENT"
+        )
+        self.doctor_profile = DoctorProfile.objects.create(user=self.doctor_user, license_number="2345")
+        self.patient_profile = PatientProfile.objects.create(user=self.patient_user)
+        PatientProfile.objects.create(user=self.second_patient_user)
+        self.medical_record = MedicalRecord.objects.create(
+            patient=self.patient_profile, doctor=self.doctor_profile)
+
+        self.content = b'GIF89a' + b'0123456789' * 10
+        self.medical_image = MedicalImage.objects.create(
+            medical_record=self.medical_record, title="Chest X-Ray",
+            image_file=SimpleUploadedFile('xray.gif', self.content, content_type='image/gif')
+        )
+        self.url = reverse('medicalimage-download', args=[self.medical_image.id])
+
+        self.patient_client = APIClient()
+        self.patient_client.force_authenticate(user=self.patient_user)
+        self.second_patient_client = APIClient()
+        self.second_patient_client.force_authenticate(user=self.second_patient_user)
+
+    def test_download_full_file(self):
+        response = self.patient_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('chest-x-ray.gif', response['Content-Disposition'])
+        self.assertEqual(MedicalRecordAccess.objects.count(), 1)
+
+    def test_download_range(self):
+        response = self.patient_client.get(self.url, HTTP_RANGE='bytes=6-15')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[6:16])
+        self.assertEqual(response['Content-Range'], f'bytes 6-15/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.patient_client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-4:])
+
+    def test_download_unsatisfiable_range(self):
+        response = self.patient_client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(MedicalRecordAccess.objects.count(), 0)
+
+    def test_download_not_modified(self):
+        etag = self.patient_client.get(self.url)['ETag']
+        response = self.patient_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(MedicalRecordAccess.objects.count(), 1)
+
+    def test_download_other_patient(self):
+        response = self.second_patient_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(SENDFILE_BACKEND='x-accel-redirect', SENDFILE_URL_PREFIX='/protected-media/')
+    def test_download_x_accel_redirect(self):
+        response = self.patient_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{self.medical_image.image_file.name}'
+        )
+        self.assertEqual(response.content, b'')
+
+
+@skipUnless(derivatives.Image, "Pillow is not installed")
+@override_settings(MEDICAL_IMAGE_DERIVATIVES_EAGER=True, MEDICAL_IMAGE_THUMBNAIL_SIZE=16, MEDICAL_IMAGE_PREVIEW_SIZE=64)
+class MedicalImageDerivativeTests(TemporaryImageStorageMixin, APITestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='doctorpassword', role="DOCTOR", first_name='doctor',
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='patientpassword', role="PATIENT"
+        )
+        self.doctor_profile = DoctorProfile.objects.create(user=self.doctor_user, license_number="2345")
+        self.patient_profile = PatientProfile.objects.create(user=self.patient_user)
+        self.medical_record = MedicalRecord.objects.create(
+            patient=self.patient_profile, doctor=self.doctor_profile)
+
+        self.doctor_client = APIClient()
+        self.doctor_client.force_authenticate(user=self.doctor_user)
+
+    def _png(self, width=300, height=200):
+        buffer = io.BytesIO()
+        derivatives.Image.new('RGB', (width, height), color=(width % 256, 80, 160)).save(buffer, format='PNG')
+        return SimpleUploadedFile('scan.png', buffer.getvalue(), content_type='image/png')
+
+    def test_add_image_generates_derivatives(self):
+        url = reverse('medicalrecord-add-image', args=[self.medical_record.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.doctor_client.post(url, {'title': 'Scan', 'image_file': self._png()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        image = MedicalImage.objects.get(id=response.data['id'])
+        self.assertEqual(image.derivatives_status, 'READY')
+        with derivatives.Image.open(image.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (16, 11))
+        with derivatives.Image.open(image.preview.path) as preview:
+            self.assertEqual(preview.size, (64, 43))
+
+        response = self.doctor_client.get(reverse('medicalimage-detail', args=[image.id]))
+        download_url = 'http://testserver' + reverse('medicalimage-download', args=[image.id])
+        self.assertEqual(response.data['image_file'], download_url)
+        self.assertEqual(response.data['thumbnail'], f"{download_url}?variant=thumbnail")
+        self.assertEqual(response.data['preview'], f"{download_url}?variant=preview")
+
+        # The files themselves aren't served as media
+        self.assertNotIn(str(settings.MEDIA_ROOT), image.thumbnail.path)
+        response = self.doctor_client.get(response.data['thumbnail'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_unreadable_image_marks_failed(self):
+        with self.assertLogs('medical_records', level='ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = MedicalImage.objects.create(
+                    medical_record=self.medical_record, title="Report",
+                    image_file=SimpleUploadedFile('report.dcm', b'not an image', content_type='application/dicom')
+                )
+        self.assertIn(f"Could not generate derivatives for medical image {image.pk}", logs.output[0])
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives_status, 'FAILED')
+        self.assertFalse(image.thumbnail)
+
+    @override_settings(MEDICAL_IMAGE_DERIVATIVES_EAGER=False)
+    def test_transient_errors_are_retried(self):
+        image = MedicalImage.objects.create(medical_record=self.medical_record, title="Scan", image_file=self._png())
+        with mock.patch.object(derivatives, 'get_executor') as get_executor:
+            get_executor.return_value.submit.return_value.result.side_effect = OSError("Storage unavailable")
+            with self.assertLogs('core.jobs', level='ERROR') as logs:
+                self.assertEqual(Worker(['images']).run_pending(), 1)
+        self.assertIn("(medical_records.derivatives.generate_derivatives) failed on attempt 1", logs.output[0])
+
+        job = Job.objects.get(queue='images')
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+        self.assertIn('Storage unavailable', job.last_error)
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives_status, 'PENDING')
+
+    def test_replacing_file_regenerates_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = MedicalImage.objects.create(medical_record=self.medical_record, title="Scan", image_file=self._png())
+        image.refresh_from_db()
+        old_thumbnail = image.thumbnail.name
+
+        image.image_file = self._png(width=100, height=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+
+        self.assertEqual(image.derivatives_status, 'READY')
+        self.assertNotEqual(image.thumbnail.name, old_thumbnail)
+        self.assertFalse(MedicalImageBlob.objects.filter(name=old_thumbnail).exists())
@@ -0,0 +1,50 @@
+"""
+Expiry of the resumable image uploads (MedicalImageUploadViewSet) that were
+abandoned, along with their staged files.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from medical_records.models import MedicalImageUpload
+from medical_records.storage import medical_image_storage
+
+
+def purge_expired_uploads(now=None):
+    """
+    Delete the uploads in progress that received no chunk for
+    MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS and their staged files, then the staged
+    files as old that no upload refers to. Returns how many of each.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS)
+    storage = medical_image_storage()
+
+    expired = MedicalImageUpload.objects.filter(status='IN_PROGRESS', updated_at__lt=cutoff)
+    uploads = 0
+    for upload in expired.only('pk'):
+        # Chunk writes hold the lock and check the upload still exists
+        with storage.lock_staged(upload.staged_name) as locked:
+            if not locked:
+                continue
+            deleted, _ = expired.filter(pk=upload.pk).delete()
+        if deleted:
+            storage.delete(upload.staged_name)
+            uploads += 1
+
+    files = 0
+    directory = MedicalImageUpload.STAGED_DIRECTORY
+    if storage.exists(directory):
+        _, names = storage.listdir(directory)
+        known = {
+            str(pk) for pk in
+            MedicalImageUpload.objects.filter(status='IN_PROGRESS').values_list('pk', flat=True)
+        }
+        for name in names:
+            path = f"{directory}/{name}"
+            if name not in known and storage.get_modified_time(path) < cutoff:
+                storage.delete(path)
+                files += 1
+
+    return uploads, files
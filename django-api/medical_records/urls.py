@@ -6,6 +6,7 @@ router = DefaultRouter()
 router.register(r'medical-records', views.MedicalRecordViewSet)
 router.register(r'medical-images', views.MedicalImageViewSet)
 router.register(r'access-logs', views.MedicalRecordAccessViewSet)
+router.register(r'image-uploads', views.MedicalImageUploadViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,22 +1,53 @@
-from rest_framework import viewsets, permissions, status
+import os
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.db.models import Q
-from medical_records.models import MedicalRecord, MedicalImage, MedicalRecordAccess
+from django.utils import timezone
+from django.utils.text import slugify
+from medical_records.models import MedicalRecord, MedicalImage, MedicalImageUpload, MedicalRecordAccess
 from medical_records.serializers import (
     MedicalRecordSerializer, MedicalImageSerializer,
     MedicalRecordAccessSerializer, MedicalRecordCreateSerializer,
-    MedicalRecordUpdateSerializer, MedicalImageCreateSerializer, MedicalImageUpdateSerializer
+    MedicalRecordUpdateSerializer, MedicalImageCreateSerializer, MedicalImageUpdateSerializer,
+    MedicalImageUploadSerializer, MedicalImageUploadInitiateSerializer,
+    MedicalRecordSummarySerializer
 )
+from appointments.models import Appointment
+from medical_records.storage import StagedFile, digest_from_name, medical_image_storage
 from accounts.permissions import IsAdminUser, IsDoctor, IsPatient
+from core.exceptions import UploadOffsetMismatchError, UploadTooLargeError
+from core.files import stored_file_response
+from core.idempotency import idempotent
+from core.renderers import FastJSONRenderer, PassthroughRenderer
+from core.views import ConditionalGetMixin, SparseFieldsetMixin
 
+UPLOAD_READ_SIZE = 64 * 1024
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+
+def iter_request_body(request, limit):
+    """
+    Stream the raw request body in small pieces, refusing more than `limit` bytes.
+    """
+    received = 0
+    while True:
+        chunk = request.read(UPLOAD_READ_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLargeError()
+        yield chunk
+
+
+class MedicalRecordViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing medical records.
     """
     queryset = MedicalRecord.objects.all()
+    query_budgets = {'list': 4, 'retrieve': 6, 'my_records': 5}
 
     def get_serializer_class(self):
         """
@@ -26,6 +57,8 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             return MedicalRecordCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return MedicalRecordUpdateSerializer
+        elif self.action in ['list', 'my_records']:
+            return MedicalRecordSummarySerializer
         return MedicalRecordSerializer
 
     def get_permissions(self):
@@ -52,12 +85,13 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         # Admin can see all
         if user.is_staff:
             pass
-        # Doctors can see records for their patients or records they created
+        # Doctors can see records for their patients or records they created.
+        # A subquery instead of a join keeps rows unique without .distinct()
         elif hasattr(user, 'doctorprofile'):
             queryset = queryset.filter(
                 Q(doctor=user.doctorprofile) |
-                Q(patient__appointments__doctor=user.doctorprofile)
-            ).distinct()
+                Q(patient__in=Appointment.objects.filter(doctor=user.doctorprofile).values('patient'))
+            )
         # Patients can only see their own records
         elif hasattr(user, 'patientprofile'):
             queryset = queryset.filter(patient=user.patientprofile)
@@ -92,8 +126,15 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         if end_date:
             queryset = queryset.filter(created_at__date__lte=end_date)
 
+        if self.action == 'list':
+            queryset = queryset.with_summary(self.get_requested_fields())
+
         return queryset.order_by('-created_at')
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """
         Create a medical record and check permissions.
@@ -184,18 +225,34 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         if end_date:
             queryset = queryset.filter(created_at__date__lte=end_date)
 
-        queryset = queryset.order_by('-created_at')
-        serializer = MedicalRecordSerializer(queryset, many=True)
+        # Before the access logging below: nothing new was viewed. The
+        # images, names and appointment date are part of each record
+        not_modified = self.check_not_modified(
+            queryset,
+            fields=(
+                'updated_at', 'images__updated_at', 'patient__user__updated_at',
+                'doctor__user__updated_at', 'appointment__updated_at',
+            ),
+            counts=('images',),
+        )
+        if not_modified is not None:
+            return not_modified
+
+        queryset = queryset.with_summary(self.get_requested_fields()).order_by('-created_at')
+        records = list(self.optimize_queryset(queryset))
+        serializer = self.get_serializer(records, many=True)
 
-        # Log this access
+        # Log this access with a single insert for the whole list
         client_ip = request.META.get('REMOTE_ADDR', None)
-        for record in queryset:
-            MedicalRecordAccess.objects.create(
+        MedicalRecordAccess.objects.bulk_create([
+            MedicalRecordAccess(
                 medical_record=record,
                 user=user,
                 ip_address=client_ip,
                 access_reason="Viewed in 'my records' list"
             )
+            for record in records
+        ])
 
         return Response(serializer.data)
 
@@ -222,6 +279,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def add_image(self, request, pk=None):
         """
         API endpoint for adding an image to a medical record.
@@ -248,12 +306,190 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=True, methods=['post'], url_path='uploads')
+    def initiate_upload(self, request, pk=None):
+        """
+        API endpoint for starting a resumable, chunked image upload to a medical record.
+        """
+        record = self.get_object()
+        user = request.user
+
+        # Only the doctor who created the record or admin can add images
+        if not user.is_staff and not (hasattr(user, 'doctorprofile') and record.doctor == user.doctorprofile):
+            return Response(
+                {'detail': 'You do not have permission to add images to this record.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = MedicalImageUploadInitiateSerializer(
+            data=request.data,
+            context={'medical_record_id': record.id, 'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save()
+
+        return Response(
+            MedicalImageUploadSerializer(upload).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+class MedicalImageUploadViewSet(SparseFieldsetMixin,
+                                mixins.RetrieveModelMixin,
+                                mixins.DestroyModelMixin,
+                                viewsets.GenericViewSet):
+    """
+    API endpoint for resumable medical image uploads:
+    1. POST medical-records/{id}/uploads/ to start an upload
+    2. PUT image-uploads/{id}/chunk/ with an Upload-Offset header for each chunk
+    3. POST image-uploads/{id}/finalize/ once every byte has been sent
+
+    Retrieving an upload returns the number of bytes received so far, which
+    is the offset to resume from after a dropped connection. Uploads that
+    receive no chunk for MEDICAL_IMAGE_UPLOAD_EXPIRY_HOURS are deleted by
+    `manage.py purge_image_uploads`.
+    """
+    queryset = MedicalImageUpload.objects.all()
+    serializer_class = MedicalImageUploadSerializer
+
+    def get_permissions(self):
+        """
+        - Only doctors and admin can upload images
+        """
+        permission_classes = [IsDoctor | IsAdminUser]
+        return [permission() for permission in permission_classes]
+
+    def get_queryset(self):
+        """
+        Users can only see the uploads they started, admin can see all.
+        """
+        user = self.request.user
+        if user.is_staff:
+            return MedicalImageUpload.objects.all()
+        return MedicalImageUpload.objects.filter(uploaded_by=user)
+
+    @action(detail=True, methods=['put', 'patch'])
+    def chunk(self, request, pk=None):
+        """
+        API endpoint for appending a chunk of raw bytes to an upload.
+        """
+        upload = self.get_object()
+
+        if upload.status != 'IN_PROGRESS':
+            return Response(
+                {'detail': 'This upload has already been finalized.'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.query_params.get('offset')))
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': 'An integer Upload-Offset header is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        storage = medical_image_storage()
+        with storage.lock_staged(upload.staged_name) as locked:
+            # Concurrent writers at the same offset would interleave their
+            # bytes in the staged file: only one at a time writes to it
+            if not locked:
+                raise UploadOffsetMismatchError("Another chunk of this upload is being written.")
+
+            # Read again under the lock, the upload may have changed or
+            # expired (see purge_image_uploads) since
+            upload = get_object_or_404(MedicalImageUpload, pk=upload.pk)
+
+            if upload.status != 'IN_PROGRESS':
+                return Response(
+                    {'detail': 'This upload has already been finalized.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            if offset != upload.received_bytes:
+                raise UploadOffsetMismatchError(
+                    f"Expected offset {upload.received_bytes}, got {offset}."
+                )
+
+            # Write the body straight to the staged file without buffering it
+            size = storage.write_chunk(
+                upload.staged_name, offset,
+                iter_request_body(request, upload.total_size - offset)
+            )
+
+            MedicalImageUpload.objects.filter(pk=upload.pk).update(
+                received_bytes=size, updated_at=timezone.now()
+            )
+
+        upload.refresh_from_db()
+        response = Response(MedicalImageUploadSerializer(upload).data)
+        response['Upload-Offset'] = str(upload.received_bytes)
+        return response
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """
+        API endpoint for turning a fully received upload into a MedicalImage.
+        """
+        upload = self.get_object()
+        storage = medical_image_storage()
+
+        with transaction.atomic():
+            upload = MedicalImageUpload.objects.select_for_update().get(pk=upload.pk)
+
+            # Finalizing twice (e.g. a retried request) returns the same image
+            if upload.status == 'COMPLETED':
+                return Response(MedicalImageSerializer(upload.image).data)
+
+            if not upload.is_complete:
+                return Response(
+                    {'detail': f'Upload is incomplete: {upload.received_bytes} of {upload.total_size} bytes received.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            image = MedicalImage(
+                medical_record=upload.medical_record,
+                title=upload.title,
+                description=upload.description,
+                image_type=upload.image_type,
+            )
+            with open(storage.path(upload.staged_name), 'rb') as staged:
+                image.image_file.save(upload.filename, StagedFile(staged, name=upload.filename), save=False)
+            image.save()
+
+            MedicalRecordAccess.objects.create(
+                medical_record=upload.medical_record,
+                user=request.user,
+                ip_address=request.META.get('REMOTE_ADDR', None),
+                access_reason="Added image to medical record"
+            )
+
+            upload.status = 'COMPLETED'
+            upload.image = image
+            upload.save()
+
+        # The staged file is left behind when its content was already stored
+        if storage.exists(upload.staged_name):
+            storage.delete(upload.staged_name)
+
+        return Response(MedicalImageSerializer(image).data, status=status.HTTP_201_CREATED)
 
-class MedicalImageViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        """
+        Abort an upload and discard the bytes received so far.
+        """
+        storage = medical_image_storage()
+        if storage.exists(instance.staged_name):
+            storage.delete(instance.staged_name)
+        instance.delete()
+
+
+class MedicalImageViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing medical images.
     """
     queryset = MedicalImage.objects.all()
+    query_budgets = {'list': 4}
 
     def get_serializer_class(self):
         if self.action in ['update', 'partial_update']:
@@ -316,6 +552,55 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], renderer_classes=[FastJSONRenderer, PassthroughRenderer])
+    def download(self, request, pk=None):
+        """
+        API endpoint for downloading the image file itself, or its thumbnail
+        or preview with ?variant=. Supports Range requests for resuming large
+        downloads and ETag/Last-Modified revalidation; every download that
+        returns file data is logged.
+        """
+        instance = self.get_object()
+
+        variant = request.query_params.get('variant', 'original')
+        if variant not in ('original', 'thumbnail', 'preview'):
+            return Response(
+                {'detail': 'Variant must be one of original, thumbnail or preview.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        field_file = instance.image_file if variant == 'original' else getattr(instance, variant)
+        name = field_file.name
+        storage = field_file.storage
+
+        if not name or not storage.exists(name):
+            return Response(
+                {'detail': 'The file for this image is not available.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        filename = slugify(instance.title) or 'medical-image'
+        if variant != 'original':
+            filename = f"{filename}-{variant}"
+        filename += os.path.splitext(name)[1]
+
+        response = stored_file_response(
+            request, storage, name,
+            etag=digest_from_name(name),
+            filename=filename
+        )
+
+        # Revalidations (304) and failed ranges don't transfer the image
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_206_PARTIAL_CONTENT):
+            MedicalRecordAccess.objects.create(
+                medical_record=instance.medical_record,
+                user=request.user,
+                ip_address=request.META.get('REMOTE_ADDR', None),
+                access_reason="Downloaded medical image" if variant == 'original' else f"Downloaded medical image {variant}"
+            )
+
+        return response
+
     def perform_create(self, serializer):
         """
         Create a medical image and check permissions.
@@ -396,12 +681,13 @@ class MedicalImageViewSet(viewsets.ModelViewSet):
         instance.delete()
 
 
-class MedicalRecordAccessViewSet(viewsets.ReadOnlyModelViewSet):
+class MedicalRecordAccessViewSet(SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for viewing medical record access logs.
     Read-only to prevent modification of the audit trail.
     """
     queryset = MedicalRecordAccess.objects.all()
+    query_budgets = {'list': 4}
     serializer_class = MedicalRecordAccessSerializer
 
     def get_permissions(self):
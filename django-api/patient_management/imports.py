@@ -0,0 +1,101 @@
+"""
+Bulk patient import (see accounts.imports), for onboarding a clinic.
+
+NDJSON rows have the shape of a PatientWithUserSerializer request:
+
+    {"user": {"email": ..., "first_name": ..., "last_name": ...},
+     "date_of_birth": "1980-01-31", "insurances": [{"insurance_provider": ..., ...}]}
+
+CSV rows are flat: the user columns (email, first_name, last_name,
+phone_number, password), the profile fields, and at most one insurance in
+columns prefixed with "insurance_" (insurance_provider,
+insurance_policy_number, ...). Insurance providers are given by id or name.
+"""
+from rest_framework import serializers
+
+from accounts.imports import ImportUserSerializer, UserImporter
+from patient_management.models import InsuranceProvider, PatientInsurance, PatientProfile
+from patient_management.serializers import PatientWithUserSerializer
+
+INSURANCE_FIELDS = [
+    'insurance_provider', 'policy_number', 'group_number', 'policy_holder_name',
+    'policy_holder_relation', 'start_date', 'end_date', 'is_primary',
+]
+
+
+def insurance_column(field):
+    return field if field.startswith('insurance_') else f"insurance_{field}"
+
+
+class ImportInsuranceSerializer(serializers.ModelSerializer):
+    # Resolved against the providers loaded once per import
+    insurance_provider = serializers.CharField(help_text="Id or name of the insurance provider")
+
+    class Meta:
+        model = PatientInsurance
+        fields = INSURANCE_FIELDS
+
+
+class PatientImportSerializer(serializers.ModelSerializer):
+    user = ImportUserSerializer()
+    insurances = ImportInsuranceSerializer(many=True, required=False)
+
+    class Meta:
+        model = PatientProfile
+        fields = PatientWithUserSerializer.Meta.fields
+
+
+class PatientImporter(UserImporter):
+    role = 'PATIENT'
+    serializer_class = PatientImportSerializer
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.providers = {}
+        names = {}
+        for pk, name in InsuranceProvider.objects.values_list('id', 'name'):
+            self.providers[str(pk)] = pk
+            names.setdefault(name.casefold(), []).append(pk)
+        # Names shared by several providers must be given by id
+        self.providers.update({name: pks[0] for name, pks in names.items() if len(pks) == 1})
+
+    def from_csv(self, values):
+        insurance = {
+            field: values.pop(insurance_column(field))
+            for field in INSURANCE_FIELDS if insurance_column(field) in values
+        }
+        row = super().from_csv(values)
+        if insurance:
+            row['insurances'] = [insurance]
+        return row
+
+    def check_row(self, row):
+        errors = []
+        for insurance in row.get('insurances', []):
+            provider = insurance['insurance_provider']
+            provider_id = self.providers.get(provider) or self.providers.get(provider.casefold())
+            if provider_id is None:
+                errors.append({'insurance_provider': [f"Unknown insurance provider {provider!r}."]})
+            else:
+                insurance['insurance_provider'] = provider_id
+                errors.append({})
+        if any(errors):
+            return {'insurances': errors}
+        return None
+
+    def create_profiles(self, entries):
+        profiles, insurances = [], []
+        for _, row, user in entries:
+            values = {name: value for name, value in row.items() if name not in ('user', 'insurances')}
+            profile = PatientProfile(user=user, **values)
+            profiles.append(profile)
+            insurances.extend(
+                PatientInsurance(
+                    patient=profile,
+                    insurance_provider_id=insurance['insurance_provider'],
+                    **{name: value for name, value in insurance.items() if name != 'insurance_provider'}
+                )
+                for insurance in row.get('insurances', [])
+            )
+        PatientProfile.objects.bulk_create(profiles)
+        PatientInsurance.objects.bulk_create(insurances)
@@ -0,0 +1,13 @@
+from accounts.imports import ImportCommand
+from patient_management.imports import PatientImporter
+
+
+class Command(ImportCommand):
+    help = (
+        "Create patients in bulk from a CSV or NDJSON file (see patient_management.imports). "
+        "Rows that fail are reported by line and skipped; the others are inserted in chunks of "
+        "IMPORT_BATCH_SIZE, one transaction each. Users without a password are emailed an invite "
+        "by the job workers."
+    )
+    importer_class = PatientImporter
+    noun = 'patients'
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_management', '0002_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientinsurance',
+            index=models.Index(fields=['patient', 'is_primary'], name='patient_man_patient_d2862a_idx'),
+        ),
+    ]
@@ -68,6 +68,11 @@ class PatientInsurance(TimeStampedModel):
     end_date = models.DateField(blank=True, null=True)
     is_primary = models.BooleanField(default=True)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['patient', 'is_primary']),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.email} - {self.insurance_provider.name}"
 
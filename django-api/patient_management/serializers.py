@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from core.serializers import DynamicFieldsModelSerializer
 from django.db import transaction
 from django.contrib.auth import get_user_model
 from patient_management.models import PatientProfile, InsuranceProvider, PatientInsurance
@@ -6,7 +7,7 @@ from accounts.serializers import UserSerializer
 
 User = get_user_model()
 
-class InsuranceProviderSerializer(serializers.ModelSerializer):
+class InsuranceProviderSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for InsuranceProvider model.
     """
@@ -15,7 +16,7 @@ class InsuranceProviderSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'contact_number', 'contact_email']
 
 
-class PatientInsuranceSerializer(serializers.ModelSerializer):
+class PatientInsuranceSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for PatientInsurance model.
     """
@@ -28,9 +29,12 @@ class PatientInsuranceSerializer(serializers.ModelSerializer):
             'policy_number', 'group_number', 'policy_holder_name',
             'policy_holder_relation', 'start_date', 'end_date', 'is_primary'
         ]
+        expandable_fields = {
+            'insurance_provider': InsuranceProviderSerializer,
+        }
 
 
-class PatientProfileSerializer(serializers.ModelSerializer):
+class PatientProfileSerializer(DynamicFieldsModelSerializer):
     """
     Serializer for PatientProfile model.
     """
@@ -48,6 +52,9 @@ class PatientProfileSerializer(serializers.ModelSerializer):
             'current_medications', 'insurances'
         ]
         read_only_fields = ['id', 'user', 'user_email', 'user_full_name', 'insurances']
+        field_dependencies = {
+            'user_full_name': ['user__first_name', 'user__last_name'],
+        }
 
     def get_user_full_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}".strip()
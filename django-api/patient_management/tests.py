@@ -2,8 +2,18 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework import status
 from rest_framework.test import APITestCase
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from core.jobs import Worker
+from core.models import Job
+from patient_management.imports import PatientImporter
 from patient_management.models import PatientProfile, InsuranceProvider, PatientInsurance
 import datetime
+import io
+import json
+import tempfile
 
 User = get_user_model()
 
@@ -313,6 +323,16 @@ class PatientProfileViewSetTests(APITestCase):
         self.assertEqual(response.data['user'], self.patient_user.id)
         self.assertEqual(response.data['blood_type'], 'O+')
 
+    def test_me_endpoint_sparse_fields(self):
+        """
+        Ensure ?fields= trims the profile and skips the insurances query
+        """
+        self.client.force_authenticate(user=self.patient_user)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.me_url, {'fields': 'id,blood_type'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'blood_type'})
+
     def test_me_endpoint_as_non_patient(self):
         """
         Ensure non-patient users cannot use the 'me' endpoint
@@ -700,4 +720,99 @@ class PatientInsuranceViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
         # Check that no insurances remain
-        self.assertEqual(self.patient_profile.insurances.count(), 0)
\ No newline at end of file
+        self.assertEqual(self.patient_profile.insurances.count(), 0)
+
+@override_settings(IMPORT_HASHING_WORKERS=0)
+class PatientImportTests(APITestCase):
+    """
+    Test case for the bulk patient import
+    """
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            email='admin@example.com', password='admin123', is_staff=True
+        )
+        User.objects.create_user(email='taken@example.com', password='user123')
+        self.insurance_provider = InsuranceProvider.objects.create(name='Test Insurance')
+        self.url = reverse('patientprofile-import-patients')
+
+    def csv_file(self):
+        rows = [
+            'email,first_name,last_name,password,blood_type,date_of_birth,insurance_provider,'
+            'insurance_policy_number,insurance_policy_holder_name,insurance_start_date',
+            'ann@example.com,Ann,Lee,s3cret-pass,A+,1980-01-31,test insurance,P-1,Ann Lee,2024-01-01',
+            'bob@example.com,Bob,Ray,,O-,,,,,',
+            'taken@example.com,Tim,Ken,,,,,,,',
+            'bad@example.com,Bad,Row,,Z+,not-a-date,,,,',
+            'ann@example.com,Ann,Again,,,,,,,',
+            'eve@example.com,Eve,Hill,,,,Unknown Insurance,P-2,Eve Hill,2024-01-01',
+        ]
+        return SimpleUploadedFile('patients.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+    def test_import_csv(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(self.url, {'file': self.csv_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'failed')},
+            {'rows': 6, 'created': 2, 'failed': 4},
+        )
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6, 7])
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'blood_type', 'date_of_birth'})
+
+        ann = PatientProfile.objects.get(user__email='ann@example.com')
+        self.assertEqual((ann.blood_type, ann.date_of_birth), ('A+', datetime.date(1980, 1, 31)))
+        self.assertTrue(ann.user.check_password('s3cret-pass'))
+        self.assertEqual(ann.user.role, 'PATIENT')
+        insurance = ann.insurances.get()
+        self.assertEqual((insurance.insurance_provider, insurance.policy_number), (self.insurance_provider, 'P-1'))
+
+        # Bob chooses his password through the invite
+        bob = User.objects.get(email='bob@example.com')
+        self.assertFalse(bob.has_usable_password())
+        self.assertEqual(Worker(['email']).run_pending(), 1)
+        self.assertEqual(mail.outbox[0].to, ['bob@example.com'])
+        self.assertIn('/reset-password/', mail.outbox[0].body)
+
+    def test_import_requires_admin(self):
+        patient = User.objects.get(email='taken@example.com')
+        self.client.force_authenticate(user=patient)
+        response = self.client.post(self.url, {'file': self.csv_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_ndjson_command_in_chunks(self):
+        lines = [
+            json.dumps({
+                'user': {'email': f'patient{number}@example.com', 'first_name': 'P', 'last_name': str(number)},
+                'insurances': [{
+                    'insurance_provider': str(self.insurance_provider.id), 'policy_number': str(number),
+                    'policy_holder_name': 'P', 'start_date': '2024-01-01',
+                }],
+            })
+            for number in range(5)
+        ]
+        lines.insert(2, '{not json')
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as ndjson_file:
+            ndjson_file.write('\n'.join(lines))
+            ndjson_file.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command(
+                'import_patients', ndjson_file.name, '--batch-size', '2', '--no-invites', stdout=out, stderr=err
+            )
+
+        self.assertIn('Imported 5 of 6 patients (1 failed).', out.getvalue())
+        self.assertIn('Line 3: ', err.getvalue())
+        self.assertIn('6 rows read: 5 created, 1 failed', err.getvalue())
+        self.assertEqual(PatientInsurance.objects.filter(patient__user__email__startswith='patient').count(), 5)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(IMPORT_HASHING_WORKERS=1)
+    def test_passwords_hashed_in_process_pool(self):
+        with override_settings(PASSWORD_HASHERS=['accounts.hashers.PBKDF2PasswordHasher'], PASSWORD_PBKDF2_ITERATIONS=1000):
+            report = PatientImporter().run(io.StringIO(
+                'email,first_name,last_name,password\n'
+                'pool@example.com,Pool,User,pool-password\n'
+            ), 'csv')
+            self.assertEqual(report.created, 1)
+            user = User.objects.get(email='pool@example.com')
+            self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+            self.assertTrue(user.check_password('pool-password'))
@@ -1,6 +1,9 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from patient_management.models import PatientProfile, InsuranceProvider, PatientInsurance
@@ -9,13 +12,17 @@ from patient_management.serializers import (
     InsuranceProviderSerializer, PatientInsuranceSerializer,
     PatientInsuranceCreateUpdateSerializer
 )
+from accounts.imports import import_upload
 from accounts.permissions import IsAdminUser, IsPatient
+from patient_management.imports import PatientImporter
+from core.views import SparseFieldsetMixin, VersionedCacheMixin
 
-class InsuranceProviderViewSet(viewsets.ModelViewSet):
+class InsuranceProviderViewSet(VersionedCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing insurance providers.
     """
     queryset = InsuranceProvider.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2}
     serializer_class = InsuranceProviderSerializer
 
     def get_permissions(self):
@@ -30,11 +37,12 @@ class InsuranceProviderViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class PatientProfileViewSet(viewsets.ModelViewSet):
+class PatientProfileViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing patient profiles.
     """
     queryset = PatientProfile.objects.all()
+    query_budgets = {'list': 4, 'retrieve': 4, 'me': 4}
 
     def get_serializer_class(self):
         """
@@ -52,7 +60,7 @@ class PatientProfileViewSet(viewsets.ModelViewSet):
         """
         if self.action == 'create':
             permission_classes = [permissions.AllowAny]
-        elif self.action in ['list']:
+        elif self.action in ['list', 'import_patients']:
             permission_classes = [IsAdminUser]
         else:
             permission_classes = [permissions.IsAuthenticated]
@@ -79,8 +87,8 @@ class PatientProfileViewSet(viewsets.ModelViewSet):
         """
         API endpoint for getting the current user's patient profile.
         """
-        patient = get_object_or_404(PatientProfile, user=request.user)
-        serializer = PatientProfileSerializer(patient)
+        patient = get_object_or_404(self.optimize_queryset(PatientProfile.objects.all()), user=request.user)
+        serializer = self.get_serializer(patient)
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
@@ -133,12 +141,31 @@ class PatientProfileViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_patients(self, request):
+        """
+        API endpoint for creating patients in bulk from an uploaded CSV or
+        NDJSON `file` (see patient_management.imports). Rows that fail are
+        reported by line and skipped.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ParseError("Upload the patients to import as `file`.")
+
+        importer = PatientImporter(send_invites=request.data.get('send_invites', 'true').lower() != 'false')
+        try:
+            report = import_upload(importer, upload, request.data.get('format'))
+        except ValueError as exc:
+            raise ValidationError({'format': [str(exc)]})
+        return Response(report.as_dict(settings.IMPORT_MAX_REPORTED_ERRORS))
+
 
-class PatientInsuranceViewSet(viewsets.ModelViewSet):
+class PatientInsuranceViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing patient insurance records.
     """
     queryset = PatientInsurance.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2}
     serializer_class = PatientInsuranceSerializer
 
     def get_permissions(self):